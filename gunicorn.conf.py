@@ -0,0 +1,32 @@
+# gunicorn.conf.py
+# Read automatically by `gunicorn sahel_api.asgi:application` (see render.yaml).
+#
+# ⚡ Workers: uvicorn workers run the ASGI app, so a slow Google Sheets call
+# or audio download waits without blocking the whole worker
+# "Like a waiter taking other orders while the kitchen cooks."
+# GUNICORN_WORKER_CLASS=sync (with sahel_api.wsgi:application) brings back
+# the old sync workers.
+#
+# 📊 Prometheus: each worker writes its metrics to files in
+# PROMETHEUS_MULTIPROC_DIR, and /metrics adds them all up
+# "Like every cashier writing on the same tally sheet."
+
+import os
+import shutil
+
+# Must be set before the workers import the app (and prometheus_client)
+multiproc_dir = os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", "/tmp/sahel-prometheus")
+
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "uvicorn_worker.UvicornWorker")
+
+
+def on_starting(server):
+    # Numbers from a previous run would be added to the new ones: start clean
+    shutil.rmtree(multiproc_dir, ignore_errors=True)
+    os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    # A worker that stops: its live gauges must not count anymore
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -7,9 +7,11 @@ Pour plus d'informations sur ce fichier, voir
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
-# Fichier : sahel_api/wsgi.py
-# Ce fichier est comme la "salle des machines" de ton site web Django.
-# Il explique au serveur web (comme Apache ou Gunicorn) comment demarrer Django.
+# Fichier : sahel_api/asgi.py
+# Ce fichier est comme la "salle des machines" de ton site web Django, version ASGI.
+# Un serveur ASGI (uvicorn, lance par gunicorn : voir gunicorn.conf.py) peut
+# servir beaucoup de requetes a la fois dans un seul processus : pendant
+# qu'une vue async attend la base de donnees, les autres avancent.
 
 import os  # Pour parler au systeme d'exploitation
 from pathlib import Path  # Pour trouver des chemins de dossiers
@@ -27,6 +29,6 @@ if env_path.exists():
 # On dit a Django ou trouver le fichier de parametres (settings)
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "sahel_api.settings")
 
-# On demarre l'application WSGI pour que le serveur puisse lancer notre site
-from django.core.wsgi import get_wsgi_application  # On importe apres avoir prepare les parametres
-application = get_wsgi_application()  # On cree l'application que le serveur utilisera
\ No newline at end of file
+# On demarre l'application ASGI pour que le serveur puisse lancer notre site
+from django.core.asgi import get_asgi_application  # On importe apres avoir prepare les parametres
+application = get_asgi_application()  # On cree l'application que le serveur utilisera
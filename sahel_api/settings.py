@@ -93,6 +93,8 @@ LANGUAGES = [
 # 🚦 MIDDLEWARE: Security guards that check every visitor
 # "Like bouncers at a club — they check IDs, stop bad requests, etc."
 MIDDLEWARE = [
+    'stories.middleware.RequestTimingMiddleware',              # Times SQL/view/render (only if enabled)
+    'stories.middleware.MetricsMiddleware',                    # Feeds the /metrics histograms
     'django.middleware.security.SecurityMiddleware',           # Adds security headers
     'django.contrib.sessions.middleware.SessionMiddleware',    # Tracks logged-in users
     'django.middleware.common.CommonMiddleware',               # Handles common web rules
@@ -100,10 +102,26 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware', # Checks login status
     'django.contrib.messages.middleware.MessageMiddleware',    # Enables messages
     'django.middleware.clickjacking.XFrameOptionsMiddleware',  # Stops clickjacking
-    'whitenoise.middleware.WhiteNoiseMiddleware',              # Serves static files fast
+    'stories.middleware.StaticFilesMiddleware',                # Serves static files fast (WhiteNoise, ASGI-ready)
     'django.middleware.locale.LocaleMiddleware', 
 ]
 
+# ⏱️ REQUEST TIMING: A stopwatch on every request (stories/middleware.py)
+# "Like a coach timing each lap: how long in the database, in the view, in the drawing."
+# Adds a `Server-Timing` header and logs slow requests with their most repeated SQL
+REQUEST_TIMING_ENABLED = os.getenv("REQUEST_TIMING_ENABLED", "False") == "True"  # Off = no cost at all
+REQUEST_TIMING_SLOW_MS = int(os.getenv("REQUEST_TIMING_SLOW_MS", "500"))  # Log requests slower than this
+REQUEST_TIMING_TOP_QUERIES = 5  # Repeated SQL statements shown in a slow-request log
+
+# 📊 METRICS: Numbers for Prometheus at /metrics (stories/metrics.py)
+# "Like the dashboard of a car: speed, fuel, distance — read at a glance."
+# With gunicorn, PROMETHEUS_MULTIPROC_DIR (set in gunicorn.conf.py) lets all workers add up
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "True") == "True"
+# Who may read /metrics: the scraper sends "Authorization: Bearer <METRICS_TOKEN>"
+# (not an IP list: behind Render's proxy every request comes from the proxy).
+# Empty = /metrics answers 403 to everybody
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
 
 # 📦 STATICFILES_STORAGE: How to store CSS, JS, images
 #  "This makes your website load faster by compressing files."
@@ -145,9 +163,71 @@ WSGI_APPLICATION = "sahel_api.wsgi.application"
 # 🗄️ DATABASES: Where your data is stored
 # "This is your website's memory — where stories and trees are saved."
 # Uses DATABASE_URL from Render (PostgreSQL)
+#
+# 🔌 Connection reuse: opening a PostgreSQL connection (TLS + password) costs
+# more than most of our queries
+# "Keep the phone line open instead of dialing again for every sentence."
+# - DB_CONN_MAX_AGE: seconds a worker keeps its connection (0 = new one per
+#   request, the default). Only for sync (WSGI) workers: under ASGI each
+#   request may run in a different thread, and every thread would keep its own
+#   connection open until the database runs out of them
+# - DB_POOL=True: a shared psycopg pool per worker instead (needs psycopg 3,
+#   replaces DB_CONN_MAX_AGE). Use it with the ASGI workers (render.yaml does)
+# - DB_CONN_HEALTH_CHECKS: check a kept connection still works before using it
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", "0"))
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True"
+DB_POOL = os.getenv("DB_POOL", "False") == "True"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))    # Connections always open
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))   # Never more than this per worker
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))   # Seconds to wait for a free connection
+# - DB_STATEMENT_TIMEOUT: PostgreSQL stops any statement, and any transaction
+#   left idle, after this many seconds. 0 = no limit, the default, so
+#   migrations and rebuild commands can take their time. render.yaml sets it
+#   for the web service only. Field sync counts on it (SYNC_SETTLE_SECONDS)
+DB_STATEMENT_TIMEOUT = int(os.getenv("DB_STATEMENT_TIMEOUT", "0"))
+
 DATABASES = {
-    'default': dj_database_url.config(default=os.getenv('DATABASE_URL'))
+    'default': dj_database_url.config(
+        default=os.getenv('DATABASE_URL'),
+        conn_max_age=DB_CONN_MAX_AGE,
+        conn_health_checks=DB_CONN_HEALTH_CHECKS,
+    )
 }
+if DB_POOL and DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    # With DB_CONN_HEALTH_CHECKS, Django asks the pool to check each connection it hands out
+    DATABASES['default']['CONN_MAX_AGE'] = 0  # The pool keeps the connections (Django refuses both)
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': DB_POOL_MIN_SIZE,
+        'max_size': DB_POOL_MAX_SIZE,
+        'timeout': DB_POOL_TIMEOUT,
+    }
+if DB_STATEMENT_TIMEOUT and DATABASES['default'].get('ENGINE') == 'django.db.backends.postgresql':
+    DATABASES['default'].setdefault('OPTIONS', {})['options'] = (
+        f"-c statement_timeout={DB_STATEMENT_TIMEOUT * 1000}"
+        f" -c idle_in_transaction_session_timeout={DB_STATEMENT_TIMEOUT * 1000}"
+    )
+
+
+# 🧠 CACHES: A memory shared by every worker
+# "If one worker learns something (or forgets it), the others know it too."
+# Page caches, map caches, view counts, throttling buckets and locks all live
+# here. Set REDIS_URL (Render Key Value, see render.yaml) so every gunicorn
+# worker and every `manage.py` command share it. Without it each process keeps
+# its own private memory: fine for one process on your computer, but a change
+# seen by one worker is not seen by the others
+REDIS_URL = os.getenv("REDIS_URL", "")
+SHARED_CACHE = bool(REDIS_URL)
+if SHARED_CACHE:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    }
 
 
 # 🔐 AUTH_PASSWORD_VALIDATORS: Rules to keep passwords strong
@@ -191,10 +271,143 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # Proxies in front of the app that we trust to add the client address to
+    # X-Forwarded-For (Render: 1, see render.yaml). The client IP is the entry
+    # the last trusted proxy added; anything the client wrote before it is
+    # ignored. 0 = no proxy, REMOTE_ADDR is the client
+    'NUM_PROXIES': int(os.getenv("NUM_PROXIES", "0")),
 }
 
 
+# 👀 VIEW COUNTER: How story views are counted
+# "Instead of writing in the big book on every visit, we make tally marks
+#  on a notepad and copy the totals into the book every few seconds."
+# "memory" = notepad per worker, "cache" = notepad shared through the Django cache
+# (only shared with Redis: without REDIS_URL it is per worker too)
+# ⚠️ A per-worker notepad is lost when its worker is killed (crash, out of
+# memory, SIGKILL): up to VIEW_COUNTER_FLUSH_INTERVAL seconds of views. A clean
+# shutdown still writes it
+VIEW_COUNTER_BACKEND = os.getenv("VIEW_COUNTER_BACKEND", "memory")
+# Seconds between two batched writes (0 = only with `manage.py flush_views`,
+# which needs the shared notepad)
+VIEW_COUNTER_FLUSH_INTERVAL = int(os.getenv("VIEW_COUNTER_FLUSH_INTERVAL", "10"))
+
+
+# 🚦 THROTTLING: How fast one visitor may write (stories/throttling.py)
+# "Like a jar of sweets that refills slowly: take a few at once if you like,
+#  but once it's empty you have to wait for the next one."
+# Buckets per IP, per session and per story. The IP comes from NUM_PROXIES
+# (REST_FRAMEWORK above): a visitor can't get a fresh jar by sending a made-up
+# X-Forwarded-For. They need the shared cache
+# (REDIS_URL) so every worker sees the same jars: without it each worker has
+# its own, and `manage.py check` warns (stories.W001)
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "True") == "True"
+THROTTLE_BUCKETS = {
+    "plant_tree": {  # The "Plant a tree" button (anyone, even guests)
+        "ip": {"rate": "60/hour", "burst": 10},
+        "session": {"rate": "20/hour", "burst": 5},
+        "story": {"rate": "600/hour", "burst": 60},
+    },
+    "api_write": {  # API writes: new stories, audio uploads, field sync
+        "ip": {"rate": "600/hour", "burst": 60},
+        "session": {"rate": "300/hour", "burst": 30},
+    },
+}
+
+
+# 🌱 BULK STATUS CHANGES: Most trees one coordinator request may change
+BULK_TRANSITION_MAX = 5000
+
+# 📲 FIELD SYNC: Phones that plant trees offline send them all at once
+# "Like handing in a whole notebook when you're back in town."
+SYNC_MAX_RECORDS = 1000   # Plantings per sync request
+# A planting's updated_at is stamped by the web server's clock BEFORE its
+# transaction commits, so a pull can see a newer change before an older one.
+# Changes younger than SYNC_SETTLE_SECONDS wait for the next pull. A write
+# stamps updated_at, runs its UPDATE/INSERT, then a few small statements (stats,
+# outbox) before COMMIT. With DB_STATEMENT_TIMEOUT each step is capped, so two
+# of them plus one second of clock drift between servers covers it. Without
+# it, 30 seconds is only a generous guess.
+# Trade-off: devices see a change that much later. A transaction that escapes
+# the timeouts (a manual shell session) can still be missed: a pull without
+# watermark sends everything again.
+SYNC_SETTLE_SECONDS = 2 * DB_STATEMENT_TIMEOUT + 1 if DB_STATEMENT_TIMEOUT else 30
+
+
+# 🔥 TRENDING: Which stories are popular right now (`manage.py compute_trending`)
+# "Like a campfire: new sticks make it blaze, old ones slowly burn out."
+TRENDING_HALF_LIFE_HOURS = 24        # A view, tree or comment is worth half as much a day later
+TRENDING_WEIGHTS = {"views": 1, "trees": 5, "comments": 3}
+TRENDING_SETTLE_SECONDS = 5          # Activity younger than this waits for the next pass
+TRENDING_DEFAULT_LIMIT = 10          # Stories returned by /api/stories/trending/
+TRENDING_MAX_LIMIT = 50
+
+
+# 🗂️ PAGE CACHE: Ready-made HTML for the story pages
+# "Like keeping photocopies of a page instead of rewriting it for every reader."
+# Pages are thrown away as soon as a story, artisan, tree or comment changes.
+# That only reaches every worker with a shared cache (REDIS_URL): without one
+# the page cache is off by default, or other workers would serve stale pages
+PAGE_CACHE_TIMEOUT = int(os.getenv("PAGE_CACHE_TIMEOUT", "300" if SHARED_CACHE else "0"))  # Seconds (0 = off)
+
+
+# 🎙️ AUDIO UPLOADS: Story recordings sent in small pieces
+# "Like sending a long letter one page at a time — if the post is lost,
+#  you only send the missing pages again."
+# Pieces wait on disk here (outside MEDIA_ROOT) until the whole file has arrived
+#
+# ⚠️ Development only for now: the pieces sit on the web server's own disk and
+# `manage.py transcode_audio` (with ffmpeg) must run on that same machine.
+# The Render deployment has neither: its disk is wiped on every deploy, no
+# worker runs the transcoder and there is no ffmpeg. So uploads are off
+# unless DEBUG; turn them on (AUDIO_UPLOADS_ENABLED=True) only where a
+# transcode worker shares AUDIO_UPLOAD_DIR and MEDIA_ROOT with the web server
+AUDIO_UPLOADS_ENABLED = os.getenv("AUDIO_UPLOADS_ENABLED", str(DEBUG)) == "True"
+AUDIO_UPLOAD_DIR = os.getenv("AUDIO_UPLOAD_DIR", str(BASE_DIR / "tmp" / "audio_uploads"))
+AUDIO_UPLOAD_MAX_SIZE = int(os.getenv("AUDIO_UPLOAD_MAX_SIZE", str(200 * 1024 * 1024)))  # Whole file
+AUDIO_UPLOAD_CHUNK_MAX_SIZE = int(os.getenv("AUDIO_UPLOAD_CHUNK_MAX_SIZE", str(8 * 1024 * 1024)))  # One piece
+AUDIO_UPLOAD_EXPIRY_HOURS = 48  # Unfinished uploads are removed after two days
+# `python manage.py transcode_audio` turns finished uploads into small Opus files
+FFMPEG_BINARY = os.getenv("FFMPEG_BINARY", "ffmpeg")
+FFPROBE_BINARY = os.getenv("FFPROBE_BINARY", "ffprobe")
+AUDIO_TRANSCODE_BITRATE = os.getenv("AUDIO_TRANSCODE_BITRATE", "24k")  # Clear voice, tiny file
+AUDIO_PROCESSING_TIMEOUT_MINUTES = 60  # A transcode still "running" after this: its worker died, try again
+# Listening: recordings are sent in pieces ("Range" requests) by /stories/<id>/audio/
+AUDIO_STREAM_MAX_RANGE = 1024 * 1024  # At most 1 MB per open-ended request
+AUDIO_CACHE_MAX_AGE = 86400           # Browsers may keep pieces for a day
+# "" = Django sends the bytes; "x-accel-redirect" (nginx) or "x-sendfile" (Apache)
+# = Django only checks the request and the proxy sends the file
+AUDIO_SENDFILE = os.getenv("AUDIO_SENDFILE", "")
+AUDIO_ACCEL_REDIRECT_PREFIX = os.getenv("AUDIO_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+
+
 # 🌳 GOOGLE SHEETS (Optional)
 #"If you want to save tree plantings to a Google Sheet, set this up!"
-# Disabled for now — can be added later with environment variables
-# GOOGLE_SHEETS_NAME = os.getenv("GOOGLE_SHEETS_NAME", "Sahel Tree Planting")
\ No newline at end of file
+# Plantings are queued in an outbox and sent by `python manage.py sync_sheets`
+# Off by default: nothing is queued and the Google libraries are never loaded
+SHEETS_SYNC_ENABLED = os.getenv("SHEETS_SYNC_ENABLED", "False") == "True"
+GOOGLE_SHEETS_NAME = os.getenv("GOOGLE_SHEETS_NAME", "Sahel Tree Planting")
+GOOGLE_SHEETS_CREDS = os.getenv("GOOGLE_SHEETS_CREDS", str(BASE_DIR / "credentials.json"))
+# Where rows go: the real sheet, or "stories.google_sheets.FakeSheetSink" for tests
+SHEETS_SINK = os.getenv("SHEETS_SINK", "stories.google_sheets.GoogleSheetSink")
+SHEETS_SYNC_BATCH_SIZE = int(os.getenv("SHEETS_SYNC_BATCH_SIZE", "100"))  # Rows per append_rows call
+SHEETS_SYNC_RETRY_BASE = 30    # Seconds to wait after a first failure (then doubled)
+SHEETS_SYNC_RETRY_MAX = 3600   # Never wait more than one hour between retries
+SHEETS_SYNC_LEASE = 300        # Seconds a claimed batch is hidden from other workers while it is sent
+
+
+# 🧩 INTEGRATIONS: optional services that receive our data
+# "Extra helpers stay home until we call them. Then they come right away!"
+# Each one is imported only the first time it is used (stories/integrations.py),
+# so web workers start fast
+INTEGRATIONS = {
+    "google_sheets": {"ENABLED": SHEETS_SYNC_ENABLED, "BACKEND": SHEETS_SINK},
+}
+# `python manage.py importtime` fails above these worker boot costs (the tests
+# only check the module count: a time limit would make them flaky).
+# Measured baseline (Python 3.11, requirements.txt, 2026-10): 960 modules and
+# about 750 ms for both the ASGI and the WSGI worker.
+# - Modules: baseline + 15% (a new heavy dependency shows up, a new view doesn't)
+# - Time: baseline x 2, because it depends on the machine (slow CI, cold disk)
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "1500"))
+IMPORT_BUDGET_MODULES = int(os.getenv("IMPORT_BUDGET_MODULES", "1100"))
@@ -15,6 +15,8 @@ from django.http import HttpResponse
 from django.conf import settings
 from django.conf.urls.static import static
 
+from stories.views import metrics
+
 
 # 🏠 Homepage view
 def home(request):
@@ -36,6 +38,9 @@ urlpatterns = [
 
     # API endpoints
     path('api/', include('stories.urls_api')),       # REST API (e.g., /api/stories/, /api/plant/)
+
+    # Monitoring
+    path('metrics', metrics, name='metrics'),         # Prometheus scrape target
 ]
 
 # 🔧 Serve static and media files during development only
@@ -2,7 +2,7 @@
 # Ce fichier controle comment nos modeles apparaissent dans le panneau d'administration Django
 
 from django.contrib import admin  # On importe les outils d'administration
-from .models import Artisan, Story, TreePlanting, Category, Tag  # On importe nos modeles
+from .models import Artisan, Story, TreePlanting, Category, Tag, SheetOutbox, AudioUpload  # On importe nos modeles
 
 # -------------------------------------------------------------------
 # Administration des Artisans
@@ -44,6 +44,30 @@ class TreePlantingAdmin(admin.ModelAdmin):
     # Champs qui se remplissent automatiquement
     readonly_fields = ('planted_at', 'actually_planted_at')
 
+# -------------------------------------------------------------------
+# Boite d'envoi vers Google Sheets
+# -------------------------------------------------------------------
+@admin.register(SheetOutbox)
+class SheetOutboxAdmin(admin.ModelAdmin):
+    # Colonnes a afficher pour suivre les envois
+    list_display = ('id', 'tree', 'attempts', 'next_attempt_at', 'sent_at')
+    # Filtres disponibles
+    list_filter = ('sent_at',)
+    # Les lignes sont gerees par le worker, pas a la main
+    readonly_fields = ('tree', 'row', 'created_at', 'attempts', 'sent_at', 'last_error')
+
+# -------------------------------------------------------------------
+# Envois audio par morceaux
+# -------------------------------------------------------------------
+@admin.register(AudioUpload)
+class AudioUploadAdmin(admin.ModelAdmin):
+    # Colonnes a afficher pour suivre les envois et les transcodages
+    list_display = ('filename', 'story', 'uploaded_by', 'offset', 'size', 'status', 'updated_at')
+    # Filtres disponibles
+    list_filter = ('status',)
+    # Les envois sont geres par l'API et le worker, pas a la main
+    readonly_fields = ('story', 'uploaded_by', 'filename', 'size', 'sha256', 'offset', 'error', 'created_at')
+
 # -------------------------------------------------------------------
 # Administration des Categories et Tags
 # -------------------------------------------------------------------
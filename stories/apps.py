@@ -9,4 +9,10 @@ class StoriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     
     # Le nom de l'application (doit correspondre au nom du dossier)
-    name = 'stories'
\ No newline at end of file
+    name = 'stories'
+
+    def ready(self):
+        # On branche les signaux (mise a jour des caches quand les modeles changent)
+        from . import signals  # noqa: F401
+        # Et les verifications de `manage.py check` (cache des limites d'ecriture)
+        from . import checks  # noqa: F401
@@ -0,0 +1,21 @@
+# Fichier : stories/checks.py
+# Les verifications de `manage.py check` propres a l'application.
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+from stories import throttling
+
+
+@register(Tags.caches)
+def check_throttle_cache(app_configs, **kwargs):
+    # En developpement (un seul processus), le cache memoire suffit
+    if settings.DEBUG or not getattr(settings, 'THROTTLE_ENABLED', True):
+        return []
+    if throttling.shared_cache():
+        return []
+    return [Warning(
+        "Les limites d'ecriture (THROTTLE_BUCKETS) utilisent un cache propre a chaque processus.",
+        hint="Reglez REDIS_URL pour un cache partage, sinon chaque worker a ses propres seaux.",
+        id='stories.W001',
+    )]
@@ -0,0 +1,111 @@
+# Fichier : stories/conditional.py
+# "GET conditionnel" pour l'API : repondre 304 (Not Modified) sans refaire le JSON.
+#
+# Chaque histoire et chaque evenement a un champ `updated_at` mis a jour a
+# chaque changement, y compris des donnees liees montrees dans son JSON
+# (commentaires, artisan, nombre d'histoires publiees de l'artisan : voir
+# stories/signals.py). Avant de lancer le serializer, on lit seulement cette
+# "version" (une petite requete) et on la compare a ce que le client a deja
+# (`If-None-Match` / `If-Modified-Since`). Si rien n'a change : 304, corps vide.
+#
+# `alist` / `aretrieve` font la meme chose pour les vues async (adrf), avec
+# l'ORM async.
+
+import hashlib
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    """Un ETag fort calcule a partir de valeurs simples (ids, dates, compteurs)."""
+    return '"%s"' % hashlib.md5(repr(parts).encode()).hexdigest()
+
+
+class ConditionalGetMixin:
+    """
+    A melanger avec ListAPIView / RetrieveAPIView.
+
+    - detail : la version est `updated_at` de l'objet demande ;
+    - liste : la version est le plus grand `updated_at` de la liste filtree,
+      avec le nombre d'elements (pour voir aussi les suppressions).
+    """
+
+    # True si le contenu depend de l'utilisateur (ex : "deja inscrit ?")
+    vary_on_user = False
+
+    def get_version_queryset(self):
+        """Les objets dont on lit la version ; sans annotations couteuses de preference."""
+        return self.get_queryset()
+
+    def _user_part(self):
+        return self.request.user.pk if self.vary_on_user else None
+
+    def _not_modified(self, request, etag, last_modified):
+        """La reponse 304 si le client a deja cette version, sinon None."""
+        timestamp = last_modified.timestamp() if last_modified else None
+        return get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+    def _add_validators(self, response, etag, last_modified):
+        timestamp = last_modified.timestamp() if last_modified else None
+        if response.status_code in (200, 304):
+            response['ETag'] = etag
+            if timestamp is not None:
+                response['Last-Modified'] = http_date(timestamp)
+            if self.vary_on_user:
+                patch_vary_headers(response, ['Cookie', 'Authorization'])
+        return response
+
+    def _list_version(self, request, version):
+        return make_etag(request.get_full_path(), version['last'], version['total'], self._user_part())
+
+    def _object_version(self):
+        """(valeur cherchee, queryset de son `updated_at`) pour l'objet demande."""
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        lookup = self.kwargs[lookup_url_kwarg]
+        versions = (
+            self.get_version_queryset()
+            .filter(**{self.lookup_field: lookup})
+            .values_list('updated_at', flat=True)
+        )
+        return lookup, versions
+
+    def list(self, request, *args, **kwargs):
+        version = self.get_version_queryset().aggregate(last=Max('updated_at'), total=Count('pk'))
+        etag = self._list_version(request, version)
+        response = self._not_modified(request, etag, version['last'])
+        if response is None:
+            response = super().list(request, *args, **kwargs)
+        return self._add_validators(response, etag, version['last'])
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup, versions = self._object_version()
+        updated_at = versions.first()
+        if updated_at is None:
+            # Objet introuvable : la vue normale renverra le 404
+            return super().retrieve(request, *args, **kwargs)
+        etag = make_etag(lookup, updated_at, self._user_part())
+        response = self._not_modified(request, etag, updated_at)
+        if response is None:
+            response = super().retrieve(request, *args, **kwargs)
+        return self._add_validators(response, etag, updated_at)
+
+    async def alist(self, request, *args, **kwargs):
+        version = await self.get_version_queryset().aaggregate(last=Max('updated_at'), total=Count('pk'))
+        etag = self._list_version(request, version)
+        response = self._not_modified(request, etag, version['last'])
+        if response is None:
+            response = await super().alist(request, *args, **kwargs)
+        return self._add_validators(response, etag, version['last'])
+
+    async def aretrieve(self, request, *args, **kwargs):
+        lookup, versions = self._object_version()
+        updated_at = await versions.afirst()
+        if updated_at is None:
+            return await super().aretrieve(request, *args, **kwargs)
+        etag = make_etag(lookup, updated_at, self._user_part())
+        response = self._not_modified(request, etag, updated_at)
+        if response is None:
+            response = await super().aretrieve(request, *args, **kwargs)
+        return self._add_validators(response, etag, updated_at)
@@ -0,0 +1,192 @@
+# Fichier : stories/geohash.py
+# Petit module "geohash" en Python pur (sans PostGIS).
+#
+# Un geohash decoupe la Terre en cases et donne a chaque case un code texte.
+# Plus le code est long, plus la case est petite, et toutes les petites cases
+# d'une grande case commencent par le meme prefixe. Trier les codes range donc
+# les points proches les uns pres des autres : une recherche "autour d'ici"
+# devient quelques lectures d'intervalles sur un index texte ordinaire.
+
+import math
+
+# L'alphabet des geohash (sans a, i, l, o), deja dans l'ordre ASCII
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+MAX_PRECISION = 12
+
+# Rayon moyen de la Terre, en kilometres
+EARTH_RADIUS_KM = 6371.0088
+# Longueur d'un degre de latitude, en kilometres
+KM_PER_DEGREE = 111.32
+
+
+def _finite(*values):
+    """Les valeurs en float ; ValueError si l'une d'elles est NaN ou infinie."""
+    values = [float(value) for value in values]
+    if not all(math.isfinite(value) for value in values):
+        raise ValueError("Coordonnees non finies (NaN ou infini).")
+    return values
+
+
+def normalize_bbox(west, south, east, north):
+    """
+    Le rectangle ramene dans les limites de la Terre (longitude -180..180,
+    latitude -90..90). ValueError si une valeur n'est pas finie ou si le
+    rectangle est a l'envers (ouest > est ou sud > nord).
+    """
+    west, south, east, north = _finite(west, south, east, north)
+    if west > east or south > north:
+        raise ValueError("Il faut ouest <= est et sud <= nord.")
+    return (
+        min(max(west, -180.0), 180.0),
+        min(max(south, -90.0), 90.0),
+        min(max(east, -180.0), 180.0),
+        min(max(north, -90.0), 90.0),
+    )
+
+
+def encode(latitude, longitude, precision=MAX_PRECISION):
+    """Retourne le geohash d'un point, avec `precision` caracteres."""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude, longitude = _finite(latitude, longitude)
+    code = []
+    bits = 0
+    bit_count = 0
+    even = True  # Les bits alternent : longitude, latitude, longitude...
+    while len(code) < precision:
+        if even:
+            middle = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= middle:
+                bits = bits * 2 + 1
+                lon_range[0] = middle
+            else:
+                bits = bits * 2
+                lon_range[1] = middle
+        else:
+            middle = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= middle:
+                bits = bits * 2 + 1
+                lat_range[0] = middle
+            else:
+                bits = bits * 2
+                lat_range[1] = middle
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            code.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(code)
+
+
+def cell_size(precision):
+    """Retourne (largeur en longitude, hauteur en latitude) d'une case, en degres."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 360.0 / 2 ** lon_bits, 180.0 / 2 ** lat_bits
+
+
+def prefix_upper_bound(prefix):
+    """
+    Le plus petit code plus grand que tous les codes qui commencent par `prefix`.
+
+    Par exemple "s1" -> "s2" et "sz" -> "t". Retourne None s'il n'y en a pas ("zz").
+    """
+    chars = list(prefix)
+    while chars:
+        position = BASE32.index(chars[-1])
+        if position + 1 < len(BASE32):
+            chars[-1] = BASE32[position + 1]
+            return ''.join(chars)
+        chars.pop()  # "z" : on retient sur le caractere precedent
+    return None
+
+
+def _steps(start, stop, step):
+    """Des valeurs de start a stop, espacees de `step`, en incluant toujours stop."""
+    count = int(math.floor((stop - start) / step))
+    return [start + i * step for i in range(count + 1)] + [stop]
+
+
+def covering_prefixes(west, south, east, north, max_cells=16):
+    """
+    Les prefixes geohash des cases qui couvrent le rectangle donne.
+
+    On choisit la precision la plus fine qui donne au plus `max_cells` cases ;
+    si aucune ne convient, la plus grossiere (32 cases pour toute la Terre).
+    Le rectangle est d'abord ramene dans les limites de la Terre : le nombre
+    de cases parcourues reste borne, quoi que demande l'appelant. Il ne doit
+    pas traverser l'antimeridien (longitude 180).
+    """
+    west, south, east, north = normalize_bbox(west, south, east, north)
+    precision = 1
+    for candidate in range(MAX_PRECISION, 0, -1):
+        width, height = cell_size(candidate)
+        columns = math.floor((east - west) / width) + 2
+        rows = math.floor((north - south) / height) + 2
+        if columns * rows <= max_cells:
+            precision = candidate
+            break
+
+    width, height = cell_size(precision)
+    return sorted({
+        encode(latitude, longitude, precision)
+        for latitude in _steps(south, north, height)
+        for longitude in _steps(west, east, width)
+    })
+
+
+def prefix_ranges(west, south, east, north, max_cells=16):
+    """
+    Les intervalles [debut, fin) de codes a lire pour couvrir le rectangle.
+
+    Les cases voisines dans l'ordre des codes sont fusionnees en un seul
+    intervalle. `fin` vaut None quand l'intervalle va jusqu'au bout de l'index.
+    """
+    ranges = []
+    for prefix in covering_prefixes(west, south, east, north, max_cells):
+        upper = prefix_upper_bound(prefix)
+        if ranges and ranges[-1][1] == prefix:
+            ranges[-1] = (ranges[-1][0], upper)
+        else:
+            ranges.append((prefix, upper))
+    return ranges
+
+
+def bounding_boxes(latitude, longitude, radius_km):
+    """
+    Les rectangles (ouest, sud, est, nord) qui contiennent le cercle donne.
+
+    Un seul en general ; deux si le cercle traverse l'antimeridien
+    (longitude 180) : un de chaque cote.
+    """
+    latitude, longitude, radius_km = _finite(latitude, longitude, radius_km)
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0) or radius_km < 0:
+        raise ValueError("Point hors de la Terre ou rayon negatif.")
+    delta_lat = radius_km / KM_PER_DEGREE
+    south = max(latitude - delta_lat, -90.0)
+    north = min(latitude + delta_lat, 90.0)
+    cos_lat = math.cos(math.radians(latitude))
+    if south <= -90.0 or north >= 90.0 or cos_lat < 1e-6:
+        # Le cercle touche un pole : toutes les longitudes sont possibles
+        return [(-180.0, south, 180.0, north)]
+    delta_lon = radius_km / (KM_PER_DEGREE * cos_lat)
+    if delta_lon >= 180.0:
+        return [(-180.0, south, 180.0, north)]
+    west, east = longitude - delta_lon, longitude + delta_lon
+    if west < -180.0:
+        return [(west + 360.0, south, 180.0, north), (-180.0, south, east, north)]
+    if east > 180.0:
+        return [(west, south, 180.0, north), (-180.0, south, east - 360.0, north)]
+    return [(west, south, east, north)]
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """La distance "a vol d'oiseau" entre deux points, en kilometres."""
+    lat1, lon1, lat2, lon2 = map(math.radians, map(float, (lat1, lon1, lat2, lon2)))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
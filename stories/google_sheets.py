@@ -1,36 +1,76 @@
 # Fichier : stories/google_sheets.py
+# L'integration Google Sheets (voir stories/integrations.py).
+#
+# gspread et google-auth sont lourds a importer : ils ne sont charges qu'au
+# premier envoi, par le processus qui envoie (sync_sheets), jamais par les
+# workers web.
 
-import gspread  # Bibliotheque pour parler aux Google Sheets
-from google.oauth2.service_account import Credentials  # Pour l'authentification
 from django.conf import settings  # Pour acceder aux parametres de Django
 
-from oauth2client.service_account import ServiceAccountCredentials
+# Les autorisations dont on a besoin
+SCOPES = [
+    'https://spreadsheets.google.com/feeds',  # Permission pour lire les feuilles
+    'https://www.googleapis.com/auth/drive',  # Permission pour acceder au Drive
+]
+
+# Le client autorise est garde en memoire : on ne s'authentifie qu'une fois par processus
+_client = None
+
+
+def get_client():
+    """
+    Retourne un client gspread autorise, cree une seule fois par processus.
+    """
+    global _client
+    if _client is None:
+        import gspread  # Bibliotheque pour parler aux Google Sheets
+        from google.oauth2.service_account import Credentials  # Pour l'authentification
+
+        # On charge les identifiants de connexion depuis le fichier JSON
+        credentials = Credentials.from_service_account_file(
+            settings.GOOGLE_SHEETS_CREDS,  # Chemin vers le fichier d'identifiants
+            scopes=SCOPES,
+        )
+        _client = gspread.authorize(credentials)
+    return _client
+
 
 def get_google_sheet():
     """
     Cette fonction se connecte a une Google Sheet et retourne la premiere feuille de calcul.
     """
+    # On ouvre la feuille de calcul par son nom et on prend la premiere feuille
+    return get_client().open(settings.GOOGLE_SHEETS_NAME).sheet1
 
-    # On definit les autorisations dont on a besoin
 
-    scope = [
-    'https://spreadsheets.google.com/feeds', # Permission pour lire les feuilles
-    'https://www.googleapis.com/auth/drive'  # Permission pour acceder au Drive
-]
-    credentials = Credentials.from_service_account_file('your-credentials.json', scopes=scope)
-    client = gspread.authorize(credentials)
+class GoogleSheetSink:
+    """
+    Destination reelle : la premiere feuille du classeur GOOGLE_SHEETS_NAME.
 
-    # On charge les identifiants de connexion depuis le fichier JSON
-    creds = ServiceAccountCredentials.from_json_keyfile_name(
-        settings.GOOGLE_SHEETS_CREDS,  # Chemin vers le fichier d'identifiants
-        scope  # Les autorisations demandees
-    )
+    La feuille est ouverte au premier envoi puis reutilisee pour les suivants.
+    """
 
-    # On cree un client autorise avec nos identifiants
-    client = gspread.authorize(creds)
+    def __init__(self):
+        self._sheet = None
+
+    def append_rows(self, rows):
+        if self._sheet is None:
+            self._sheet = get_google_sheet()
+        # Un seul appel a l'API Google pour tout le lot
+        self._sheet.append_rows(rows, value_input_option='RAW')
+
+
+class FakeSheetSink:
+    """
+    Fausse feuille locale pour les tests et le developpement.
+
+    Les lignes sont gardees dans `self.rows` (une liste par instance) au
+    lieu d'etre envoyees a Google.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def append_rows(self, rows):
+        self.rows.extend(list(row) for row in rows)
 
-    # On ouvre la feuille de calcul par son nom et on prend la premiere feuille
-    sheet = client.open(settings.GOOGLE_SHEETS_NAME).sheet1
-    
-    # On retourne la feuille de calcul pour pouvoir l'utiliser
-    return sheet
\ No newline at end of file
@@ -0,0 +1,62 @@
+# Fichier : stories/integrations.py
+# Les integrations optionnelles : les exports vers des services exterieurs
+# (Google Sheets aujourd'hui, d'autres demain).
+#
+# Chacune est declaree dans le parametre INTEGRATIONS :
+#
+#   INTEGRATIONS = {
+#       'google_sheets': {'ENABLED': True, 'BACKEND': 'stories.google_sheets.GoogleSheetSink'},
+#   }
+#
+# Rien n'est importe au demarrage : la classe BACKEND (et ses bibliotheques,
+# parfois lourdes) n'est chargee qu'au premier get(), dans le processus qui
+# s'en sert. Les workers web, qui ne demandent que enabled(), restent legers
+# et demarrent vite (voir `manage.py importtime`).
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.utils.module_loading import import_string
+
+# Les objets deja construits, un par integration et par processus
+_instances = {}
+
+
+class IntegrationDisabled(ImproperlyConfigured):
+    """L'integration demandee existe mais n'est pas activee."""
+
+
+def _config(name):
+    try:
+        return getattr(settings, 'INTEGRATIONS', {})[name]
+    except KeyError:
+        raise ImproperlyConfigured(f"Integration inconnue : {name} (voir INTEGRATIONS).")
+
+
+def enabled(name):
+    """True si l'integration `name` est activee. N'importe rien."""
+    return bool(getattr(settings, 'INTEGRATIONS', {}).get(name, {}).get('ENABLED', False))
+
+
+def get(name):
+    """L'objet de l'integration `name`, importe et construit au premier appel."""
+    if name not in _instances:
+        config = _config(name)
+        if not config.get('ENABLED', False):
+            raise IntegrationDisabled(f"L'integration {name} est desactivee (INTEGRATIONS['{name}']['ENABLED']).")
+        _instances[name] = import_string(config['BACKEND'])()
+    return _instances[name]
+
+
+def loaded():
+    """Les integrations deja chargees dans ce processus."""
+    return sorted(_instances)
+
+
+def _reset(setting, **kwargs):
+    # override_settings(INTEGRATIONS=...) dans les tests : on repart de zero
+    if setting == 'INTEGRATIONS':
+        _instances.clear()
+
+
+setting_changed.connect(_reset, dispatch_uid='stories.integrations.reset')
@@ -0,0 +1,257 @@
+# Fichier : stories/management/commands/bench.py
+# Mesure les pages et l'API principales sur des donnees de test de plusieurs tailles.
+#
+#   python manage.py bench                                  # 1 000 et 10 000
+#   python manage.py bench --scales 1000,10000,100000 --output bench.json
+#   python manage.py bench --compare bench.json             # signale les regressions
+#
+# Pour chaque taille, on cree (avec bulk_create, toujours les memes grace a
+# --seed) autant d'histoires que de plantations, puis on appelle chaque
+# endpoint avec le client de test de Django : temps (mediane sur --repeat
+# appels), nombre de requetes SQL et pic de memoire Python (tracemalloc).
+#
+# Rien ne touche la vraie base ni le vrai cache : comme `manage.py test`, on
+# cree une base de test (test_<nom>, detruite a la fin ; avec PostgreSQL il
+# faut le droit CREATEDB) et on utilise un cache memoire prive a la commande.
+# Sur Render, le cache partage (REDIS_URL) garde donc ses seaux de limites,
+# ses pages et ses vues en attente. Le cache prive est vide avant chaque
+# appel (on mesure le vrai travail, pas le cache), sauf avec --keep-cache.
+
+import json
+import platform
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import django
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import override_settings, setup_databases, teardown_databases
+from django.urls import reverse
+from django.utils import timezone
+
+from stories.models import Artisan, Story, TreePlanting
+from stories.services import view_counter
+
+# Le rectangle du Sahel (a peu pres) ou on place les arbres de test
+SAHEL = (-17.0, 10.0, 40.0, 20.0)  # ouest, sud, est, nord
+# Une date fixe : les donnees (et donc les mesures) ne dependent pas du jour
+START = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+# Nombre d'histoires par artisan de test
+STORIES_PER_ARTISAN = 50
+HOST = 'localhost'
+# Le cache de la mesure : propre a ce processus, jamais le cache partage
+PRIVATE_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'bench'}}
+# En dessous de ces ecarts, une hausse n'est que du bruit de mesure
+MIN_DELTA = {'wall_ms': 2.0, 'peak_kb': 64.0}
+
+
+def endpoints(story_id):
+    """(nom, methode, url, connecte ?) de chaque endpoint mesure."""
+    return [
+        ('story_list', 'get', reverse('story_list'), False),
+        ('story_detail', 'get', reverse('story_detail', args=[story_id]), False),
+        ('story_map', 'get', reverse('story_map'), False),
+        ('story_map_data', 'get', reverse('story_map_data'), False),
+        ('story_list_api', 'get', reverse('story-list-api'), True),
+        ('pending_trees', 'get', reverse('pending_trees'), True),
+        ('plant_tree', 'post', reverse('plant_tree', args=[story_id]), False),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Mesure temps, requetes SQL et memoire des endpoints principaux sur des donnees de test."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', default='1000,10000',
+            help="Tailles des jeux de donnees (histoires et plantations), separees par des virgules.",
+        )
+        parser.add_argument('--repeat', type=int, default=5, help="Appels mesures par endpoint.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--only', help="Ne mesurer que ces endpoints (separes par des virgules).")
+        parser.add_argument('--keep-cache', action='store_true', help="Ne pas vider le cache entre les appels.")
+        parser.add_argument('--output', help="Fichier JSON ou ecrire les resultats.")
+        parser.add_argument('--compare', help="Fichier JSON de reference : signale les regressions.")
+        parser.add_argument(
+            '--threshold', type=float, default=0.25,
+            help="Hausse toleree du temps et de la memoire avant de parler de regression (0.25 = +25 %%).",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            scales = [int(scale) for scale in options['scales'].split(',') if scale]
+        except ValueError:
+            raise CommandError("--scales attend des nombres, par exemple 1000,10000.")
+        only = set(options['only'].split(',')) if options['only'] else None
+
+        report = {
+            'meta': {
+                'created_at': timezone.now().isoformat(),
+                'database': connection.vendor,
+                'django': django.get_version(),
+                'python': platform.python_version(),
+                'repeat': options['repeat'],
+                'seed': options['seed'],
+                'keep_cache': options['keep_cache'],
+            },
+            'results': {},
+        }
+        # Un cache prive, pas de limite d'ecriture ni de thread qui ecrit les vues pendant la mesure
+        with override_settings(CACHES=PRIVATE_CACHES, THROTTLE_ENABLED=False, VIEW_COUNTER_FLUSH_INTERVAL=0):
+            self.stdout.write("Creation de la base de test...")
+            databases = setup_databases(verbosity=0, interactive=False, aliases={'default'})
+            try:
+                for scale in scales:
+                    self.stdout.write(f"Taille {scale} :")
+                    report['results'][str(scale)] = self._bench_scale(scale, only, options)
+                view_counter.get_buffer().drain()  # Les vues des histoires de test n'existent plus
+            finally:
+                teardown_databases(databases, verbosity=0)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Resultats ecrits dans {options['output']}.")
+        if options['compare']:
+            self._compare(report, options['compare'], options['threshold'])
+
+    def _bench_scale(self, scale, only, options):
+        results = {}
+        with transaction.atomic():
+            started = time.perf_counter()
+            user, story_id = self._seed(random.Random(options['seed']), scale)
+            self.stdout.write(f"  donnees creees en {time.perf_counter() - started:.1f} s")
+
+            for name, method, url, logged_in in endpoints(story_id):
+                if only and name not in only:
+                    continue
+                client = Client(HTTP_HOST=HOST)
+                if logged_in:
+                    client.force_login(user)
+                results[name] = self._measure(client, method, url, options)
+                result = results[name]
+                self.stdout.write(
+                    f"  {name:<16} {result['wall_ms']:9.2f} ms  {result['queries']:4d} requetes  "
+                    f"{result['peak_kb']:9.1f} Ko  (HTTP {result['status']})"
+                )
+            transaction.set_rollback(True)  # On ne garde rien
+        return results
+
+    def _call(self, client, method, url, keep_cache):
+        if not keep_cache:
+            cache.clear()
+        response = getattr(client, method)(url)
+        # Les reponses en flux ne font leur travail que quand on les lit
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response
+
+    def _measure(self, client, method, url, options):
+        self._call(client, method, url, options['keep_cache'])  # Echauffement (imports, gabarits)
+
+        # Compte les requetes SQL (le log de Django est vide a chaque requete HTTP)
+        queries = []
+
+        def count_query(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        timings = []
+        for _ in range(options['repeat']):
+            queries.clear()
+            with connection.execute_wrapper(count_query):
+                started = time.perf_counter()
+                response = self._call(client, method, url, options['keep_cache'])
+                timings.append((time.perf_counter() - started) * 1000)
+
+        # tracemalloc ralentit tout : la memoire est mesuree sur un appel a part
+        tracemalloc.start()
+        try:
+            self._call(client, method, url, options['keep_cache'])
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'status': response.status_code,
+            'wall_ms': round(statistics.median(timings), 3),
+            'wall_ms_min': round(min(timings), 3),
+            'queries': len(queries),
+            'peak_kb': round(peak / 1024, 1),
+        }
+
+    def _seed(self, rng, scale):
+        """Cree `scale` histoires et `scale` plantations ; retourne (admin, id d'une histoire)."""
+        tag = f'bench-{scale}-{rng.randrange(10 ** 9)}'
+        user = User.objects.create(username=tag, is_staff=True)
+        users = User.objects.bulk_create([
+            User(username=f'{tag}-{i}', password='!')
+            for i in range(max(1, scale // STORIES_PER_ARTISAN))
+        ])
+        communities = ['Agadez', 'Tahoua', 'Zinder', 'Maradi', 'Dosso', 'Tillaberi']
+        artisans = Artisan.objects.bulk_create([
+            Artisan(user=u, community=rng.choice(communities), bio='Artisan de test')
+            for u in users
+        ])
+        stories = Story.objects.bulk_create([
+            Story(
+                title=f'Histoire {i}',
+                content='Il etait une fois un arbre. ' * rng.randint(5, 40),
+                artisan=artisans[i % len(artisans)],
+                published_at=START + timedelta(minutes=i) if rng.random() < 0.9 else None,
+                views=rng.randint(0, 500),
+            )
+            for i in range(scale)
+        ], batch_size=1000)
+
+        west, south, east, north = SAHEL
+        statuses = TreePlanting.Status.values
+        trees = []
+        for _ in range(scale):
+            tree = TreePlanting(
+                story=rng.choice(stories),
+                planted_by='bench',
+                status=rng.choice(statuses),
+            )
+            if rng.random() < 0.8:  # Certaines promesses n'ont pas encore de position
+                tree.latitude = round(rng.uniform(south, north), 6)
+                tree.longitude = round(rng.uniform(west, east), 6)
+                tree.geohash = tree.compute_geohash()  # bulk_create n'appelle pas save()
+            trees.append(tree)
+        TreePlanting.objects.bulk_create(trees, batch_size=1000)
+        published = next(story for story in stories if story.published_at)
+        return user, published.id
+
+    def _compare(self, report, path, threshold):
+        try:
+            with open(path) as f:
+                baseline = json.load(f)['results']
+        except (OSError, ValueError, KeyError) as exc:
+            raise CommandError(f"Impossible de lire la reference {path} : {exc}")
+
+        regressions = []
+        for scale, endpoints_results in report['results'].items():
+            for name, result in endpoints_results.items():
+                before = baseline.get(scale, {}).get(name)
+                if before is None:
+                    continue
+                if result['queries'] > before['queries']:
+                    regressions.append(f"{scale} {name} : {before['queries']} -> {result['queries']} requetes")
+                for metric, unit in (('wall_ms', 'ms'), ('peak_kb', 'Ko')):
+                    grew = result[metric] - before[metric]
+                    if result[metric] > before[metric] * (1 + threshold) and grew > MIN_DELTA[metric]:
+                        regressions.append(
+                            f"{scale} {name} : {before[metric]} -> {result[metric]} {unit}"
+                        )
+
+        if regressions:
+            for line in regressions:
+                self.stderr.write(self.style.ERROR(f"REGRESSION {line}"))
+            raise CommandError(f"{len(regressions)} regression(s) par rapport a {path}.")
+        self.stdout.write(self.style.SUCCESS(f"Aucune regression par rapport a {path}."))
@@ -0,0 +1,181 @@
+# Fichier : stories/management/commands/bench_connections.py
+# Mesure le cout par requete des connexions a la base, avec et sans reutilisation.
+#
+#   python manage.py bench_connections
+#   python manage.py bench_connections --requests 500 --modes none,pool
+#
+# Pour chaque mode (voir stories/services/db_connections.py) :
+#   - none       : CONN_MAX_AGE = 0, une connexion neuve par requete ;
+#   - persistent : CONN_MAX_AGE = --conn-max-age, la connexion est gardee ;
+#   - pool       : le pool psycopg (PostgreSQL avec psycopg 3 seulement).
+# on appelle `--requests` fois chaque endpoint avec le client de test de
+# Django. Le client de test garde sa connexion : on appelle nous-memes
+# close_old_connections() avant et apres chaque requete, comme un worker
+# (signaux request_started / request_finished). On note la latence
+# (mediane, p95) et le nombre de connexions ouvertes.
+#
+# Le gain se voit surtout sur une vraie base PostgreSQL a distance (TLS,
+# mot de passe) : avec SQLite, ouvrir une connexion ne coute presque rien.
+# Le mode pool n'a encore jamais ete mesure (pas de PostgreSQL sous la main) :
+# aucun chiffre du pool n'est publie tant qu'il n'a pas tourne sur une vraie base.
+# Les reglages de la base sont remis comme avant a la fin.
+
+import json
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+
+from stories.services import db_connections
+
+MODES = ('none', 'persistent', 'pool')
+HOST = 'localhost'
+
+
+def endpoints():
+    """(nom, url, connecte ?) de chaque endpoint mesure."""
+    return [
+        ('health', reverse('health_check'), False),
+        ('story_list_api', reverse('story-list-api'), True),
+    ]
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare la latence par requete sans reutilisation des connexions, avec CONN_MAX_AGE et avec le pool."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Requetes mesurees par endpoint et par mode.")
+        parser.add_argument('--modes', default=','.join(MODES), help="Modes a comparer (none, persistent, pool).")
+        parser.add_argument('--conn-max-age', type=int, default=60, help="CONN_MAX_AGE du mode persistent.")
+        parser.add_argument('--only', help="Ne mesurer que ces endpoints (separes par des virgules).")
+        parser.add_argument('--output', help="Fichier JSON ou ecrire les resultats.")
+
+    def handle(self, *args, **options):
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Modes inconnus : {', '.join(sorted(unknown))} ({', '.join(MODES)}).")
+        if 'pool' in modes and not self._pool_available():
+            self.stdout.write("Pas de pool possible ici (PostgreSQL et psycopg 3 seulement) : mode pool ignore.")
+            modes.remove('pool')
+        only = set(options['only'].split(',')) if options['only'] else None
+        user = get_user_model().objects.filter(is_active=True).order_by('id').first()
+        targets = [
+            (name, url, logged_in) for name, url, logged_in in endpoints()
+            if (not only or name in only) and (user or not logged_in)
+        ]
+
+        opened = []
+
+        def count_connection(sender, connection, **kwargs):
+            opened.append(connection.alias)
+
+        connection_created.connect(count_connection, weak=False, dispatch_uid='bench_connections')
+        original = dict(connection.settings_dict, OPTIONS=dict(connection.settings_dict.get('OPTIONS', {})))
+        report = {'meta': {'vendor': connection.vendor, 'requests': options['requests']}, 'results': {}}
+        try:
+            for mode in modes:
+                self.stdout.write(f"Mode {mode} :")
+                self._configure(mode, original, options['conn_max_age'])
+                report['results'][mode] = {}
+                for name, url, logged_in in targets:
+                    client = Client(HTTP_HOST=HOST)
+                    if logged_in:
+                        client.force_login(user)
+                    result = self._measure(client, url, options['requests'], opened)
+                    report['results'][mode][name] = result
+                    self.stdout.write(
+                        f"  {name:<16} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                        f"{result['connections']:5d} connexions ouvertes  (HTTP {result['status']})"
+                    )
+        finally:
+            connection_created.disconnect(dispatch_uid='bench_connections')
+            self._restore(original)
+        self._summary(report['results'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Resultats ecrits dans {options['output']}.")
+
+    def _pool_available(self):
+        if connection.vendor != 'postgresql':
+            return False
+        try:
+            import psycopg_pool  # noqa: F401
+        except ImportError:
+            return False
+        return connection.Database.__name__ == 'psycopg'
+
+    def _configure(self, mode, original, conn_max_age):
+        """Change la facon de se connecter ; la prochaine connexion suivra ces reglages."""
+        connection.close()
+        if original['OPTIONS'].get('pool'):
+            connection.close_pool()
+        options = dict(original['OPTIONS'])
+        options.pop('pool', None)
+        if mode == 'pool':
+            options['pool'] = original['OPTIONS'].get('pool') or True
+        connection.settings_dict['OPTIONS'] = options
+        connection.settings_dict['CONN_MAX_AGE'] = conn_max_age if mode == 'persistent' else 0
+        connection.settings_dict['CONN_HEALTH_CHECKS'] = original['CONN_HEALTH_CHECKS']
+
+    def _restore(self, original):
+        connection.close()
+        if db_connections.reuse_mode() == 'pool':
+            connection.close_pool()
+        connection.settings_dict.update(original)
+
+    def _call(self, client, url):
+        close_old_connections()  # request_started
+        try:
+            return client.get(url)
+        finally:
+            close_old_connections()  # request_finished
+
+    def _measure(self, client, url, requests, opened):
+        pool = connection.pool if db_connections.reuse_mode() == 'pool' else None
+        response = self._call(client, url)  # Echauffement (et ouverture du pool)
+        opened.clear()
+        if pool:
+            pool.pop_stats()  # Les compteurs du pool repartent de zero
+        timings = []
+        for _ in range(requests):
+            started = time.perf_counter()
+            response = self._call(client, url)
+            timings.append((time.perf_counter() - started) * 1000)
+        # Avec le pool, Django "se connecte" a chaque requete mais le pool ne
+        # cree une vraie connexion que s'il n'en a pas de libre
+        connections_opened = pool.get_stats().get('connections_num', 0) if pool else len(opened)
+        return {
+            'status': response.status_code,
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(percentile(timings, 0.95), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'connections': connections_opened,
+        }
+
+    def _summary(self, results):
+        baseline = results.get('none')
+        if not baseline:
+            return
+        self.stdout.write("Gain par requete (mediane) par rapport a une connexion neuve a chaque fois :")
+        for mode, endpoints_results in results.items():
+            if mode == 'none':
+                continue
+            for name, result in endpoints_results.items():
+                before = baseline.get(name)
+                if before:
+                    self.stdout.write(
+                        f"  {mode:<10} {name:<16} {before['p50_ms'] - result['p50_ms']:+8.2f} ms"
+                    )
@@ -0,0 +1,273 @@
+# Fichier : stories/management/commands/bench_servers.py
+# Compare le deploiement synchrone (WSGI) et asynchrone (ASGI) sous charge.
+#
+#   python manage.py bench_servers
+#   python manage.py bench_servers --workers 2 --concurrency 100 --duration 15
+#   python manage.py bench_servers --sync-workers 4 --async-workers 2   # a memoire egale
+#
+# On lance gunicorn deux fois sur un port libre, avec le meme gunicorn.conf.py :
+#   - sync  : sahel_api.wsgi:application, workers "sync" (l'ancien deploiement) ;
+#   - async : sahel_api.asgi:application, workers uvicorn.
+# Puis on envoie `--concurrency` requetes en parallele sur chaque endpoint
+# pendant `--duration` secondes, et on note les requetes par seconde, les
+# latences (p50, p95, p99), les erreurs et la memoire (RSS du maitre et des
+# workers, lue dans /proc, donc Linux seulement).
+#
+# "A memoire egale" : un worker uvicorn tient beaucoup de requetes a la fois,
+# un worker sync une seule. On compare donc aussi les requetes par seconde
+# pour 100 Mo de RSS, et on peut donner a chaque mode son nombre de workers.
+#
+# Les endpoints connectes utilisent une session creee pour --username (le
+# premier administrateur par defaut). La base et le cache sont les vrais :
+# rien n'est cree a part cette session, effacee a la fin.
+
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from importlib import import_module
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from stories.models import Story
+
+HOST = '127.0.0.1'
+MODES = {
+    'sync': ('sahel_api.wsgi:application', 'sync'),
+    'async': ('sahel_api.asgi:application', 'uvicorn_worker.UvicornWorker'),
+}
+# Temps laisse a gunicorn pour demarrer ses workers
+STARTUP_TIMEOUT = 30
+
+
+def endpoints(story_id):
+    """(nom, url, connecte ?) de chaque endpoint mesure."""
+    return [
+        ('ping', reverse('ping'), False),
+        ('health', reverse('health_check'), False),
+        ('me', reverse('current_user'), True),
+        ('story_list_api', reverse('story-list-api'), True),
+        ('story_detail_api', reverse('story-detail-api', args=[story_id]), True),
+        ('trending', reverse('trending_stories'), True),
+        ('pending_trees', reverse('pending_trees'), True),
+    ]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+def rss_kb(pid):
+    """RSS (en Ko) d'un processus et de tous ses descendants."""
+    total = 0
+    children = [pid]
+    while children:
+        current = children.pop()
+        try:
+            with open(f'/proc/{current}/status') as f:
+                total += next(int(line.split()[1]) for line in f if line.startswith('VmRSS:'))
+            for task in Path(f'/proc/{current}/task').iterdir():
+                children.extend(int(child) for child in (task / 'children').read_text().split())
+        except (OSError, StopIteration):
+            continue  # Le processus vient de s'arreter
+    return total
+
+
+async def fetch(port, path, cookie):
+    """Une requete GET ; retourne (statut, secondes)."""
+    started = time.perf_counter()
+    reader, writer = await asyncio.open_connection(HOST, port)
+    try:
+        headers = f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n'
+        if cookie:
+            headers += f'Cookie: {settings.SESSION_COOKIE_NAME}={cookie}\r\n'
+        writer.write(f'{headers}\r\n'.encode())
+        await writer.drain()
+        status_line = await reader.readline()
+        while await reader.read(65536):
+            pass
+    finally:
+        writer.close()
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, time.perf_counter() - started
+
+
+async def load(port, path, cookie, concurrency, duration):
+    """`concurrency` clients qui enchainent les requetes pendant `duration` secondes."""
+    latencies, statuses = [], {}
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            try:
+                status, elapsed = await fetch(port, path, cookie)
+            except OSError:
+                status, elapsed = 0, None  # Connexion refusee ou coupee
+            statuses[status] = statuses.get(status, 0) + 1
+            if elapsed is not None and 200 <= status < 400:
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, statuses, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Command(BaseCommand):
+    help = "Compare sous charge le deploiement WSGI (workers sync) et ASGI (workers uvicorn)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help="Workers gunicorn de chaque mode.")
+        parser.add_argument('--sync-workers', type=int, help="Workers du mode sync (sinon --workers).")
+        parser.add_argument('--async-workers', type=int, help="Workers du mode async (sinon --workers).")
+        parser.add_argument('--concurrency', type=int, default=50, help="Clients en parallele.")
+        parser.add_argument('--duration', type=float, default=10, help="Secondes de charge par endpoint.")
+        parser.add_argument('--only', help="Ne mesurer que ces endpoints (separes par des virgules).")
+        parser.add_argument('--modes', default='sync,async', help="Modes a comparer.")
+        parser.add_argument('--username', help="Utilisateur des endpoints connectes (premier admin par defaut).")
+        parser.add_argument('--output', help="Fichier JSON ou ecrire les resultats.")
+
+    def handle(self, *args, **options):
+        if not Path('/proc/self/status').exists():
+            raise CommandError("La memoire est lue dans /proc : Linux seulement.")
+        modes = [mode for mode in options['modes'].split(',') if mode]
+        unknown = set(modes) - set(MODES)
+        if unknown:
+            raise CommandError(f"Modes inconnus : {', '.join(sorted(unknown))} (sync, async).")
+        story = Story.objects.filter(published_at__isnull=False).order_by('id').first()
+        if story is None:
+            raise CommandError("Il faut au moins une histoire publiee dans la base.")
+        only = set(options['only'].split(',')) if options['only'] else None
+        cookie = self._session(options['username'])
+        targets = [
+            (name, url, logged_in) for name, url, logged_in in endpoints(story.id)
+            if (not only or name in only) and (cookie or not logged_in)
+        ]
+
+        report = {
+            'meta': {
+                'concurrency': options['concurrency'],
+                'duration': options['duration'],
+                'cpus': os.cpu_count(),
+            },
+            'results': {},
+        }
+        try:
+            for mode in modes:
+                workers = options[f'{mode}_workers'] or options['workers']
+                self.stdout.write(f"Mode {mode} ({workers} workers) :")
+                report['results'][mode] = self._bench_mode(mode, workers, targets, cookie, options)
+        finally:
+            if cookie:
+                import_module(settings.SESSION_ENGINE).SessionStore(session_key=cookie).delete()
+        self._summary(report['results'])
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(f"Resultats ecrits dans {options['output']}.")
+
+    def _session(self, username):
+        """Un cookie de session pour `username` (None si personne ne peut se connecter)."""
+        users = get_user_model().objects.filter(is_active=True)
+        user = users.filter(username=username).first() if username else (
+            users.filter(is_staff=True).order_by('id').first() or users.order_by('id').first()
+        )
+        if user is None:
+            if username:
+                raise CommandError(f"Utilisateur inconnu : {username}")
+            self.stdout.write("Aucun utilisateur : seuls les endpoints publics sont mesures.")
+            return None
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = user._meta.pk.value_to_string(user)
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session[HASH_SESSION_KEY] = user.get_session_auth_hash()
+        session.create()
+        return session.session_key
+
+    def _bench_mode(self, mode, workers, targets, cookie, options):
+        app, worker_class = MODES[mode]
+        port = free_port()
+        env = {**os.environ, 'GUNICORN_WORKER_CLASS': worker_class}
+        server = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', app, '--bind', f'{HOST}:{port}',
+             '--workers', str(workers), '--log-level', 'warning'],
+            cwd=settings.BASE_DIR, env=env,
+        )
+        try:
+            self._wait_ready(server, port)
+            idle_kb = rss_kb(server.pid)
+            results = {'workers': workers, 'idle_rss_kb': idle_kb, 'endpoints': {}}
+            for name, url, logged_in in targets:
+                latencies, statuses, elapsed = asyncio.run(load(
+                    port, url, cookie if logged_in else None, options['concurrency'], options['duration'],
+                ))
+                rss = rss_kb(server.pid)
+                ok = len(latencies)
+                result = {
+                    'rps': round(ok / elapsed, 1),
+                    'p50_ms': round(percentile(latencies, 0.50) * 1000, 2) if ok else None,
+                    'p95_ms': round(percentile(latencies, 0.95) * 1000, 2) if ok else None,
+                    'p99_ms': round(percentile(latencies, 0.99) * 1000, 2) if ok else None,
+                    'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if ok else None,
+                    'errors': sum(count for status, count in statuses.items() if not 200 <= status < 400),
+                    'statuses': {str(status): count for status, count in sorted(statuses.items())},
+                    'rss_kb': rss,
+                    'rps_per_100mb': round(ok / elapsed / (rss / 102400), 1) if rss else None,
+                }
+                results['endpoints'][name] = result
+                self.stdout.write(
+                    f"  {name:<16} {result['rps']:8.1f} req/s  p50 {result['p50_ms'] or 0:8.2f} ms  "
+                    f"p99 {result['p99_ms'] or 0:8.2f} ms  {result['errors']:5d} erreurs  "
+                    f"{rss / 1024:7.1f} Mo"
+                )
+            return results
+        finally:
+            server.terminate()
+            try:
+                server.wait(timeout=STARTUP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                server.kill()
+
+    def _wait_ready(self, server, port):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        path = urlsplit(reverse('ping')).path
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"gunicorn s'est arrete au demarrage (code {server.returncode}).")
+            try:
+                status, _ = asyncio.run(fetch(port, path, None))
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f"gunicorn n'a pas repondu sur le port {port} en {STARTUP_TIMEOUT} s.")
+
+    def _summary(self, results):
+        if not {'sync', 'async'} <= set(results):
+            return
+        self.stdout.write("Async / sync (requetes par seconde, puis par 100 Mo de RSS) :")
+        for name, after in results['async']['endpoints'].items():
+            before = results['sync']['endpoints'].get(name)
+            if not before or not before['rps'] or not before['rps_per_100mb']:
+                continue
+            self.stdout.write(
+                f"  {name:<16} x{after['rps'] / before['rps']:5.2f}  "
+                f"x{(after['rps_per_100mb'] or 0) / before['rps_per_100mb']:5.2f}"
+            )
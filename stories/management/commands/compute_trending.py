@@ -0,0 +1,42 @@
+# Fichier : stories/management/commands/compute_trending.py
+# Recalcule le classement "tendance" des histoires (voir stories/services/trending.py).
+#
+#   python manage.py compute_trending          # tourne en continu
+#   python manage.py compute_trending --once   # un seul passage (cron)
+#
+# Chaque passage ne lit que l'activite arrivee depuis le precedent.
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from stories.services import trending
+
+
+class Command(BaseCommand):
+    help = "Ajoute aux scores tendance les vues, plantations et commentaires recents."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=300.0,
+            help="Secondes entre deux passages.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Fait un seul passage puis s'arrete.",
+        )
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                updated = trending.compute()
+                if updated is None:
+                    self.stderr.write(self.style.WARNING("Un autre calcul est deja en cours."))
+                else:
+                    self.stdout.write(f"{updated} histoire(s) mise(s) a jour.")
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS("Termine."))
@@ -0,0 +1,25 @@
+# Fichier : stories/management/commands/flush_views.py
+# Force l'ecriture en base des vues gardees dans le tampon du compteur de vues.
+#
+# Utile avec VIEW_COUNTER_BACKEND = "cache" et Redis : le tampon est partage,
+# donc cette commande peut le vider depuis n'importe quel processus (cron,
+# deploy). Avec un tampon propre a chaque processus, elle ne verrait que le
+# sien, toujours vide : elle s'arrete avec une erreur au lieu de dire "0 vue".
+
+from django.core.management.base import BaseCommand, CommandError
+
+from stories.services import view_counter
+
+
+class Command(BaseCommand):
+    help = "Ecrit en base les vues d'histoires en attente dans le tampon."
+
+    def handle(self, *args, **options):
+        if not view_counter.is_shared():
+            raise CommandError(
+                "Le tampon des vues est propre a chaque processus "
+                "(VIEW_COUNTER_BACKEND=cache avec REDIS_URL pour un tampon partage) : "
+                "les vues en attente sont dans les workers, pas ici."
+            )
+        flushed = view_counter.flush()
+        self.stdout.write(self.style.SUCCESS(f"{flushed} vue(s) ecrite(s) en base."))
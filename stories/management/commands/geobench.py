@@ -0,0 +1,78 @@
+# Fichier : stories/management/commands/geobench.py
+# Compare les recherches geographiques avec index geohash et sans index.
+#
+#   python manage.py geobench --size 50000
+#
+# Les plantations de test sont creees dans une transaction annulee a la fin :
+# la base n'est pas modifiee.
+
+import random
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from stories.models import Artisan, Story, TreePlanting
+
+# Le rectangle du Sahel (a peu pres) ou on place les arbres de test
+SAHEL = (-17.0, 10.0, 40.0, 20.0)  # ouest, sud, est, nord
+
+
+class Command(BaseCommand):
+    help = "Mesure within_bbox()/near() (index geohash) contre un parcours complet."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=20000, help="Nombre de plantations de test.")
+        parser.add_argument('--queries', type=int, default=50, help="Nombre de recherches par mesure.")
+        parser.add_argument('--radius', type=float, default=25.0, help="Rayon de near(), en km.")
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self._seed(rng, options['size'])
+            points = [self._random_point(rng) for _ in range(options['queries'])]
+            radius = options['radius']
+            half = 0.25  # Rectangles de 0.5 x 0.5 degres
+
+            results = [
+                self._measure("within_bbox (geohash)", points, lambda lat, lon: TreePlanting.objects.within_bbox(
+                    lon - half, lat - half, lon + half, lat + half)),
+                self._measure("bbox (parcours complet)", points, lambda lat, lon: TreePlanting.objects.filter(
+                    latitude__range=(lat - half, lat + half), longitude__range=(lon - half, lon + half))),
+                self._measure("near (geohash)", points, lambda lat, lon: TreePlanting.objects.near(
+                    lat, lon, radius)),
+                self._measure("near (parcours complet)", points, lambda lat, lon: TreePlanting.objects.filter(
+                    latitude__isnull=False).with_distance(lat, lon).filter(distance_km__lte=radius)),
+            ]
+            transaction.set_rollback(True)  # On ne garde rien
+
+        for label, elapsed, found in results:
+            per_query = elapsed / len(points) * 1000
+            self.stdout.write(f"{label:<26} {per_query:8.2f} ms/recherche  ({found} resultats)")
+
+    def _random_point(self, rng):
+        west, south, east, north = SAHEL
+        return rng.uniform(south, north), rng.uniform(west, east)
+
+    def _seed(self, rng, size):
+        user = User.objects.create(username=f'geobench-{rng.random()}')
+        story = Story.objects.create(title='geobench', content='', artisan=Artisan.objects.create(user=user))
+        trees = []
+        for _ in range(size):
+            latitude, longitude = self._random_point(rng)
+            tree = TreePlanting(
+                story=story, planted_by='geobench',
+                latitude=round(latitude, 6), longitude=round(longitude, 6),
+            )
+            tree.geohash = tree.compute_geohash()  # bulk_create n'appelle pas save()
+            trees.append(tree)
+        TreePlanting.objects.bulk_create(trees, batch_size=1000)
+
+    def _measure(self, label, points, make_query):
+        found = 0
+        start = time.perf_counter()
+        for latitude, longitude in points:
+            found += len(make_query(latitude, longitude).values_list('id', flat=True))
+        return label, time.perf_counter() - start, found
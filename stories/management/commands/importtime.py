@@ -0,0 +1,117 @@
+# Fichier : stories/management/commands/importtime.py
+# Ce que coutent les imports au demarrage d'un worker web.
+#
+#   python manage.py importtime              # worker ASGI (uvicorn)
+#   python manage.py importtime --wsgi       # worker WSGI (gunicorn sync)
+#   python manage.py importtime --top 30
+#
+# On demarre un Python neuf avec `-X importtime`, qui charge l'application
+# comme un worker (Django, middlewares, URLconf et donc toutes les vues),
+# puis on lit le rapport de Python : temps total, nombre de modules, modules
+# et paquets les plus chers.
+#
+# La commande echoue si le demarrage depasse IMPORT_BUDGET_MS ou
+# IMPORT_BUDGET_MODULES, ou s'il charge une integration optionnelle
+# (OPTIONAL_MODULES) : celles-ci ne doivent venir qu'au premier usage
+# (stories/integrations.py). Le meme controle tourne dans les tests.
+
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Ce que fait un worker en demarrant (gunicorn importe l'application, la
+# premiere requete charge l'URLconf)
+BOOT_SCRIPT = '''
+from sahel_api.{app} import application
+from django.urls import get_resolver
+get_resolver().url_patterns
+'''
+# Les bibliotheques des integrations optionnelles : jamais au demarrage
+OPTIONAL_MODULES = ('gspread', 'google.oauth2', 'google.auth', 'oauth2client', 'googleapiclient')
+LINE_RE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$')
+
+
+def measure(app='asgi'):
+    """
+    Les imports du demarrage d'un worker (`app` : 'asgi' ou 'wsgi').
+
+    Retourne {'total_ms', 'modules', 'optional', 'imports'} ; `imports` est
+    la liste des (module, propre ms, cumule ms, profondeur) dans l'ordre.
+    """
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT.format(app=app)],
+        cwd=settings.BASE_DIR,
+        env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'sahel_api.settings')},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode:
+        raise CommandError(f"Le demarrage a echoue :\n{result.stderr[-2000:]}")
+    imports = []
+    for line in result.stderr.splitlines():
+        match = LINE_RE.match(line)
+        if match:
+            own, cumulative, indent, module = match.groups()
+            imports.append((module, int(own) / 1000, int(cumulative) / 1000, len(indent) // 2))
+    modules = [module for module, *_ in imports]
+    return {
+        'total_ms': round(sum(own for _, own, _, _ in imports), 1),
+        'modules': len(imports),
+        'optional': [
+            module for module in modules
+            if any(module == name or module.startswith(f'{name}.') for name in OPTIONAL_MODULES)
+        ],
+        'imports': imports,
+    }
+
+
+class Command(BaseCommand):
+    help = "Mesure le temps et le nombre d'imports au demarrage d'un worker web."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', action='store_true', help="Mesurer le worker WSGI au lieu du worker ASGI.")
+        parser.add_argument('--top', type=int, default=15, help="Nombre de modules et de paquets affiches.")
+        parser.add_argument(
+            '--budget-ms', type=float, default=getattr(settings, 'IMPORT_BUDGET_MS', 1500),
+            help="Temps d'import maximum (ms).",
+        )
+        parser.add_argument(
+            '--max-modules', type=int, default=getattr(settings, 'IMPORT_BUDGET_MODULES', 1100),
+            help="Nombre maximum de modules importes.",
+        )
+
+    def handle(self, *args, **options):
+        report = measure('wsgi' if options['wsgi'] else 'asgi')
+        imports = report['imports']
+
+        self.stdout.write("Modules les plus lents (avec ce qu'ils importent) :")
+        top_level = [item for item in imports if item[3] == 0]
+        for module, own, cumulative, _ in sorted(top_level, key=lambda item: -item[2])[:options['top']]:
+            self.stdout.write(f"  {cumulative:9.1f} ms  {module}")
+
+        packages = defaultdict(lambda: [0, 0.0])  # paquet -> [modules, ms]
+        for module, own, _, _ in imports:
+            package = packages[module.split('.')[0]]
+            package[0] += 1
+            package[1] += own
+        self.stdout.write("Paquets les plus lents (temps propre de tous leurs modules) :")
+        for package, (count, ms) in sorted(packages.items(), key=lambda item: -item[1][1])[:options['top']]:
+            self.stdout.write(f"  {ms:9.1f} ms  {count:4d} modules  {package}")
+
+        self.stdout.write(f"Total : {report['total_ms']:.1f} ms, {report['modules']} modules.")
+
+        problems = []
+        if report['total_ms'] > options['budget_ms']:
+            problems.append(f"{report['total_ms']:.1f} ms > budget de {options['budget_ms']:.0f} ms")
+        if report['modules'] > options['max_modules']:
+            problems.append(f"{report['modules']} modules > budget de {options['max_modules']}")
+        if report['optional']:
+            problems.append(f"integrations optionnelles chargees au demarrage : {', '.join(report['optional'])}")
+        if problems:
+            raise CommandError("; ".join(problems))
+        self.stdout.write(self.style.SUCCESS("Dans le budget."))
@@ -0,0 +1,26 @@
+# Fichier : stories/management/commands/rebuild_search_index.py
+# Reconstruit tout l'index de recherche plein texte des histoires.
+#
+# Les signaux gardent l'index a jour histoire par histoire ; cette commande
+# sert apres un import en masse, une restauration de base, ou si l'index
+# (la table FTS5 sur SQLite) a ete perdu.
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from stories import search
+
+
+class Command(BaseCommand):
+    help = "Reconstruit l'index de recherche plein texte des histoires."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help="Nombre de documents crees par requete INSERT (defaut : 1000).",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            total = search.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{total} histoire(s) indexee(s)."))
@@ -0,0 +1,23 @@
+# Fichier : stories/management/commands/rebuild_stats.py
+# Recompte les statistiques d'impact (TreePlantingDailyStat) depuis les plantations.
+#
+# Les cases sont tenues a jour a chaque changement ; cette commande sert apres
+# un import (loaddata, SQL a la main) ou pour verifier qu'elles sont justes.
+
+from django.core.management.base import BaseCommand
+
+from stories.services import impact_stats
+
+
+class Command(BaseCommand):
+    help = "Recompte les statistiques d'arbres par jour, communaute, artisan et statut."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--artisan', type=int,
+            help="Ne recompter que les cases de cet artisan (id).",
+        )
+
+    def handle(self, *args, **options):
+        written = impact_stats.rebuild(artisan_id=options['artisan'])
+        self.stdout.write(self.style.SUCCESS(f"{written} case(s) de statistiques ecrite(s)."))
@@ -0,0 +1,61 @@
+# Fichier : stories/management/commands/sync_sheets.py
+# Le worker qui vide la boite d'envoi SheetOutbox vers Google Sheets.
+#
+#   python manage.py sync_sheets          # tourne en continu
+#   python manage.py sync_sheets --once   # vide la boite puis s'arrete
+#
+# Il faut activer l'integration (SHEETS_SYNC_ENABLED=True).
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from stories import integrations
+from stories.services import sheets_outbox
+
+
+class Command(BaseCommand):
+    help = "Envoie les plantations en attente vers Google Sheets, par lots."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=getattr(settings, 'SHEETS_SYNC_BATCH_SIZE', 100),
+            help="Nombre maximum de lignes par appel a append_rows.",
+        )
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Secondes d'attente quand la boite d'envoi est vide.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Vide la boite d'envoi une fois puis s'arrete.",
+        )
+
+    def handle(self, *args, **options):
+        # Une seule destination (et donc un seul client autorise) pour toute la boucle
+        try:
+            sink = integrations.get('google_sheets')
+        except integrations.IntegrationDisabled as exc:
+            raise CommandError(str(exc))
+        total = 0
+        try:
+            while True:
+                try:
+                    sent = sheets_outbox.send_batch(sink, options['batch_size'])
+                except sheets_outbox.SheetSyncError as exc:
+                    self.stderr.write(self.style.WARNING(str(exc)))
+                    sent = 0
+                    if options['once']:
+                        break
+                total += sent
+                if sent:
+                    self.stdout.write(f"{sent} ligne(s) envoyee(s).")
+                    continue  # Il reste peut-etre d'autres lots
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Termine : {total} ligne(s) envoyee(s)."))
@@ -0,0 +1,62 @@
+# Fichier : stories/management/commands/transcode_audio.py
+# Le worker qui transcode les envois audio termines (voir stories/services/audio.py).
+#
+#   python manage.py transcode_audio          # tourne en continu
+#   python manage.py transcode_audio --once   # traite les envois en attente puis s'arrete
+#
+# Il faut ffmpeg et ffprobe sur la machine (FFMPEG_BINARY / FFPROBE_BINARY).
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from stories.models import AudioUpload
+from stories.services import audio
+
+
+class Command(BaseCommand):
+    help = "Transcode les enregistrements audio recus en Opus a bas debit et mesure leur duree."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help="Secondes d'attente quand il n'y a rien a transcoder.",
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help="Traite les envois en attente une fois puis s'arrete.",
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        try:
+            purged = audio.purge_stale()
+            if purged:
+                self.stdout.write(f"{purged} envoi(s) abandonne(s) supprime(s).")
+            while True:
+                upload = audio.claim_next()
+                if upload is None:
+                    if options['once']:
+                        break
+                    time.sleep(options['interval'])
+                    continue
+                try:
+                    ok = audio.process(upload)
+                except Exception as exc:
+                    # Erreur inattendue : on ne laisse pas l'envoi bloque "en cours"
+                    AudioUpload.objects.filter(pk=upload.pk).update(
+                        status=AudioUpload.Status.FAILED, error=str(exc)[:1000],
+                    )
+                    ok = False
+                if ok:
+                    done += 1
+                    self.stdout.write(f"Audio de l'histoire #{upload.story_id} pret.")
+                else:
+                    failed += 1
+                    upload.refresh_from_db()
+                    self.stderr.write(self.style.WARNING(
+                        f"Echec pour l'envoi {upload.id} : {upload.error}"
+                    ))
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(f"Termine : {done} audio(s) pret(s), {failed} echec(s)."))
@@ -0,0 +1,86 @@
+# Fichier : stories/metrics.py
+# Les mesures du service au format Prometheus (page /metrics).
+#
+# - par vue : duree des requetes, taille des reponses, nombre de requetes SQL
+#   (remplies par MetricsMiddleware, stories/middleware.py) ;
+# - metier : arbres crees (par statut), lignes envoyees ou non a Google Sheets.
+#
+# Avec gunicorn, chaque worker a ses propres compteurs. Si la variable
+# d'environnement PROMETHEUS_MULTIPROC_DIR est definie (gunicorn.conf.py le
+# fait), prometheus_client les ecrit dans des fichiers de ce dossier et
+# /metrics additionne ceux de tous les processus (workers et commandes comme
+# sync_sheets lancees sur la meme machine). Rien d'autre a installer.
+#
+# prometheus_client est importe au demarrage de chaque processus (par
+# stories/signals.py, qui compte les arbres crees) : ce module n'est pas une
+# integration optionnelle.
+#
+# /metrics est protege par un jeton (METRICS_TOKEN), envoye par le
+# collecteur dans `Authorization: Bearer <jeton>`. Pas une liste d'adresses :
+# derriere le proxy de Render, REMOTE_ADDR est toujours celle du proxy.
+
+import hmac
+import os
+
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram
+from prometheus_client import generate_latest, multiprocess
+
+REQUEST_DURATION = Histogram(
+    'sahel_http_request_duration_seconds',
+    "Duree des requetes HTTP, par vue.",
+    ['view', 'method', 'status'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+RESPONSE_SIZE = Histogram(
+    'sahel_http_response_size_bytes',
+    "Taille des reponses HTTP (sans les reponses en flux), par vue.",
+    ['view'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+DB_QUERIES = Histogram(
+    'sahel_http_db_queries',
+    "Nombre de requetes SQL par requete HTTP, par vue.",
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 200),
+)
+TREES_CREATED = Counter(
+    'sahel_trees_created_total',
+    "Plantations enregistrees, par statut de depart.",
+    ['status'],
+)
+SHEETS_ROWS = Counter(
+    'sahel_sheets_rows_total',
+    "Lignes envoyees a Google Sheets (sent) ou reprogrammees apres une erreur (failed).",
+    ['outcome'],
+)
+
+
+def view_name(request):
+    """Le nom de la vue (jamais le chemin : une serie par vue, pas par histoire)."""
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unresolved'
+
+
+def count_trees(trees):
+    for tree in trees:
+        TREES_CREATED.labels(status=tree.status).inc()
+
+
+def authorized(request):
+    """True si la requete porte le jeton METRICS_TOKEN. Sans jeton configure, personne."""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if not token:
+        return False
+    scheme, _, given = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(given.strip().encode(), token.encode())
+
+
+def render():
+    """(contenu, content type) de la page /metrics."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
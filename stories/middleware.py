@@ -0,0 +1,291 @@
+# Fichier : stories/middleware.py
+# Les middlewares de mesure.
+#
+# RequestTimingMiddleware mesure chaque requete : nombre de requetes SQL,
+# temps SQL, temps de la vue et temps du rendu (gabarit ou JSON de l'API).
+#
+# Les mesures partent dans l'en-tete `Server-Timing` (visible dans l'onglet
+# Reseau du navigateur) et, au-dela de REQUEST_TIMING_SLOW_MS, dans un log
+# "requete lente" avec les requetes SQL les plus repetees (les N+1).
+#
+# Desactive par defaut (REQUEST_TIMING_ENABLED) : Django retire alors le
+# middleware au demarrage (MiddlewareNotUsed), il ne coute rien.
+#
+# MetricsMiddleware remplit les histogrammes Prometheus (stories/metrics.py).
+#
+# Les deux marchent en WSGI et en ASGI (sans thread en plus pour les vues
+# async). Les requetes SQL sont vues par un "execute wrapper" pose sur chaque
+# connexion a sa creation ; il ecrit dans les compteurs de la requete en
+# cours, retrouves par une ContextVar (qui suit la requete jusque dans les
+# threads de sync_to_async, la ou l'ORM async travaille).
+#
+# StaticFilesMiddleware est WhiteNoise, en version utilisable sous ASGI.
+#
+# Les reponses en flux (pending_trees en NDJSON) font leurs requetes apres
+# le middleware : seules celles faites avant le premier octet sont comptees.
+
+import json
+import logging
+import re
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+from . import metrics
+
+from .streaming import aiter_file
+
+logger = logging.getLogger(__name__)
+
+# "IN (%s, %s, %s)" et "IN (%s)" sont la meme requete repetee
+IN_LIST_RE = re.compile(r'\((?:%s, )+%s\)')
+VALUES_RE = re.compile(r'(\((?:%s, )*%s\))(?:, \((?:%s, )*%s\))+')
+
+
+def normalize_sql(sql):
+    """Le texte de la requete, sans la longueur des listes de parametres."""
+    sql = VALUES_RE.sub(r'\1, ...', sql)
+    return IN_LIST_RE.sub('(%s, ...)', sql)
+
+
+# Les compteurs de la requete en cours (vide : personne n'ecoute)
+_recorders = ContextVar('stories_sql_recorders', default=())
+
+
+def _record_query(execute, sql, params, many, context):
+    recorders = _recorders.get()
+    if not recorders:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        for recorder in recorders:
+            recorder.add(sql, elapsed)
+
+
+def _install(sender=None, connection=None, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+def watch_queries():
+    """Pose l'execute wrapper sur toutes les connexions (deja ouvertes et futures)."""
+    connection_created.connect(_install, dispatch_uid='stories.middleware.watch_queries')
+    for connection in connections.all(initialized_only=True):
+        _install(connection=connection)
+
+
+@contextmanager
+def recording(recorder):
+    """Les requetes SQL faites dans ce bloc (et ses threads) vont a `recorder`."""
+    token = _recorders.set(_recorders.get() + (recorder,))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class QueryCounter:
+    """Compte les requetes SQL, sans plus."""
+
+    def __init__(self):
+        self.count = 0
+
+    def add(self, sql, elapsed):
+        self.count += 1
+
+
+class QueryRecorder:
+    """Compte et chronometre chaque requete SQL, regroupees par texte."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = defaultdict(lambda: [0, 0.0])  # sql -> [nombre, secondes]
+
+    def add(self, sql, elapsed):
+        self.count += 1
+        self.duration += elapsed
+        statement = self.statements[normalize_sql(sql)]
+        statement[0] += 1
+        statement[1] += elapsed
+
+    def top(self, limit):
+        """Les requetes les plus repetees : [{'sql', 'count', 'ms'}]."""
+        ranked = sorted(self.statements.items(), key=lambda item: (-item[1][0], -item[1][1]))
+        return [
+            {'sql': sql[:500], 'count': count, 'ms': round(seconds * 1000, 2)}
+            for sql, (count, seconds) in ranked[:limit]
+        ]
+
+
+class DualModeMiddleware:
+    """
+    Un middleware qui suit le mode de la pile : synchrone sous WSGI,
+    coroutine sous ASGI (Django n'a alors pas a l'envelopper dans un thread).
+    Les sous-classes ecrivent `before(request)` et `after(request, response, state)`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = self.before(request)
+        with recording(state['recorder']):
+            response = self.get_response(request)
+        return self.after(request, response, state)
+
+    async def __acall__(self, request):
+        state = self.before(request)
+        with recording(state['recorder']):
+            response = await self.get_response(request)
+        return self.after(request, response, state)
+
+
+class RequestTimingMiddleware(DualModeMiddleware):
+    """
+    Ajoute `Server-Timing: db;dur=..;desc="N queries", view;dur=.., render;dur=.., total;dur=..`
+    et journalise les requetes lentes. A placer en tete de MIDDLEWARE.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REQUEST_TIMING_ENABLED', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        watch_queries()
+        self.slow_ms = getattr(settings, 'REQUEST_TIMING_SLOW_MS', 500)
+        self.top_queries = getattr(settings, 'REQUEST_TIMING_TOP_QUERIES', 5)
+        if self.async_mode:
+            # Sinon Django appellerait ces crochets dans un thread (sync_to_async)
+            self.process_view = self.aprocess_view
+            self.process_template_response = self.aprocess_template_response
+
+    def before(self, request):
+        request._timing = {'view_start': None, 'view_end': None}
+        return {'recorder': QueryRecorder(), 'started': time.perf_counter()}
+
+    def after(self, request, response, state):
+        ended = time.perf_counter()
+        recorder = state['recorder']
+        marks = request._timing
+        view_ms = render_ms = 0.0
+        if marks['view_start'] is not None:
+            view_end = marks['view_end'] or ended  # Pas de rendu a part : la vue a tout fait
+            view_ms = (view_end - marks['view_start']) * 1000
+            if marks['view_end'] is not None:
+                render_ms = (ended - marks['view_end']) * 1000
+        timing = {
+            'queries': recorder.count,
+            'sql_ms': round(recorder.duration * 1000, 2),
+            'view_ms': round(view_ms, 2),
+            'render_ms': round(render_ms, 2),
+            'total_ms': round((ended - state['started']) * 1000, 2),
+        }
+        response['Server-Timing'] = (
+            f'db;dur={timing["sql_ms"]};desc="{timing["queries"]} queries", '
+            f'view;dur={timing["view_ms"]}, render;dur={timing["render_ms"]}, '
+            f'total;dur={timing["total_ms"]}'
+        )
+        if timing['total_ms'] >= self.slow_ms:
+            record = {
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                **timing,
+                'top_queries': recorder.top(self.top_queries),
+            }
+            logger.warning("slow request %s", json.dumps(record), extra={'timing': record})
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._timing['view_start'] = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # La vue a rendu la main ; le gabarit ou le JSON (DRF) est fabrique apres
+        request._timing['view_end'] = time.perf_counter()
+        return response
+
+    # En mode async, self.process_view *est* aprocess_view : on appelle la
+    # version de la classe, pas celle de l'instance
+    async def aprocess_view(self, request, view_func, view_args, view_kwargs):
+        return RequestTimingMiddleware.process_view(self, request, view_func, view_args, view_kwargs)
+
+    async def aprocess_template_response(self, request, response):
+        return RequestTimingMiddleware.process_template_response(self, request, response)
+
+
+class MetricsMiddleware(DualModeMiddleware):
+    """
+    Duree, taille de la reponse et nombre de requetes SQL de chaque requete,
+    par vue, pour /metrics. Desactive avec METRICS_ENABLED = False.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        watch_queries()
+        self.metrics = metrics
+
+    def before(self, request):
+        return {'recorder': QueryCounter(), 'started': time.perf_counter()}
+
+    def after(self, request, response, state):
+        elapsed = time.perf_counter() - state['started']
+        view = self.metrics.view_name(request)
+        self.metrics.REQUEST_DURATION.labels(
+            view=view, method=request.method, status=response.status_code,
+        ).observe(elapsed)
+        self.metrics.DB_QUERIES.labels(view=view).observe(state['recorder'].count)
+        if not response.streaming:
+            self.metrics.RESPONSE_SIZE.labels(view=view).observe(len(response.content))
+        return response
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+    """
+    WhiteNoise, utilisable directement sous ASGI : la recherche du fichier et
+    sa lecture passent par des threads, la boucle d'evenements ne bloque pas.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response=None, settings=settings):
+        super().__init__(get_response, settings)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        return super().__call__(request)
+
+    async def __acall__(self, request):
+        if self.autorefresh:
+            static_file = await sync_to_async(self.find_file)(request.path_info)
+        else:
+            static_file = self.files.get(request.path_info)
+        if static_file is None:
+            return await self.get_response(request)
+        response = await sync_to_async(self.serve)(static_file, request)
+        if response.file_to_stream is not None:
+            response.streaming_content = aiter_file(response.file_to_stream)
+        return response
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:36
+
+from django.db import migrations, models
+
+from stories import geohash
+
+
+def fill_geohash(apps, schema_editor):
+    # Calcule le geohash des plantations qui existent deja
+    TreePlanting = apps.get_model('stories', 'TreePlanting')
+    trees = TreePlanting.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    batch = []
+    for tree in trees.only('id', 'latitude', 'longitude').iterator(chunk_size=1000):
+        tree.geohash = geohash.encode(tree.latitude, tree.longitude)
+        batch.append(tree)
+        if len(batch) >= 1000:
+            TreePlanting.objects.bulk_update(batch, ['geohash'])
+            batch = []
+    if batch:
+        TreePlanting.objects.bulk_update(batch, ['geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0005_sheetoutbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treeplanting',
+            name='geohash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0006_treeplanting_geohash'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='treeplanting',
+            index=models.Index(fields=['status', 'planted_at', 'id'], name='tree_status_planted_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:39
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0008_event_capacity_attendees'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date_time', 'id'], name='event_date_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='story',
+            index=models.Index(fields=['published_at', 'id'], name='story_published_idx'),
+        ),
+    ]
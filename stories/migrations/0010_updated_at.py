@@ -0,0 +1,23 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0009_cursor_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name='story',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,80 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:41
+
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'stories_storysearch_fts'
+
+
+def create_search_index(apps, schema_editor):
+    # L'index depend de la base : GIN sur PostgreSQL, table FTS5 sur SQLite
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            'CREATE INDEX story_search_vector_gin '
+            'ON stories_storysearchdocument USING gin (vector)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            "title, keywords, body, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS story_search_vector_gin')
+    elif vendor == 'sqlite':
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+def fill_documents(apps, schema_editor):
+    # Indexe les histoires qui existent deja
+    Story = apps.get_model('stories', 'Story')
+    StorySearchDocument = apps.get_model('stories', 'StorySearchDocument')
+    rows = Story.objects.values_list('id', 'title', 'artisan__community', 'content')
+    StorySearchDocument.objects.bulk_create(
+        [
+            StorySearchDocument(story_id=story_id, title=title, keywords=community or '', body=content)
+            for story_id, title, community, content in rows.iterator(chunk_size=1000)
+        ],
+        batch_size=1000,
+    )
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(
+            "UPDATE stories_storysearchdocument SET vector = "
+            "setweight(to_tsvector('simple', title), 'A') || "
+            "setweight(to_tsvector('simple', keywords), 'B') || "
+            "setweight(to_tsvector('simple', body), 'C')"
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, title, keywords, body) '
+            'SELECT story_id, title, keywords, body FROM stories_storysearchdocument'
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0010_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StorySearchDocument',
+            fields=[
+                ('story', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='stories.story')),
+                ('title', models.TextField()),
+                ('keywords', models.TextField(blank=True)),
+                ('body', models.TextField(blank=True)),
+                ('vector', django.contrib.postgres.search.SearchVectorField(editable=False, null=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_documents, migrations.RunPython.noop),
+    ]
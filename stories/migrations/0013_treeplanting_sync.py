@@ -0,0 +1,32 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0012_audio_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='treeplanting',
+            name='client_recorded_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='treeplanting',
+            name='client_uuid',
+            field=models.UUIDField(blank=True, editable=False, null=True, unique=True),
+        ),
+        migrations.AddField(
+            model_name='treeplanting',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='treeplanting',
+            index=models.Index(fields=['planted_by', 'updated_at', 'id'], name='tree_sync_idx'),
+        ),
+    ]
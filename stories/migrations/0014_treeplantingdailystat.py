@@ -0,0 +1,58 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:51
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+
+
+def fill_stats(apps, schema_editor):
+    # Compte les plantations qui existent deja
+    TreePlanting = apps.get_model('stories', 'TreePlanting')
+    TreePlantingDailyStat = apps.get_model('stories', 'TreePlantingDailyStat')
+    rows = (
+        TreePlanting.objects
+        .annotate(day=TruncDate('planted_at'))
+        .values('day', 'story__artisan__community', 'story__artisan_id', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+    TreePlantingDailyStat.objects.bulk_create(
+        [
+            TreePlantingDailyStat(
+                date=row['day'],
+                community=row['story__artisan__community'] or '',
+                artisan_id=row['story__artisan_id'],
+                status=row['status'],
+                count=row['n'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0013_treeplanting_sync'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TreePlantingDailyStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('community', models.CharField(max_length=100)),
+                ('status', models.CharField(choices=[('pending', 'En attente - Promesse faite'), ('planted', 'Plante - Arbre en terre'), ('verified', 'Verifie - Arbre controle'), ('failed', 'Echoue - Impossible de planter')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('artisan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_tree_stats', to='stories.artisan')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['artisan', 'status'], name='tree_daily_stat_artisan_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'community', 'artisan', 'status'), name='tree_daily_stat_key')],
+            },
+        ),
+        migrations.RunPython(fill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.5 on 2026-10-18 10:54
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0014_treeplantingdailystat'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryTrendingScore',
+            fields=[
+                ('story', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending', serialize=False, to='stories.story')),
+                ('score', models.FloatField()),
+                ('views_seen', models.PositiveIntegerField(default=0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['-score'], name='story_trending_score_idx')],
+            },
+        ),
+    ]
@@ -1,7 +1,91 @@
 # Fichier : stories/models.py
-from django.db import models  # Pour creer des modeles de base de donnees
+import math  # Pour les calculs de distance
+import uuid  # Identifiants des sessions d'envoi audio
+
+from django.conf import settings  # Pour le modele utilisateur
+from django.contrib.postgres.search import SearchVectorField  # Index plein texte (PostgreSQL)
+from django.db import models, transaction  # Pour creer des modeles de base de donnees
 from django.utils import timezone  # Pour avoir l'heure actuelle
 from django.utils.translation import gettext_lazy as _  # Pour les traductions
+from django.db.models import Count, FloatField, Q, Value  # Pour construire des requetes
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt  # Maths en SQL
+
+from . import geohash  # Pour ranger les positions dans un index texte
+
+
+# Requetes geographiques sur les plantations (sans PostGIS)
+class TreePlantingQuerySet(models.QuerySet):
+    # Les plantations dans un rectangle (ouest, sud, est, nord), en degres
+    # ValueError si une valeur n'est pas finie ou si le rectangle est a l'envers ;
+    # il est ramene dans les limites de la Terre (voir geohash.normalize_bbox)
+    def within_bbox(self, west, south, east, north):
+        west, south, east, north = geohash.normalize_bbox(west, south, east, north)
+        # 1) Filtre grossier : quelques intervalles de geohash, lus sur l'index
+        coarse = Q()
+        for low, high in geohash.prefix_ranges(west, south, east, north):
+            if high is None:
+                coarse |= Q(geohash__gte=low)
+            else:
+                coarse |= Q(geohash__gte=low, geohash__lt=high)
+        # 2) Filtre exact sur les coordonnees, seulement pour les lignes restantes
+        return self.filter(coarse).filter(
+            latitude__range=(south, north),
+            longitude__range=(west, east),
+        )
+
+    # Ajoute la colonne `distance_km` (formule de haversine calculee en SQL)
+    def with_distance(self, latitude, longitude):
+        lat1 = Value(math.radians(float(latitude)))
+        lon1 = Value(math.radians(float(longitude)))
+        lat2 = Radians(Cast('latitude', FloatField()))
+        lon2 = Radians(Cast('longitude', FloatField()))
+        a = (
+            Power(Sin((lat2 - lat1) / 2), 2)
+            + Cos(lat1) * Cos(lat2) * Power(Sin((lon2 - lon1) / 2), 2)
+        )
+        return self.annotate(
+            distance_km=Value(2 * geohash.EARTH_RADIUS_KM) * ASin(Sqrt(a))
+        )
+
+    # Les plantations a moins de `radius_km` kilometres d'un point
+    # (deux rectangles si le cercle traverse l'antimeridien)
+    def near(self, latitude, longitude, radius_km):
+        boxes = geohash.bounding_boxes(latitude, longitude, radius_km)
+        nearby = self.within_bbox(*boxes[0])
+        for box in boxes[1:]:
+            nearby |= self.within_bbox(*box)
+        return (
+            nearby
+            .with_distance(latitude, longitude)
+            .filter(distance_km__lte=radius_km)
+        )
+
+
+# Requetes sur les histoires
+class StoryQuerySet(models.QuerySet):
+    # Le "plan" de l'API : tout ce que les serializers lisent, en un nombre fixe de requetes
+    def for_api(self):
+        artisans = (
+            Artisan.objects
+            .select_related('user')
+            .annotate(published_story_count=Count('stories', filter=Q(stories__published_at__isnull=False)))
+        )
+        return (
+            self
+            .prefetch_related(models.Prefetch('artisan', queryset=artisans))
+            .annotate(comments_count=Count('comments', distinct=True))
+        )
+
+    # Les histoires qui ont au moins une plantation dans le rectangle
+    def within_bbox(self, west, south, east, north):
+        trees = TreePlanting.objects.within_bbox(west, south, east, north)
+        return self.filter(id__in=trees.values('story_id'))
+
+    # Les histoires qui ont au moins une plantation pres d'un point
+    def near(self, latitude, longitude, radius_km):
+        trees = TreePlanting.objects.near(latitude, longitude, radius_km)
+        return self.filter(id__in=trees.values('story_id'))
+
 
 # Modele pour representer la plantation d'un arbre
 class TreePlanting(models.Model):
@@ -34,12 +118,55 @@ class TreePlanting(models.Model):
     )
     # La date et l'heure reelles ou l'arbre a ete plante (optionnel)
     actually_planted_at = models.DateTimeField(null=True, blank=True)
+    # Le geohash de la position, calcule automatiquement (vide sans coordonnees)
+    geohash = models.CharField(max_length=geohash.MAX_PRECISION, blank=True, editable=False, db_index=True)
+    # L'identifiant cree par l'appareil de terrain (rend les renvois sans effet)
+    client_uuid = models.UUIDField(null=True, blank=True, unique=True, editable=False)
+    # L'heure notee par l'appareil au moment de la plantation
+    client_recorded_at = models.DateTimeField(null=True, blank=True)
+    # La date de la derniere modification (les appareils tirent les changements depuis la derniere fois)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TreePlantingQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Pour parcourir la liste des arbres en attente page par page (curseur)
+            models.Index(fields=['status', 'planted_at', 'id'], name='tree_status_planted_idx'),
+            # Pour la synchronisation : les changements d'un planteur, dans l'ordre
+            models.Index(fields=['planted_by', 'updated_at', 'id'], name='tree_sync_idx'),
+        ]
+
+    # Au chargement, on retient l'histoire et le statut d'origine
+    # (les statistiques savent ainsi quelle case decrementer, voir stories/signals.py)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._stats_origin = (instance.__dict__.get('story_id'), instance.__dict__.get('status'))
+        return instance
+
+    # Avant de sauvegarder, on recalcule le geohash a partir des coordonnees
+    def save(self, *args, **kwargs):
+        self.geohash = self.compute_geohash()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and {'latitude', 'longitude'} & set(update_fields):
+            kwargs['update_fields'] = set(update_fields) | {'geohash'}
+        # Une transaction : les statistiques (post_save) sont mises a jour avec la ligne
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+        self._stats_origin = (self.story_id, self.status)
+
+    # Le geohash de la position actuelle (a utiliser aussi avant un bulk_create)
+    def compute_geohash(self):
+        if self.latitude is None or self.longitude is None:
+            return ''
+        return geohash.encode(self.latitude, self.longitude)
 
     # Methode pour marquer un arbre comme plante
     def mark_as_planted(self):
         self.status = self.Status.PLANTED  # Change le statut
         self.actually_planted_at = timezone.now()  # Met la date actuelle
-        self.save(update_fields=['status', 'actually_planted_at'])  # Sauvegarde
+        self.save(update_fields=['status', 'actually_planted_at', 'updated_at'])  # Sauvegarde
 
     # Comment afficher cet objet en texte
     def __str__(self):
@@ -71,10 +198,47 @@ class Story(models.Model):
     published_at = models.DateTimeField(null=True, blank=True)
     # Le nombre de vues de l'histoire
     views = models.PositiveIntegerField(default=0)
+    # L'enregistrement audio, deja transcode en petit format (voir stories/services/audio.py)
+    audio_file = models.FileField(upload_to='stories/audio/', blank=True)
+    # La duree de l'enregistrement en secondes, mesuree lors du transcodage
+    audio_duration = models.FloatField(null=True, blank=True, editable=False)
+    # La date de la derniere modification (sert de "version" pour les caches HTTP)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = StoryQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Pour la pagination par curseur de l'API (les plus recentes d'abord)
+            models.Index(fields=['published_at', 'id'], name='story_published_idx'),
+        ]
+
+    # Au chargement, on retient l'artisan et si l'histoire etait publiee
+    # (le nombre d'histoires publiees de l'artisan est dans le JSON de
+    # chacune de ses histoires, voir stories/signals.py)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._published_origin = (
+            instance.__dict__.get('artisan_id'),
+            instance.__dict__.get('published_at') is not None,
+        )
+        # L'artisan d'origine, pour deplacer les statistiques s'il change
+        instance._stats_artisan = instance.__dict__.get('artisan_id')
+        return instance
+
+    # Une transaction : les statistiques (post_save) suivent un changement d'artisan
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title  # Affiche le titre
 
+    # La duree de l'audio en secondes (None tant qu'il n'a pas ete transcode)
+    def get_duration(self):
+        return self.audio_duration
+
 # Modele pour representer une categorie
 class Category(models.Model):
     # Le nom de la categorie
@@ -95,6 +259,19 @@ class Tag(models.Model):
     def __str__(self):
         return self.name  # Affiche le nom
 
+# Requetes sur les evenements
+class EventQuerySet(models.QuerySet):
+    # Ajoute `attendee_count` et `is_registered` (pour `user`) en une seule requete
+    def with_attendance(self, user=None):
+        events = self.annotate(attendee_count=Count('attendees', distinct=True))
+        if user is not None and user.is_authenticated:
+            registrations = Event.attendees.through.objects.filter(
+                event_id=models.OuterRef('pk'), user_id=user.pk,
+            )
+            return events.annotate(is_registered=models.Exists(registrations))
+        return events.annotate(is_registered=Value(False))
+
+
 # Modele pour representer un evenement
 class Event(models.Model):
     # Le titre de l'evenement
@@ -105,6 +282,20 @@ class Event(models.Model):
     date_time = models.DateTimeField()
     # Le lieu de l'evenement
     location = models.CharField(max_length=200)
+    # Le nombre maximum de participants
+    capacity = models.PositiveIntegerField(default=50)
+    # Les utilisateurs inscrits a l'evenement
+    attendees = models.ManyToManyField('auth.User', related_name='registered_events', blank=True)
+    # La date de la derniere modification (sert de "version" pour les caches HTTP)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = EventQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Pour la pagination par curseur de l'API (par date)
+            models.Index(fields=['date_time', 'id'], name='event_date_time_idx'),
+        ]
 
     def __str__(self):
         return self.title  # Affiche le titre
@@ -121,4 +312,179 @@ class Comment(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return f"Commentaire par {self.author_name} sur {self.story.title}"
\ No newline at end of file
+        return f"Commentaire par {self.author_name} sur {self.story.title}"
+
+# Modele pour la "boite d'envoi" vers la Google Sheet des plantations
+# Une ligne est creee dans la meme transaction que la plantation,
+# puis la commande `manage.py sync_sheets` l'envoie plus tard par lots.
+class SheetOutbox(models.Model):
+    # La plantation concernee (on garde la ligne meme si la plantation disparait)
+    tree = models.ForeignKey(
+        TreePlanting,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='sheet_outbox',
+    )
+    # Les valeurs de la ligne a ajouter dans la feuille, dans l'ordre des colonnes
+    row = models.JSONField()
+    # La date de creation de la ligne
+    created_at = models.DateTimeField(auto_now_add=True)
+    # Combien de fois on a essaye de l'envoyer
+    attempts = models.PositiveIntegerField(default=0)
+    # Pas d'envoi avant cette date (attente apres un echec)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    # La date d'envoi reussi (vide tant que la ligne est en attente)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    # Le message de la derniere erreur d'envoi
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            # Index partiel : seules les lignes pas encore envoyees sont lues par le worker
+            models.Index(
+                fields=['next_attempt_at', 'id'],
+                condition=models.Q(sent_at__isnull=True),
+                name='sheet_outbox_pending_idx',
+            ),
+        ]
+
+    def __str__(self):
+        state = 'envoyee' if self.sent_at else 'en attente'
+        return f"Ligne Google Sheet #{self.pk} ({state})"
+
+
+# Modele pour le "document de recherche" d'une histoire
+# C'est le texte indexe par la recherche plein texte (voir stories/search.py) :
+# sur PostgreSQL, la colonne `vector` (avec un index GIN) ; sur SQLite, une
+# table virtuelle FTS5 remplie a partir de ces lignes.
+class StorySearchDocument(models.Model):
+    # L'histoire indexee (un seul document par histoire)
+    story = models.OneToOneField(
+        Story,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='search_document',
+    )
+    # Le titre (poids le plus fort dans le classement)
+    title = models.TextField()
+    # Les mots-cles : la communaute de l'artisan
+    keywords = models.TextField(blank=True)
+    # Le texte de l'histoire
+    body = models.TextField(blank=True)
+    # Le vecteur de recherche PostgreSQL (vide sur les autres bases)
+    vector = SearchVectorField(null=True, editable=False)
+    # La date de la derniere indexation
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Document de recherche pour '{self.title}'"
+
+
+# Modele pour une "session" d'envoi d'un fichier audio en plusieurs morceaux
+# Le client envoie le fichier par petits morceaux (PATCH) ; si la connexion
+# coupe, il demande ou on en est (`offset`) et reprend a partir de la.
+# Une fois complet, la commande `manage.py transcode_audio` le convertit.
+class AudioUpload(models.Model):
+    # Les etapes d'un envoi
+    class Status(models.TextChoices):
+        UPLOADING = 'uploading', _('En cours d\'envoi')
+        UPLOADED = 'uploaded', _('Recu - En attente de transcodage')
+        PROCESSING = 'processing', _('Transcodage en cours')
+        DONE = 'done', _('Termine')
+        FAILED = 'failed', _('Echoue')
+
+    # Un identifiant impossible a deviner (il apparait dans l'URL d'envoi)
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # L'histoire qui recevra l'audio
+    story = models.ForeignKey(Story, on_delete=models.CASCADE, related_name='audio_uploads')
+    # La personne qui envoie le fichier
+    uploaded_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='audio_uploads',
+    )
+    # Le nom du fichier d'origine
+    filename = models.CharField(max_length=255)
+    # La taille totale annoncee, en octets
+    size = models.PositiveBigIntegerField()
+    # L'empreinte SHA-256 (hexadecimale) du fichier complet, si le client la donne
+    sha256 = models.CharField(max_length=64, blank=True)
+    # Le nombre d'octets deja recus et ecrits sur le disque
+    offset = models.PositiveBigIntegerField(default=0)
+    # L'etape actuelle
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.UPLOADING)
+    # Le message de la derniere erreur
+    error = models.TextField(blank=True)
+    # Les dates de creation et de derniere modification
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Pour le worker (envois complets) et le menage (envois abandonnes)
+            models.Index(fields=['status', 'updated_at'], name='audio_upload_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"Envoi audio {self.filename} ({self.get_status_display()})"
+
+
+# Modele pour les statistiques d'impact, tenues a jour au fil de l'eau
+# Une ligne = le nombre d'arbres d'un artisan (et de sa communaute) avec un
+# statut donne, pour un jour de promesse. Les tableaux de bord lisent ces
+# quelques lignes au lieu de compter toutes les plantations a chaque fois.
+# Mise a jour : stories/services/impact_stats.py ; reconstruction :
+# `manage.py rebuild_stats`.
+class TreePlantingDailyStat(models.Model):
+    # Le jour de la promesse (TreePlanting.planted_at)
+    date = models.DateField()
+    # La communaute de l'artisan
+    community = models.CharField(max_length=100)
+    # L'artisan dont l'histoire a fait planter les arbres
+    artisan = models.ForeignKey(Artisan, on_delete=models.CASCADE, related_name='daily_tree_stats')
+    # Le statut des arbres comptes
+    status = models.CharField(max_length=10, choices=TreePlanting.Status.choices)
+    # Le nombre d'arbres
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            # Une seule ligne par case : les mises a jour font "INSERT ... ON CONFLICT"
+            models.UniqueConstraint(
+                fields=['date', 'community', 'artisan', 'status'],
+                name='tree_daily_stat_key',
+            ),
+        ]
+        indexes = [
+            # Pour les totaux par artisan
+            models.Index(fields=['artisan', 'status'], name='tree_daily_stat_artisan_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.community} #{self.artisan_id} {self.status}: {self.count}"
+
+
+# Le score "tendance" d'une histoire : vues, plantations et commentaires
+# recents, les plus anciens comptant de moins en moins (demi-vie).
+# Calcule par `manage.py compute_trending` (stories/services/trending.py),
+# lu tel quel par /api/stories/trending/.
+class StoryTrendingScore(models.Model):
+    # L'histoire notee (une ligne par histoire)
+    story = models.OneToOneField(Story, on_delete=models.CASCADE, primary_key=True, related_name='trending')
+    # log2 du score ramene a une date fixe : l'ordre ne change pas avec le temps,
+    # donc seules les histoires actives sont recalculees
+    score = models.FloatField()
+    # Story.views au dernier calcul (les nouvelles vues = la difference)
+    views_seen = models.PositiveIntegerField(default=0)
+    # La fin de la periode deja comptee
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # Pour lire le haut du classement sans trier toute la table
+            models.Index(fields=['-score'], name='story_trending_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.story_id}: {self.score:.2f}"
@@ -0,0 +1,67 @@
+# Fichier : stories/pagination.py
+# Pagination "par curseur" pour les grandes listes de l'API.
+#
+# PageNumberPagination fait un COUNT(*) puis un OFFSET a chaque page : plus
+# on va loin dans la liste, plus c'est lent. Ici, chaque page repart de la
+# derniere ligne vue (curseur opaque), en lisant un index trie, et le total
+# n'est pas calcule. `?count=approximate` ajoute un total estime a partir des
+# statistiques du planificateur de PostgreSQL (compte exact sur les autres bases).
+
+import json
+
+from django.db import connections
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+def estimate_count(queryset):
+    """Nombre de lignes estime par PostgreSQL (EXPLAIN), sans parcourir la table."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+
+class ApproximateCountCursorPagination(CursorPagination):
+    count_query_param = 'count'
+    count_query_value = 'approximate'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.count_query_param) == self.count_query_value:
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        body = {
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+        }
+        if self.count is not None:
+            body['count'] = self.count
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties']['count'] = {
+            'type': 'integer',
+            'description': f'Estimated total, only with ?{self.count_query_param}={self.count_query_value}.',
+        }
+        return response_schema
+
+
+# Les histoires publiees, de la plus recente a la plus ancienne
+class StoryCursorPagination(ApproximateCountCursorPagination):
+    ordering = ('-published_at', '-id')
+
+
+# Les evenements a venir, du plus proche au plus lointain
+class EventCursorPagination(ApproximateCountCursorPagination):
+    ordering = ('date_time', 'id')
@@ -0,0 +1,31 @@
+# Fichier : stories/renderers.py
+# Des "renderers" DRF supplementaires : ils choisissent le format de la reponse.
+
+import json
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def ndjson_line(item):
+    """Un objet JSON sur une seule ligne, termine par un retour a la ligne."""
+    return json.dumps(item, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')) + '\n'
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    JSON "une ligne par objet" (`?format=ndjson`).
+
+    Les grandes listes sont envoyees en streaming directement par la vue ;
+    ce renderer sert pour les petites reponses (erreurs par exemple).
+    """
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        items = data if isinstance(data, list) else [data]
+        return ''.join(ndjson_line(item) for item in items).encode(self.charset)
@@ -0,0 +1,174 @@
+# Fichier : stories/search.py
+# Recherche plein texte dans les histoires, classee par pertinence.
+#
+# Chaque histoire a un StorySearchDocument (titre, communaute de l'artisan,
+# texte), mis a jour a chaque sauvegarde par les signaux. La recherche
+# elle-meme depend de la base :
+# - PostgreSQL : colonne `vector` (tsvector) avec un index GIN, SearchRank ;
+# - SQLite (en local) : table virtuelle FTS5, classement bm25 ;
+# - autre base : simple `icontains`, sans classement.
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+from .models import Story, StorySearchDocument
+
+# Le nom de la table FTS5 creee par la migration 0011 (SQLite seulement)
+FTS_TABLE = 'stories_storysearch_fts'
+# Poids des colonnes : titre > mots-cles > texte
+WEIGHTS = {'title': 'A', 'keywords': 'B', 'body': 'C'}
+BM25_WEIGHTS = '10.0, 5.0, 1.0'
+
+
+def _config():
+    # "simple" : pas de racinisation, car les histoires sont en plusieurs langues
+    return getattr(settings, 'SEARCH_CONFIG', 'simple')
+
+
+def _document_rows(story_ids=None):
+    stories = Story.objects.all()
+    if story_ids is not None:
+        stories = stories.filter(id__in=story_ids)
+    return stories.values_list('id', 'title', 'artisan__community', 'content')
+
+
+class PostgresSearchBackend:
+    def refresh(self, story_ids=None):
+        documents = StorySearchDocument.objects.all()
+        if story_ids is not None:
+            documents = documents.filter(story_id__in=story_ids)
+        vector = None
+        for column, weight in WEIGHTS.items():
+            part = SearchVector(column, weight=weight, config=_config())
+            vector = part if vector is None else vector + part
+        documents.update(vector=vector)
+
+    def remove(self, story_ids):
+        pass  # Le document est supprime en cascade avec l'histoire
+
+    def search(self, queryset, query):
+        search_query = SearchQuery(query, search_type='websearch', config=_config())
+        return (
+            queryset
+            .filter(search_document__vector=search_query)
+            .annotate(search_rank=SearchRank(F('search_document__vector'), search_query))
+        )
+
+
+class SqliteSearchBackend:
+    def refresh(self, story_ids=None):
+        with connection.cursor() as cursor:
+            if story_ids is None:
+                cursor.execute(f'DELETE FROM {FTS_TABLE}')
+                where, params = '', []
+            else:
+                story_ids = list(story_ids)
+                placeholders = ', '.join(['%s'] * len(story_ids))
+                cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', story_ids)
+                where, params = f'WHERE story_id IN ({placeholders})', story_ids
+            cursor.execute(
+                f'INSERT INTO {FTS_TABLE} (rowid, title, keywords, body) '
+                f'SELECT story_id, title, keywords, body FROM {StorySearchDocument._meta.db_table} {where}',
+                params,
+            )
+
+    def remove(self, story_ids):
+        story_ids = list(story_ids)
+        placeholders = ', '.join(['%s'] * len(story_ids))
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid IN ({placeholders})', story_ids)
+
+    def _match(self, query):
+        # Chaque mot entre guillemets : pas d'operateurs FTS5 venant de l'utilisateur
+        words = ['"%s"' % word.replace('"', '""') for word in query.split()]
+        return ' '.join(words)
+
+    def search(self, queryset, query):
+        match = self._match(query)
+        story_table = Story._meta.db_table
+        return (
+            queryset
+            .filter(id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match]))
+            .annotate(search_rank=RawSQL(
+                # bm25 : plus petit = plus pertinent, on inverse le signe
+                f'SELECT -bm25({FTS_TABLE}, {BM25_WEIGHTS}) FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "{story_table}"."id"',
+                [match],
+                output_field=FloatField(),
+            ))
+        )
+
+
+class BasicSearchBackend:
+    def refresh(self, story_ids=None):
+        pass
+
+    def remove(self, story_ids):
+        pass
+
+    def search(self, queryset, query):
+        match = Q()
+        for word in query.split():
+            match &= (
+                Q(search_document__title__icontains=word)
+                | Q(search_document__keywords__icontains=word)
+                | Q(search_document__body__icontains=word)
+            )
+        return queryset.filter(match).annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+
+def get_backend():
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        return SqliteSearchBackend()
+    return BasicSearchBackend()
+
+
+def index_stories(story_ids):
+    """Met a jour les documents (et l'index) de quelques histoires."""
+    story_ids = set(story_ids)
+    found = set()
+    for story_id, title, community, content in _document_rows(story_ids):
+        StorySearchDocument.objects.update_or_create(
+            story_id=story_id,
+            defaults={'title': title, 'keywords': community or '', 'body': content},
+        )
+        found.add(story_id)
+    backend = get_backend()
+    if found:
+        backend.refresh(found)
+    if story_ids - found:
+        backend.remove(story_ids - found)  # Histoires supprimees entre-temps
+
+
+def remove_stories(story_ids):
+    get_backend().remove(story_ids)
+
+
+def rebuild(batch_size=1000):
+    """Reconstruit tous les documents puis tout l'index. Retourne le nombre d'histoires."""
+    StorySearchDocument.objects.all().delete()
+    batch = []
+    total = 0
+    for story_id, title, community, content in _document_rows().iterator(chunk_size=batch_size):
+        batch.append(StorySearchDocument(
+            story_id=story_id, title=title, keywords=community or '', body=content,
+        ))
+        if len(batch) >= batch_size:
+            StorySearchDocument.objects.bulk_create(batch)
+            total += len(batch)
+            batch = []
+    if batch:
+        StorySearchDocument.objects.bulk_create(batch)
+        total += len(batch)
+    get_backend().refresh()
+    return total
+
+
+def search(queryset, query):
+    """Filtre `queryset` sur `query`, avec une annotation `search_rank` (plus grand = meilleur)."""
+    return get_backend().search(queryset, query).order_by('-search_rank', '-id')
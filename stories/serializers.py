@@ -3,10 +3,15 @@
 # Ils transforment les objets Python en JSON pour le frontend,
 # et transforment le JSON en objets Python pour la sauvegarde.
 
+from datetime import timedelta           # Pour les marges de temps
+from decimal import Decimal              # Coordonnees exactes
+
 from rest_framework import serializers   # Aide avec JSON <-> Python
+from django.conf import settings         # Pour lire nos reglages
+from django.urls import reverse          # Construit les liens a partir des noms d'URL
 from django.utils import timezone        # Gere le temps et la date
 from django.contrib.auth.models import User  # Modele d'utilisateur integre de Django
-from .models import Story, Artisan, Category, Tag, Comment, Event  # Nos modeles de donnees
+from .models import Story, Artisan, Category, Tag, Comment, Event, TreePlanting  # Nos modeles de donnees
 
 
 # Transforme un utilisateur Django en JSON (seulement les informations de base)
@@ -44,8 +49,12 @@ class ArtisanSerializer(serializers.ModelSerializer):
         read_only_fields = ["created_at"]
 
     # Compte seulement les histoires qui sont publiees
+    # (lu dans l'annotation de Story.objects.for_api() quand elle existe)
     def get_story_count(self, obj):
-        return obj.stories.filter(published_at__isnull=False).count()
+        count = getattr(obj, 'published_story_count', None)
+        if count is None:
+            count = obj.stories.filter(published_at__isnull=False).count()
+        return count
 
 
 # Commentaires laisses par les personnes sur une histoire
@@ -64,69 +73,63 @@ class CommentSerializer(serializers.ModelSerializer):
 
 
 # Evenements comme des festivals ou des ateliers
+# Les places et l'inscription viennent des annotations de
+# Event.objects.with_attendance(user) : aucune requete par evenement.
 class EventSerializer(serializers.ModelSerializer):
     available_slots = serializers.SerializerMethodField()  # Combien de places restantes
     is_full = serializers.SerializerMethodField()          # L'evenement est-il complet ?
+    is_registered = serializers.SerializerMethodField()    # Cet utilisateur est-il inscrit ?
     can_register = serializers.SerializerMethodField()     # Cet utilisateur peut-il s'inscrire ?
 
     class Meta:
         model = Event
         fields = [
             'id', 'title', 'description', 'date_time', 'location', 'capacity',
-            'available_slots', 'is_full', 'can_register'
+            'available_slots', 'is_full', 'is_registered', 'can_register'
         ]
-        read_only_fields = ['available_slots', 'is_full', 'can_register']
+        read_only_fields = ['available_slots', 'is_full', 'is_registered', 'can_register']
+
+    # Nombre d'inscrits (annotation `attendee_count` si disponible)
+    def _attendee_count(self, obj):
+        count = getattr(obj, 'attendee_count', None)
+        if count is None:
+            count = obj.attendees.count()
+        return count
 
     # Combien de places vides restantes
     def get_available_slots(self, obj):
-        return obj.capacity - obj.attendees.count()
+        return max(obj.capacity - self._attendee_count(obj), 0)
 
     # L'evenement est-il deja complet ?
     def get_is_full(self, obj):
-        return obj.attendees.count() >= obj.capacity
-
-    # L'utilisateur actuel peut-il s'inscrire ?
+        return self._attendee_count(obj) >= obj.capacity
+
+    # L'utilisateur actuel est-il deja inscrit ?
+    def get_is_registered(self, obj):
+        registered = getattr(obj, 'is_registered', None)
+        if registered is None:
+            request = self.context.get('request')
+            if not (request and request.user.is_authenticated):
+                return False
+            registered = obj.attendees.filter(id=request.user.id).exists()
+        return registered
+
+    # L'utilisateur actuel peut-il s'inscrire ? (connecte, pas inscrit, et il reste de la place)
     def get_can_register(self, obj):
         request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return not obj.attendees.filter(id=request.user.id).exists()
-        return False
+        if not (request and request.user.is_authenticated):
+            return False
+        return not self.get_is_registered(obj) and not self.get_is_full(obj)
 
 
 # Serializer pour creer ou mettre a jour une histoire
 class StoryWriteSerializer(serializers.ModelSerializer):
-    category_id = serializers.PrimaryKeyRelatedField(
-        queryset=Category.objects.all(),
-        source='category',   # Se connecte au champ reel dans le modele
-        write_only=True,
-        required=False,
-        allow_null=True
-    )
-    tag_ids = serializers.PrimaryKeyRelatedField(
-        queryset=Tag.objects.all(),
-        source='tags',
-        many=True,
-        write_only=True,
-        required=False
-    )
-
     class Meta:
         model = Story
-        fields = [
-            'title', 'transcript', 'audio_file', 'location', 'latitude', 'longitude',
-            'category_id', 'tag_ids'
-        ]
+        fields = ['title', 'content']
 
-    # Verifie les regles du fichier audio
-    def validate_audio_file(self, value):
-        if value:
-            max_size = 10 * 1024 * 1024  # 10 MB maximum
-            if value.size > max_size:
-                raise serializers.ValidationError("Fichier audio trop volumineux. Taille max: 10MB.")
-            valid_extensions = ['.mp3', '.wav', '.ogg', '.m4a']
-            if not any(value.name.lower().endswith(ext) for ext in valid_extensions):
-                raise serializers.ValidationError("Format de fichier non supporte.")
-        return value
+    # L'audio n'est plus envoye ici : il passe par /api/stories/<id>/audio-uploads/
+    # (envoi par morceaux, voir stories/services/audio.py)
 
     # Lors de la sauvegarde, lie l'histoire a l'artisan connecte
     def create(self, validated_data):
@@ -137,56 +140,129 @@ class StoryWriteSerializer(serializers.ModelSerializer):
 
 
 # Serializer pour lire les details d'une histoire (pour le frontend)
+# Les compteurs viennent des annotations de Story.objects.for_api() :
+# une page de 10 histoires coute le meme nombre de requetes qu'une page de 1.
 class StoryReadSerializer(serializers.ModelSerializer):
     artisan = ArtisanSerializer(read_only=True)     # Montre les infos du conteur
-    category = CategorySerializer(read_only=True)   # Montre les infos de la categorie
-    tags = TagSerializer(many=True, read_only=True) # Montre les tags
     comments_count = serializers.SerializerMethodField()
-    average_rating = serializers.SerializerMethodField()
-    duration = serializers.SerializerMethodField()
     is_published = serializers.SerializerMethodField()
+    duration = serializers.SerializerMethodField()
+    audio_url = serializers.SerializerMethodField()
 
     class Meta:
         model = Story
         fields = [
-            'id', 'title', 'transcript', 'audio_file', 'location', 'latitude', 'longitude',
-            'artisan', 'category', 'tags', 'comments_count', 'average_rating', 'duration',
-            'created_at', 'published_at', 'is_published', 'views'
+            'id', 'title', 'content', 'artisan', 'comments_count',
+            'published_at', 'is_published', 'views', 'duration', 'audio_url'
         ]
-        read_only_fields = ['created_at', 'published_at', 'views']
+        read_only_fields = ['published_at', 'views']
 
-    # Compte les commentaires actifs
+    # Compte les commentaires (annotation `comments_count` si disponible)
     def get_comments_count(self, obj):
-        return obj.comments.filter(active=True).count()
+        count = getattr(obj, 'comments_count', None)
+        if count is None:
+            count = obj.comments.count()
+        return count
 
-    # Note moyenne de l'histoire
-    def get_average_rating(self, obj):
-        ratings = obj.ratings.all()
-        if ratings.exists():
-            return round(sum(r.rating for r in ratings) / ratings.count(), 1)
-        return None
+    # Verifie si l'histoire est publiee
+    def get_is_published(self, obj):
+        return obj.published_at is not None
 
-    # Retourne la duree si l'histoire a un audio
+    # La duree de l'audio en secondes, mesuree au transcodage (None sans audio)
     def get_duration(self, obj):
-        if hasattr(obj, 'duration'):
-            return obj.duration
-        return None
+        return obj.get_duration()
 
-    # Verifie si l'histoire est publiee
-    def get_is_published(self, obj):
-        return obj.is_published
+    # Le lien de lecture (en streaming, avec les requetes Range)
+    def get_audio_url(self, obj):
+        if not obj.audio_file:
+            return None
+        return reverse('story_audio', kwargs={'id': obj.id})
 
 
 # Serializer intelligent qui choisit la bonne version
-class StorySerializer(serializers.ModelSerializer):
-    def to_representation(self, instance):
-        # Utilise le serializer "read" lors de l'envoi de donnees
-        return StoryReadSerializer(instance, context=self.context).to_representation(instance)
-
+# Il herite de StoryReadSerializer pour la lecture : une seule instance sert
+# pour toute la liste, au lieu d'un nouveau serializer par histoire.
+class StorySerializer(StoryReadSerializer):
     def to_internal_value(self, data):
         # Utilise le serializer "write" lors de la reception de donnees
         return StoryWriteSerializer(context=self.context).to_internal_value(data)
 
-    class Meta:
-        model = Story
-        fields = '__all__'  # Prend tout depuis le modele
\ No newline at end of file
+    class Meta(StoryReadSerializer.Meta):
+        pass
+
+
+
+# Le filtre d'un changement de statut en masse (a la place d'une liste d'ids)
+class TreeFilterSerializer(serializers.Serializer):
+    story = serializers.IntegerField(required=False, min_value=1)
+    status = serializers.ChoiceField(choices=TreePlanting.Status.choices, required=False)
+    planted_by = serializers.CharField(required=False, max_length=100)
+    planted_after = serializers.DateTimeField(required=False)
+    planted_before = serializers.DateTimeField(required=False)
+
+    # Construit le queryset des arbres choisis a partir des donnees validees
+    @staticmethod
+    def to_queryset(data):
+        lookups = {
+            'story': 'story_id',
+            'status': 'status',
+            'planted_by': 'planted_by',
+            'planted_after': 'planted_at__gte',
+            'planted_before': 'planted_at__lt',
+        }
+        return TreePlanting.objects.filter(**{
+            lookups[name]: value for name, value in data.items()
+        })
+
+
+# Serializer pour changer le statut de beaucoup d'arbres d'un coup
+class TreeTransitionSerializer(serializers.Serializer):
+    status = serializers.ChoiceField(choices=TreePlanting.Status.choices)
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    filter = TreeFilterSerializer(required=False)
+    # La vraie date de plantation (par defaut : maintenant), pour le statut "planted"
+    actually_planted_at = serializers.DateTimeField(required=False)
+
+    # Il faut soit des ids, soit un filtre (pas les deux)
+    def validate(self, data):
+        if ('ids' in data) == ('filter' in data):
+            raise serializers.ValidationError("Donner soit 'ids', soit 'filter'.")
+        if 'filter' in data and not data['filter']:
+            raise serializers.ValidationError({'filter': "Le filtre ne peut pas etre vide."})
+        return data
+
+
+
+# Une plantation notee hors ligne par un appareil de terrain
+class FieldPlantingSerializer(serializers.Serializer):
+    uuid = serializers.UUIDField()
+    story = serializers.IntegerField(min_value=1)
+    # Les GPS donnent souvent plus de 6 decimales : on arrondit au lieu de refuser
+    latitude = serializers.FloatField(min_value=-90, max_value=90, required=False, allow_null=True)
+    longitude = serializers.FloatField(min_value=-180, max_value=180, required=False, allow_null=True)
+    recorded_at = serializers.DateTimeField()
+
+    def validate_latitude(self, value):
+        return None if value is None else Decimal(str(round(value, 6)))
+
+    def validate_longitude(self, value):
+        return None if value is None else Decimal(str(round(value, 6)))
+
+    # L'horloge de l'appareil peut avancer un peu, pas d'un jour
+    def validate_recorded_at(self, value):
+        if value > timezone.now() + timedelta(days=1):
+            raise serializers.ValidationError("Date dans le futur.")
+        return value
+
+
+# Le lot envoye par un appareil : des plantations et son dernier watermark
+class FieldSyncSerializer(serializers.Serializer):
+    # Les plantations sont validees une par une par la vue (une erreur ne bloque pas le lot)
+    records = serializers.ListField(child=serializers.DictField(), allow_empty=True)
+    watermark = serializers.CharField(required=False, allow_blank=True)
+
+    def validate_records(self, value):
+        limit = getattr(settings, 'SYNC_MAX_RECORDS', 1000)
+        if len(value) > limit:
+            raise serializers.ValidationError(f"Au plus {limit} plantations par envoi.")
+        return value
@@ -0,0 +1,308 @@
+# stories/services/audio.py
+# Envoi de l'audio des histoires en plusieurs morceaux, puis transcodage.
+#
+# Le fichier arrive par morceaux (PATCH) dans un fichier `.part` sur le
+# disque : chaque morceau est copie par petits blocs depuis la requete, sans
+# jamais garder le fichier entier en memoire. `AudioUpload.offset` dit combien
+# d'octets sont deja ecrits ; apres une coupure, le client reprend de la.
+#
+# Quand tout est arrive (et que l'empreinte SHA-256 correspond), la commande
+# `manage.py transcode_audio` convertit le fichier en Opus mono a bas debit
+# avec ffmpeg, mesure sa duree avec ffprobe et l'attache a l'histoire.
+#
+# Le worker doit voir le meme disque que le serveur web (AUDIO_UPLOAD_DIR et
+# MEDIA_ROOT) et avoir ffmpeg : ce n'est pas le cas du deploiement Render,
+# ou les envois sont donc coupes (AUDIO_UPLOADS_ENABLED, voir settings.py).
+
+import base64
+import binascii
+import fcntl
+import hashlib
+import os
+import subprocess
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from stories.models import AudioUpload, Story
+
+# Les formats acceptes a l'envoi (ffmpeg sait tous les lire)
+AUDIO_EXTENSIONS = ('.mp3', '.wav', '.ogg', '.opus', '.m4a', '.aac', '.amr', '.3gp', '.webm')
+# Taille des blocs copies de la requete vers le disque
+COPY_BUFFER = 64 * 1024
+# Le format produit par le transcodage
+OUTPUT_EXTENSION = '.ogg'
+# Au-dela de ce temps "en cours", le worker qui transcodait est mort (ffmpeg
+# s'arrete de toute facon apres 30 minutes) : l'envoi est repris
+PROCESSING_TIMEOUT_MINUTES = 60
+
+
+class AudioUploadError(Exception):
+    """L'envoi ne peut pas continuer (morceau invalide, empreinte fausse...)."""
+
+
+class UploadBusy(AudioUploadError):
+    """Un autre morceau du meme envoi est en train d'etre ecrit."""
+
+
+class OffsetMismatch(AudioUploadError):
+    """Le client n'envoie pas le morceau attendu ; `offset` est la bonne position."""
+
+    def __init__(self, offset):
+        self.offset = offset
+        super().__init__(f"Le prochain morceau doit commencer a l'octet {offset}.")
+
+
+def enabled():
+    """Les envois ne sont acceptes que la ou un worker peut les transcoder."""
+    return getattr(settings, 'AUDIO_UPLOADS_ENABLED', False)
+
+
+def upload_dir():
+    return Path(getattr(settings, 'AUDIO_UPLOAD_DIR', settings.BASE_DIR / 'tmp' / 'audio_uploads'))
+
+
+def part_path(upload):
+    """Le fichier ou les morceaux de cet envoi sont assembles."""
+    return upload_dir() / f'{upload.id}.part'
+
+
+def max_size():
+    return getattr(settings, 'AUDIO_UPLOAD_MAX_SIZE', 200 * 1024 * 1024)
+
+
+def max_chunk_size():
+    return getattr(settings, 'AUDIO_UPLOAD_CHUNK_MAX_SIZE', 8 * 1024 * 1024)
+
+
+def validate_new_upload(filename, size):
+    """Verifie le nom et la taille annonces avant d'ouvrir une session."""
+    if not filename.lower().endswith(AUDIO_EXTENSIONS):
+        raise AudioUploadError("Format de fichier non supporte.")
+    if size <= 0:
+        raise AudioUploadError("Le fichier est vide.")
+    if size > max_size():
+        raise AudioUploadError(f"Fichier audio trop volumineux. Taille max: {max_size()} octets.")
+
+
+def parse_checksum(header):
+    """
+    Lit un en-tete `Upload-Checksum: sha256 <base64>` et retourne l'empreinte brute.
+
+    Retourne None si l'en-tete est absent.
+    """
+    if not header:
+        return None
+    algorithm, _, value = header.partition(' ')
+    if algorithm.lower() != 'sha256':
+        raise AudioUploadError("Seul l'algorithme sha256 est accepte.")
+    try:
+        digest = base64.b64decode(value.strip(), validate=True)
+    except (binascii.Error, ValueError):
+        raise AudioUploadError("Empreinte du morceau illisible.")
+    if len(digest) != hashlib.sha256().digest_size:
+        raise AudioUploadError("Empreinte du morceau illisible.")
+    return digest
+
+
+def file_sha256(path):
+    """L'empreinte SHA-256 d'un fichier, lu par blocs."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def receive_chunk(upload, client_offset, stream, length, checksum=None):
+    """
+    Ecrit un morceau de `length` octets lu dans `stream` a la position `client_offset`.
+
+    Le fichier `.part` est verrouille pendant l'ecriture (flock) : deux
+    morceaux du meme envoi ne peuvent pas s'ecrire en meme temps, et aucune
+    transaction n'est gardee ouverte pendant que les octets arrivent.
+
+    Sans empreinte, les octets recus avant une coupure sont gardes (le client
+    reprendra juste apres). Avec une empreinte, le morceau est tout ou rien.
+    Retourne l'envoi a jour.
+    """
+    path = part_path(upload)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with os.fdopen(os.open(path, os.O_RDWR | os.O_CREAT, 0o600), 'r+b') as f:
+        try:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadBusy("Un autre morceau de cet envoi est en cours d'ecriture.")
+
+        # Relu sous le verrou : l'offset ne peut plus changer pendant l'ecriture
+        upload.refresh_from_db()
+        if upload.status != AudioUpload.Status.UPLOADING:
+            raise AudioUploadError("Cet envoi est deja termine.")
+        if client_offset != upload.offset:
+            raise OffsetMismatch(upload.offset)
+        if upload.offset + length > upload.size:
+            raise AudioUploadError("Le morceau depasse la taille annoncee du fichier.")
+
+        # Des octets ecrits apres le dernier offset enregistre (ecriture
+        # interrompue) ne comptent pas : on les efface
+        f.seek(upload.offset)
+        f.truncate()
+        digest = hashlib.sha256()
+        written = 0
+        while written < length:
+            block = stream.read(min(COPY_BUFFER, length - written))
+            if not block:
+                break  # Connexion coupee
+            f.write(block)
+            digest.update(block)
+            written += len(block)
+
+        if checksum is not None and (written != length or digest.digest() != checksum):
+            f.truncate(upload.offset)
+            raise AudioUploadError("L'empreinte du morceau ne correspond pas.")
+        f.flush()
+        os.fsync(f.fileno())
+
+        upload.offset += written
+        if upload.offset == upload.size:
+            _finish(upload)
+        upload.save(update_fields=['offset', 'status', 'error', 'updated_at'])
+    return upload
+
+
+def _finish(upload):
+    """Tous les octets sont la : verifie l'empreinte du fichier complet."""
+    if upload.sha256 and file_sha256(part_path(upload)) != upload.sha256.lower():
+        discard(upload)
+        upload.status = AudioUpload.Status.FAILED
+        upload.error = "L'empreinte du fichier complet ne correspond pas."
+    else:
+        upload.status = AudioUpload.Status.UPLOADED
+        upload.error = ''
+
+
+def discard(upload):
+    """Supprime le fichier temporaire d'un envoi."""
+    part_path(upload).unlink(missing_ok=True)
+
+
+# -------------------------------------------------------------------
+# Transcodage (lance par `manage.py transcode_audio`)
+# -------------------------------------------------------------------
+def transcode(source, destination):
+    """Convertit `source` en Opus mono a bas debit (la voix reste claire)."""
+    bitrate = getattr(settings, 'AUDIO_TRANSCODE_BITRATE', '24k')
+    subprocess.run(
+        [
+            getattr(settings, 'FFMPEG_BINARY', 'ffmpeg'),
+            '-nostdin', '-y', '-v', 'error',
+            '-i', str(source),
+            '-vn', '-ac', '1', '-c:a', 'libopus', '-b:a', bitrate,
+            str(destination),
+        ],
+        check=True, capture_output=True, timeout=30 * 60,
+    )
+
+
+def probe_duration(path):
+    """La duree d'un fichier audio en secondes, lue par ffprobe."""
+    result = subprocess.run(
+        [
+            getattr(settings, 'FFPROBE_BINARY', 'ffprobe'),
+            '-v', 'error', '-show_entries', 'format=duration',
+            '-of', 'default=noprint_wrappers=1:nokey=1',
+            str(path),
+        ],
+        check=True, capture_output=True, text=True, timeout=60,
+    )
+    return round(float(result.stdout.strip()), 3)
+
+
+def claim_next():
+    """
+    Reserve le prochain envoi complet a transcoder (plusieurs workers possibles).
+
+    Un envoi reste "en cours" si son worker meurt pendant le transcodage
+    (redemarrage, OOM) : passe AUDIO_PROCESSING_TIMEOUT_MINUTES, il est
+    reserve a nouveau, comme un envoi qui vient d'arriver.
+    """
+    minutes = getattr(settings, 'AUDIO_PROCESSING_TIMEOUT_MINUTES', PROCESSING_TIMEOUT_MINUTES)
+    abandoned = Q(
+        status=AudioUpload.Status.PROCESSING,
+        updated_at__lt=timezone.now() - timedelta(minutes=minutes),
+    )
+    with transaction.atomic():
+        upload = (
+            AudioUpload.objects
+            .select_for_update(skip_locked=True)
+            .filter(Q(status=AudioUpload.Status.UPLOADED) | abandoned)
+            .order_by('updated_at')
+            .first()
+        )
+        if upload is None:
+            return None
+        upload.status = AudioUpload.Status.PROCESSING
+        upload.save(update_fields=['status', 'updated_at'])
+    return upload
+
+
+def process(upload):
+    """
+    Transcode un envoi et attache le resultat (et sa duree) a l'histoire.
+
+    Retourne True si l'histoire a recu son audio, False si l'envoi a echoue.
+    """
+    source = part_path(upload)
+    output = source.with_suffix(OUTPUT_EXTENSION)
+    try:
+        transcode(source, output)
+        duration = probe_duration(output)
+    except (OSError, ValueError, subprocess.SubprocessError) as exc:
+        output.unlink(missing_ok=True)
+        # Le message de ffmpeg est plus utile que "returned non-zero exit status 1"
+        error = getattr(exc, 'stderr', None) or str(exc)
+        if isinstance(error, bytes):
+            error = error.decode(errors='replace')
+        upload.status = AudioUpload.Status.FAILED
+        upload.error = error[:1000]
+        upload.save(update_fields=['status', 'error', 'updated_at'])
+        return False
+
+    story = Story.objects.filter(pk=upload.story_id).first()
+    if story is None:
+        output.unlink(missing_ok=True)  # Histoire supprimee entre-temps
+        return False
+    previous = story.audio_file.name
+    with open(output, 'rb') as f:
+        story.audio_file.save(f'story-{story.id}{OUTPUT_EXTENSION}', File(f), save=False)
+    story.audio_duration = duration
+    story.save(update_fields=['audio_file', 'audio_duration', 'updated_at'])
+    if previous and previous != story.audio_file.name:
+        story.audio_file.storage.delete(previous)
+
+    output.unlink(missing_ok=True)
+    discard(upload)
+    upload.status = AudioUpload.Status.DONE
+    upload.error = ''
+    upload.save(update_fields=['status', 'error', 'updated_at'])
+    return True
+
+
+def purge_stale():
+    """Supprime les envois abandonnes (jamais finis) et leurs fichiers. Retourne leur nombre."""
+    hours = getattr(settings, 'AUDIO_UPLOAD_EXPIRY_HOURS', 48)
+    stale = AudioUpload.objects.filter(
+        status=AudioUpload.Status.UPLOADING,
+        updated_at__lt=timezone.now() - timedelta(hours=hours),
+    )
+    count = 0
+    for upload in stale.iterator():
+        discard(upload)
+        upload.delete()
+        count += 1
+    return count
@@ -0,0 +1,57 @@
+# stories/services/db_connections.py
+# L'etat des connexions a la base, pour /api/health/ et `manage.py bench_connections`.
+#
+# Trois facons de (re)utiliser les connexions, choisies dans les settings
+# (DB_CONN_MAX_AGE, DB_POOL, DB_CONN_HEALTH_CHECKS) :
+#   - none       : une connexion neuve par requete (CONN_MAX_AGE = 0) ;
+#   - persistent : chaque worker garde sa connexion CONN_MAX_AGE secondes ;
+#   - pool       : un pool psycopg partage par les threads du worker.
+# Avec CONN_HEALTH_CHECKS, une connexion gardee est verifiee avant d'etre
+# reutilisee (par Django, ou par le pool).
+
+import time
+
+from django.db import DatabaseError, connections
+
+
+def reuse_mode(alias='default'):
+    """'pool', 'persistent' ou 'none'."""
+    settings_dict = connections[alias].settings_dict
+    if settings_dict.get('OPTIONS', {}).get('pool'):
+        return 'pool'
+    return 'none' if settings_dict.get('CONN_MAX_AGE', 0) == 0 else 'persistent'
+
+
+def pool_stats(alias='default'):
+    """Les compteurs du pool psycopg (taille, connexions libres, attentes...), ou None."""
+    if reuse_mode(alias) != 'pool':
+        return None
+    return connections[alias].pool.get_stats()
+
+
+def ping(alias='default'):
+    """Un `SELECT 1` ; retourne sa duree en millisecondes. Leve DatabaseError si la base ne repond pas."""
+    started = time.perf_counter()
+    with connections[alias].cursor() as cursor:
+        cursor.execute('SELECT 1')
+        cursor.fetchone()
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def status(alias='default'):
+    """Tout ce que /api/health/ montre de la base."""
+    connection = connections[alias]
+    result = {
+        'vendor': connection.vendor,
+        'reuse': reuse_mode(alias),
+        'conn_max_age': connection.settings_dict.get('CONN_MAX_AGE', 0),
+        'health_checks': connection.settings_dict.get('CONN_HEALTH_CHECKS', False),
+    }
+    try:
+        result['latency_ms'] = ping(alias)
+        result['ok'] = True
+    except DatabaseError as exc:  # Base tombee, pool plein : la page de sante repond quand meme
+        result['ok'] = False
+        result['error'] = exc.__class__.__name__
+    result['pool'] = pool_stats(alias)
+    return result
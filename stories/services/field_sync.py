@@ -0,0 +1,128 @@
+# stories/services/field_sync.py
+# Synchronisation des appareils de terrain (hors ligne la plupart du temps).
+#
+# Envoi ("push") : l'appareil envoie d'un coup toutes les plantations notees
+# sans connexion. Chacune a un UUID choisi par l'appareil : si le meme lot est
+# renvoye (reponse perdue), les plantations deja connues ne sont pas recreees.
+# Les nouvelles sont inserees avec un seul bulk_create dans une transaction.
+#
+# Reception ("pull") : l'appareil garde un "watermark" (la position du dernier
+# changement recu) et demande seulement ce qui a change depuis. Les lignes
+# modifiees il y a moins de SYNC_SETTLE_SECONDS ne sont pas encore envoyees :
+# `updated_at` vient de l'horloge du serveur, avant le COMMIT, donc une
+# transaction plus lente pourrait encore rendre visible un changement plus
+# ancien. La fenetre est calculee depuis DB_STATEMENT_TIMEOUT (voir settings),
+# qui borne chaque etape d'une ecriture.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from stories.models import Story, TreePlanting
+from stories.services import impact_stats, sheets_outbox
+from stories.services.treeplanting import tree_plantings_bulk_created
+
+
+def _settle_delay():
+    return timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 30))
+
+
+def push(records, username):
+    """
+    Enregistre les plantations envoyees par un appareil.
+
+    `records` : dicts valides avec uuid, story, latitude, longitude, recorded_at.
+    Retourne un accuse par plantation, dans l'ordre recu :
+    {'uuid', 'id', 'result'} avec result = "created", "duplicate" ou "rejected"
+    (et 'error' pour "rejected").
+    """
+    try:
+        return _push(records, username)
+    except IntegrityError:
+        # Le meme lot envoye deux fois en parallele : le second voit
+        # maintenant les lignes du premier comme des doublons
+        return _push(records, username)
+
+
+@transaction.atomic
+def _push(records, username):
+    uuids = [record['uuid'] for record in records]
+    known = dict(
+        TreePlanting.objects.filter(client_uuid__in=uuids).values_list('client_uuid', 'id')
+    )
+    stories = Story.objects.only('id', 'title').in_bulk({record['story'] for record in records})
+
+    new_trees = {}
+    rejected = {}
+    for record in records:
+        uuid = record['uuid']
+        if uuid in known or uuid in new_trees:
+            continue
+        story = stories.get(record['story'])
+        if story is None:
+            rejected[uuid] = "Histoire inconnue."
+            continue
+        tree = TreePlanting(
+            story=story,
+            planted_by=username,
+            latitude=record.get('latitude'),
+            longitude=record.get('longitude'),
+            status=TreePlanting.Status.PLANTED,  # Note sur le terrain : l'arbre est en terre
+            actually_planted_at=record['recorded_at'],
+            client_uuid=uuid,
+            client_recorded_at=record['recorded_at'],
+        )
+        tree.geohash = tree.compute_geohash()  # bulk_create n'appelle pas save()
+        new_trees[uuid] = tree
+
+    created = TreePlanting.objects.bulk_create(new_trees.values(), batch_size=500)
+    if created:
+        sheets_outbox.enqueue_many(created)
+        impact_stats.trees_created(created)
+        transaction.on_commit(
+            lambda: tree_plantings_bulk_created.send(sender=TreePlanting, trees=created)
+        )
+
+    acks = []
+    for record in records:
+        uuid = record['uuid']
+        if uuid in rejected:
+            acks.append({'uuid': uuid, 'id': None, 'result': 'rejected', 'error': rejected[uuid]})
+        elif uuid in known:
+            acks.append({'uuid': uuid, 'id': known[uuid], 'result': 'duplicate'})
+        else:
+            tree = new_trees[uuid]
+            acks.append({'uuid': uuid, 'id': tree.pk, 'result': 'created'})
+            known[uuid] = tree.pk  # Un doublon plus loin dans le meme lot
+    return acks
+
+
+def pull(username, watermark=None, limit=500):
+    """
+    Les changements des plantations de `username` apres `watermark`.
+
+    `watermark` est un couple (updated_at, id) ou None pour tout recevoir.
+    Retourne (changements, nouveau watermark, il_en_reste).
+    """
+    cutoff = timezone.now() - _settle_delay()
+    trees = (
+        TreePlanting.objects
+        .filter(planted_by=username, client_uuid__isnull=False, updated_at__lte=cutoff)
+        .order_by('updated_at', 'id')
+        .values('id', 'client_uuid', 'status', 'actually_planted_at', 'updated_at')
+    )
+    if watermark is not None:
+        updated_at, tree_id = watermark
+        trees = trees.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=tree_id))
+
+    changes = list(trees[:limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+    if changes:
+        watermark = (changes[-1]['updated_at'], changes[-1]['id'])
+    elif watermark is None:
+        watermark = (cutoff, 0)  # Rien avant cette heure : on repartira de la
+    return changes, watermark, more
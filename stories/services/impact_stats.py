@@ -0,0 +1,195 @@
+# stories/services/impact_stats.py
+# Statistiques d'impact tenues a jour au fil de l'eau (TreePlantingDailyStat).
+#
+# Chaque creation, changement de statut ou suppression de plantation ajoute
+# +1 / -1 dans la case (jour, communaute, artisan, statut), dans la meme
+# transaction que la plantation. Une histoire qui change d'artisan emporte
+# ses arbres dans les cases du nouvel artisan. Les ajouts sont ecrits avec un seul
+# `INSERT ... ON CONFLICT DO UPDATE SET count = count + ...` (PostgreSQL et
+# SQLite), donc deux requetes en parallele ne perdent jamais un arbre.
+#
+# `rebuild()` recompte tout depuis TreePlanting (commande `rebuild_stats`).
+
+from collections import Counter
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from stories.models import Artisan, Story, TreePlanting, TreePlantingDailyStat
+
+# Les colonnes qui forment une case (et par lesquelles on peut regrouper)
+GROUPABLE = ('date', 'community', 'artisan', 'status')
+
+
+def day_of(moment):
+    """Le jour d'une promesse, dans le fuseau du site (comme TruncDate)."""
+    return timezone.localdate(moment) if timezone.is_aware(moment) else moment.date()
+
+
+def key(day, community, artisan_id, status):
+    """Une case : (jour, communaute, artisan, statut)."""
+    return (day, community or '', artisan_id, str(status))
+
+
+def apply(deltas):
+    """
+    Ajoute les `deltas` ({case: +n / -n}) aux statistiques, en une requete.
+
+    A appeler dans la transaction qui modifie les plantations.
+    """
+    rows = [(k, n) for k, n in deltas.items() if n]
+    if not rows:
+        return
+    table = connection.ops.quote_name(TreePlantingDailyStat._meta.db_table)
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s)'] * len(rows))
+    params = []
+    for (day, community, artisan_id, status), n in rows:
+        params += [day, community, artisan_id, status, n]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} (date, community, artisan_id, status, count) '
+            f'VALUES {placeholders} '
+            f'ON CONFLICT (date, community, artisan_id, status) '
+            f'DO UPDATE SET count = {table}.count + excluded.count',
+            params,
+        )
+
+
+def _story_owners(story_ids):
+    """{story_id: (artisan_id, communaute)} en une requete."""
+    return {
+        row['id']: (row['artisan_id'], row['artisan__community'])
+        for row in Story.objects.filter(id__in=set(story_ids)).values('id', 'artisan_id', 'artisan__community')
+    }
+
+
+def tree_saved(tree, created, origin):
+    """
+    Met a jour les cases apres la sauvegarde d'une plantation.
+
+    `origin` est le couple (story_id, statut) lu en base avant la modification.
+    """
+    deltas = Counter()
+    if created:
+        owners = _story_owners([tree.story_id])
+        artisan_id, community = owners[tree.story_id]
+        deltas[key(day_of(tree.planted_at), community, artisan_id, tree.status)] += 1
+    else:
+        old_story_id, old_status = origin
+        if (old_story_id, old_status) == (tree.story_id, tree.status):
+            return
+        owners = _story_owners([old_story_id, tree.story_id])
+        old_artisan, old_community = owners[old_story_id]
+        new_artisan, new_community = owners[tree.story_id]
+        day = day_of(tree.planted_at)
+        deltas[key(day, old_community, old_artisan, old_status)] -= 1
+        deltas[key(day, new_community, new_artisan, tree.status)] += 1
+    apply(deltas)
+
+
+def tree_deleted(tree, origin):
+    story_id, status = origin
+    owners = _story_owners([story_id])
+    if story_id not in owners:
+        return  # L'artisan est supprime : ses cases partent en cascade
+    artisan_id, community = owners[story_id]
+    apply({key(day_of(tree.planted_at), community, artisan_id, status): -1})
+
+
+def trees_created(trees):
+    """Apres un bulk_create : chaque plantation doit avoir son `story` charge."""
+    deltas = Counter()
+    owners = _story_owners({tree.story_id for tree in trees})
+    for tree in trees:
+        artisan_id, community = owners[tree.story_id]
+        deltas[key(day_of(tree.planted_at), community, artisan_id, tree.status)] += 1
+    apply(deltas)
+
+
+def story_moved(story_id, old_artisan_id):
+    """
+    Apres le changement d'artisan d'une histoire : ses arbres passent des
+    cases de l'ancien artisan a celles du nouveau (deja en base).
+    """
+    old_community = (
+        Artisan.objects.filter(pk=old_artisan_id).values_list('community', flat=True).first()
+    )
+    deltas = Counter()
+    for row in _aggregate(TreePlanting.objects.filter(story_id=story_id)):
+        if old_community is not None:  # Sinon les cases de l'ancien artisan sont parties en cascade
+            deltas[key(row['day'], old_community, old_artisan_id, row['status'])] -= row['n']
+        deltas[key(row['day'], row['story__artisan__community'], row['story__artisan_id'], row['status'])] += row['n']
+    apply(deltas)
+
+
+def status_changed(tree_ids, target):
+    """Avant un UPDATE de statut en masse : deplace ces arbres vers `target`."""
+    deltas = Counter()
+    for row in _aggregate(TreePlanting.objects.filter(id__in=tree_ids)):
+        community, artisan_id = row['story__artisan__community'], row['story__artisan_id']
+        deltas[key(row['day'], community, artisan_id, row['status'])] -= row['n']
+        deltas[key(row['day'], community, artisan_id, target)] += row['n']
+    apply(deltas)
+
+
+def _aggregate(trees):
+    return (
+        trees
+        .annotate(day=TruncDate('planted_at'))
+        .values('day', 'story__artisan__community', 'story__artisan_id', 'status')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+
+
+@transaction.atomic
+def rebuild(artisan_id=None, batch_size=1000):
+    """
+    Recompte les cases depuis TreePlanting (toutes, ou celles d'un artisan).
+
+    Retourne le nombre de cases ecrites.
+    """
+    stats = TreePlantingDailyStat.objects.all()
+    trees = TreePlanting.objects.all()
+    if artisan_id is not None:
+        stats = stats.filter(artisan_id=artisan_id)
+        trees = trees.filter(story__artisan_id=artisan_id)
+    stats.delete()
+    rows = [
+        TreePlantingDailyStat(
+            date=row['day'],
+            community=row['story__artisan__community'] or '',
+            artisan_id=row['story__artisan_id'],
+            status=row['status'],
+            count=row['n'],
+        )
+        for row in _aggregate(trees)
+    ]
+    TreePlantingDailyStat.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def summary(group_by, since=None, until=None, **filters):
+    """
+    Les totaux regroupes par `group_by` (parmi date, community, artisan, status).
+
+    `filters` : community, artisan, status. Ne lit que la table des cases.
+    """
+    stats = TreePlantingDailyStat.objects.filter(count__gt=0)
+    if since is not None:
+        stats = stats.filter(date__gte=since)
+    if until is not None:
+        stats = stats.filter(date__lte=until)
+    for name, value in filters.items():
+        if value is not None:
+            stats = stats.filter(**{'artisan_id' if name == 'artisan' else name: value})
+    if not group_by:
+        return [{'trees': stats.aggregate(trees=Sum('count'))['trees'] or 0}]
+    columns = ['artisan_id' if name == 'artisan' else name for name in group_by]
+    rows = stats.values(*columns).annotate(trees=Sum('count')).order_by(*columns)
+    return [
+        {('artisan' if name == 'artisan_id' else name): value for name, value in row.items()}
+        for row in rows
+    ]
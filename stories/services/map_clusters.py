@@ -0,0 +1,106 @@
+# stories/services/map_clusters.py
+# Regroupement des plantations en "clusters" pour la carte, calcule cote serveur.
+#
+# La carte est decoupee en une grille dont les cases retrecissent quand on
+# zoome (CELLS_PER_TILE cases par tuile de carte). Toutes les plantations
+# d'une meme case deviennent un seul marqueur avec leur nombre. La taille de
+# la reponse depend donc de la zone affichee, pas du nombre de plantations.
+#
+# Pour les petits zooms, la grille du monde entier est gardee en cache par
+# niveau de zoom ; elle est invalidee a chaque nouvelle plantation.
+
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, FloatField, Max, Min
+from django.db.models.functions import Cast, Floor
+
+from stories.models import TreePlanting
+
+# Nombre de cases par tuile de 256 pixels (une case fait donc environ 64 pixels)
+CELLS_PER_TILE = 4
+MAX_ZOOM = 20
+GENERATION_KEY = 'map_clusters:generation'
+
+
+def cell_size(zoom):
+    """Taille d'une case de la grille, en degres, pour un niveau de zoom."""
+    return 360.0 / (2 ** zoom * CELLS_PER_TILE)
+
+
+def _cluster_rows(zoom, bbox=None):
+    """Une requete GROUP BY sur les cases de la grille."""
+    size = cell_size(zoom)
+    trees = TreePlanting.objects.filter(latitude__isnull=False, longitude__isnull=False)
+    if bbox is not None:
+        west, south, east, north = bbox
+        trees = trees.within_bbox(west, south, east, north)  # Lu sur l'index geohash
+    rows = (
+        trees
+        .annotate(
+            cell_x=Floor(Cast('longitude', FloatField()) / size),
+            cell_y=Floor(Cast('latitude', FloatField()) / size),
+        )
+        .values('cell_x', 'cell_y')
+        .annotate(
+            count=Count('id'),
+            latitude=Avg(Cast('latitude', FloatField())),
+            longitude=Avg(Cast('longitude', FloatField())),
+            first_story=Min('story_id'),
+            last_story=Max('story_id'),
+        )
+        .order_by()
+    )
+    return [
+        {
+            'count': row['count'],
+            'latitude': round(row['latitude'], 6),
+            'longitude': round(row['longitude'], 6),
+            # Si toute la case vient d'une seule histoire, on peut y renvoyer directement
+            'story_id': row['first_story'] if row['first_story'] == row['last_story'] else None,
+        }
+        for row in rows
+    ]
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Cle perdue (redemarrage, eviction) : on repart d'une valeur jamais utilisee
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _world_clusters(zoom):
+    key = f'map_clusters:{_generation()}:z{zoom}'
+    clusters = cache.get(key)
+    if clusters is None:
+        clusters = _cluster_rows(zoom)
+        cache.set(key, clusters, getattr(settings, 'MAP_CLUSTER_CACHE_TIMEOUT', 3600))
+    return clusters
+
+
+def get_clusters(bbox, zoom):
+    """
+    Retourne les clusters visibles dans `bbox` (ouest, sud, est, nord) au zoom donne.
+    """
+    west, south, east, north = bbox
+    if zoom <= getattr(settings, 'MAP_CLUSTER_CACHE_MAX_ZOOM', 10):
+        clusters = _world_clusters(zoom)
+    else:
+        # Zoom fort : la zone affichee est petite, on la calcule directement
+        clusters = _cluster_rows(zoom, bbox)
+    return [
+        c for c in clusters
+        if south <= c['latitude'] <= north and west <= c['longitude'] <= east
+    ]
+
+
+def invalidate():
+    """Change de "generation" : tous les clusters en cache deviennent obsoletes."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
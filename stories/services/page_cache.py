@@ -0,0 +1,125 @@
+# stories/services/page_cache.py
+# Cache du HTML des pages publiques (liste, detail d'une histoire, accueil).
+#
+# Chaque page est gardee dans le cache Django sous une cle qui depend de la
+# page (et de l'histoire), de la langue et de l'etat de connexion. Quand une
+# histoire, un artisan, une plantation ou un commentaire change, les signaux
+# (stories/signals.py) suppriment exactement les cles concernees : toutes les
+# langues et les deux etats de connexion pour ces pages-la.
+#
+# Les compteurs de hits/miss sont aussi dans le cache, par page ; ils sont
+# visibles sur /api/page-cache/stats/.
+#
+# Les suppressions ne valent que pour le cache du processus qui les fait : il
+# faut un cache partage (REDIS_URL) pour que tous les workers et les commandes
+# `manage.py` voient les memes pages. Sans lui, PAGE_CACHE_TIMEOUT vaut 0.
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils import translation
+
+KEY_PREFIX = 'page_cache'
+STATS_PREFIX = 'page_cache:stats'
+PAGES = ('home', 'story_list', 'story_detail')
+AUTH_STATES = ('anon', 'auth')
+
+
+def _timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 300)
+
+
+def _languages():
+    codes = {code for code, _ in getattr(settings, 'LANGUAGES', [])}
+    codes.add(settings.LANGUAGE_CODE)
+    return sorted(codes)
+
+
+def _key(page, part, language, auth_state):
+    return f'{KEY_PREFIX}:{page}:{part}:{language}:{auth_state}'
+
+
+def request_key(request, page, part=''):
+    """La cle de cache de `page` pour cette requete (langue active, connecte ou pas)."""
+    auth_state = 'auth' if request.user.is_authenticated else 'anon'
+    return _key(page, part, translation.get_language() or settings.LANGUAGE_CODE, auth_state)
+
+
+def _count(page, outcome):
+    key = f'{STATS_PREFIX}:{page}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _is_cacheable(request, response):
+    # Comme UpdateCacheMiddleware : pas de cookie ni de jeton CSRF dans une page partagee
+    return (
+        response.status_code == 200
+        and not response.cookies
+        and not request.META.get('CSRF_COOKIE_USED')
+    )
+
+
+def cached_page(request, page, render_page, part=''):
+    """
+    Retourne le HTML de `page` depuis le cache, ou l'obtient avec `render_page()`.
+
+    `render_page` n'est appele (et ne fait ses requetes SQL) qu'en cas de miss.
+    """
+    timeout = _timeout()
+    if timeout <= 0:
+        return render_page()
+
+    key = request_key(request, page, part)
+    cached = cache.get(key)
+    if cached is not None:
+        _count(page, 'hits')
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    _count(page, 'misses')
+    response = render_page()
+    if _is_cacheable(request, response):
+        cache.set(key, (response.content, response['Content-Type']), timeout)
+    return response
+
+
+def _all_variants(page, part=''):
+    return [
+        _key(page, part, language, auth_state)
+        for language in _languages()
+        for auth_state in AUTH_STATES
+    ]
+
+
+def invalidate_lists():
+    """Oublie les pages qui montrent toutes les histoires (liste, accueil)."""
+    cache.delete_many(_all_variants('story_list') + _all_variants('home'))
+
+
+def invalidate_stories(story_ids):
+    """Oublie la page de ces histoires, dans toutes les langues."""
+    keys = []
+    for story_id in story_ids:
+        keys += _all_variants('story_detail', story_id)
+    cache.delete_many(keys)
+
+
+def stats():
+    """Hits, miss et taux de hits par page."""
+    keys = [f'{STATS_PREFIX}:{page}:{outcome}' for page in PAGES for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+    result = {}
+    for page in PAGES:
+        hits = values.get(f'{STATS_PREFIX}:{page}:hits', 0)
+        misses = values.get(f'{STATS_PREFIX}:{page}:misses', 0)
+        total = hits + misses
+        result[page] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': round(hits / total, 3) if total else None,
+        }
+    return result
@@ -0,0 +1,144 @@
+# stories/services/sheets_outbox.py
+# La "boite d'envoi" des plantations vers Google Sheets.
+#
+# La requete qui plante un arbre ne parle plus a Google : elle ajoute juste
+# une ligne SheetOutbox dans la meme transaction que la TreePlanting.
+# Le worker `manage.py sync_sheets` envoie ensuite ces lignes par lots,
+# avec un seul `append_rows` par lot, et reessaie plus tard en cas d'echec.
+# Un lot est d'abord reserve (bail de SHEETS_SYNC_LEASE secondes), puis
+# envoye hors transaction, puis marque comme envoye.
+#
+# Si l'integration google_sheets est desactivee (INTEGRATIONS), rien n'est
+# mis dans la boite : personne ne la viderait.
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from stories import integrations, metrics
+from stories.models import SheetOutbox
+
+
+def build_row(tree):
+    """Les colonnes de la feuille, dans l'ordre, pour une plantation."""
+    return [
+        tree.id,
+        tree.story.title,
+        tree.planted_by,
+        tree.status,
+        timezone.now().isoformat(),
+    ]
+
+
+def enqueue(tree):
+    """
+    Met une plantation dans la boite d'envoi.
+
+    A appeler dans la meme transaction que la creation de la plantation :
+    si la plantation est annulee, la ligne l'est aussi.
+    """
+    if not integrations.enabled('google_sheets'):
+        return None
+    return SheetOutbox.objects.create(tree=tree, row=build_row(tree))
+
+
+def enqueue_many(trees):
+    """
+    Comme `enqueue`, pour beaucoup de plantations avec un seul INSERT.
+
+    Chaque plantation doit deja avoir son `story` charge (pas de requete par ligne).
+    """
+    if not integrations.enabled('google_sheets'):
+        return []
+    return SheetOutbox.objects.bulk_create(
+        [SheetOutbox(tree=tree, row=build_row(tree)) for tree in trees],
+        batch_size=500,
+    )
+
+
+def retry_delay(attempts):
+    """Attente exponentielle apres un echec : base, 2x base, 4x base... plafonnee."""
+    base = getattr(settings, 'SHEETS_SYNC_RETRY_BASE', 30)
+    maximum = getattr(settings, 'SHEETS_SYNC_RETRY_MAX', 3600)
+    return timedelta(seconds=min(base * 2 ** max(attempts - 1, 0), maximum))
+
+
+def lease_duration():
+    """Combien de temps un lot reserve est cache aux autres workers."""
+    return timedelta(seconds=getattr(settings, 'SHEETS_SYNC_LEASE', 300))
+
+
+def claim_batch(batch_size, now=None):
+    """
+    Reserve un lot de lignes en attente et retourne la liste.
+
+    Courte transaction : on verrouille les lignes (skip_locked, pour que
+    deux workers ne prennent pas les memes), on repousse leur
+    `next_attempt_at` de la duree du bail, puis on relache les verrous.
+    Si le worker meurt pendant l'envoi, les lignes redeviennent
+    disponibles a la fin du bail.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        batch = list(
+            SheetOutbox.objects
+            .select_for_update(skip_locked=True)
+            .filter(sent_at__isnull=True, next_attempt_at__lte=now)
+            .order_by('next_attempt_at', 'id')[:batch_size]
+        )
+        if batch:
+            SheetOutbox.objects.filter(id__in=[item.id for item in batch]).update(
+                next_attempt_at=now + lease_duration(),
+            )
+    return batch
+
+
+def send_batch(sink, batch_size=None):
+    """
+    Envoie un lot de lignes en attente vers `sink`.
+
+    Retourne le nombre de lignes envoyees (0 si rien a faire). En cas
+    d'erreur de la destination, les lignes du lot sont reprogrammees et
+    l'exception est relancee pour que le worker puisse la signaler.
+
+    L'appel a la destination se fait HORS transaction : aucun verrou ni
+    connexion en transaction n'est garde pendant qu'on attend Google.
+    L'envoi est "au moins une fois" : si le worker meurt entre l'envoi et
+    le marquage, ou si l'envoi dure plus que SHEETS_SYNC_LEASE, le lot
+    peut etre renvoye. Le bail doit donc rester bien plus long que le
+    delai d'attente du client Google.
+    """
+    if batch_size is None:
+        batch_size = getattr(settings, 'SHEETS_SYNC_BATCH_SIZE', 100)
+
+    batch = claim_batch(batch_size)
+    if not batch:
+        return 0
+
+    ids = [item.id for item in batch]
+    try:
+        sink.append_rows([item.row for item in batch])
+    except Exception as exc:
+        now = timezone.now()
+        for item in batch:
+            item.attempts += 1
+            item.next_attempt_at = now + retry_delay(item.attempts)
+            item.last_error = str(exc)[:1000]
+        SheetOutbox.objects.bulk_update(batch, ['attempts', 'next_attempt_at', 'last_error'])
+        metrics.SHEETS_ROWS.labels(outcome='failed').inc(len(ids))
+        raise SheetSyncError(len(ids), exc) from exc
+
+    SheetOutbox.objects.filter(id__in=ids).update(sent_at=timezone.now(), last_error='')
+    metrics.SHEETS_ROWS.labels(outcome='sent').inc(len(ids))
+    return len(ids)
+
+
+class SheetSyncError(Exception):
+    """Un lot n'a pas pu etre envoye ; les lignes ont ete reprogrammees."""
+
+    def __init__(self, count, error):
+        self.count = count
+        self.error = error
+        super().__init__(f"{count} ligne(s) non envoyee(s) : {error}")
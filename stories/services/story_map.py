@@ -0,0 +1,210 @@
+# stories/services/story_map.py
+# Les donnees GeoJSON de la carte des histoires, calculees a l'avance.
+#
+# Chaque histoire qui a des plantations avec des coordonnees devient un point
+# place a la position moyenne de ses arbres. Chaque point a sa propre cle
+# dans le cache, et le GeoJSON complet (compact, sans indentation) est garde
+# a cote avec son ETag.
+#
+# Les cles portent un numero de version : quand une histoire ou une
+# plantation change, on augmente (incr) la version de ce point et celle du
+# GeoJSON complet au lieu d'effacer les cles. Un lecteur qui a lu la base
+# AVANT le changement ecrit donc son resultat perime sous l'ancienne
+# version, que plus personne ne lit ; il ne peut pas recouvrir le nouveau.
+# (Jamais de lecture-modification-ecriture d'un dictionnaire partage non
+# plus, qui perdrait les changements faits en meme temps par un autre
+# worker.) Le recalcul se fait a la prochaine lecture (voir
+# stories/signals.py). Pour tout oublier, on change de "generation", comme
+# stories/services/map_clusters.py.
+#
+# La liste des ids d'histoires est gardee aussi (avec sa propre version,
+# changee seulement quand une histoire est creee ou supprimee) : un
+# GeoJSON a reconstruire ne relit pas toute la table Story.
+
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg, Count, Q
+from django.urls import reverse
+
+from stories.models import Story
+
+GENERATION_KEY = 'story_map:generation'
+# Une histoire sans point est gardee aussi, pour ne pas la recalculer a chaque fois
+NO_FEATURE = False
+# Au-dela, on recalcule toutes les histoires d'un coup plutot qu'un gros `IN (...)`
+REBUILD_ALL_THRESHOLD = 500
+
+# Seules les plantations avec une position complete comptent pour placer le point
+_HAS_POSITION = Q(
+    tree_plantings__latitude__isnull=False,
+    tree_plantings__longitude__isnull=False,
+)
+
+
+def _timeout():
+    return getattr(settings, 'STORY_MAP_CACHE_TIMEOUT', 600)
+
+
+def _feature_rows(story_ids=None):
+    """Une seule requete annotee : nombre d'arbres et position moyenne par histoire."""
+    stories = Story.objects.all()
+    if story_ids is not None:
+        stories = stories.filter(id__in=story_ids)
+    return (
+        stories
+        .annotate(
+            tree_count=Count('tree_plantings'),
+            map_latitude=Avg('tree_plantings__latitude', filter=_HAS_POSITION),
+            map_longitude=Avg('tree_plantings__longitude', filter=_HAS_POSITION),
+        )
+        .filter(map_latitude__isnull=False)
+        .values('id', 'title', 'artisan__community', 'tree_count', 'map_latitude', 'map_longitude')
+        .order_by('id')
+    )
+
+
+def _to_feature(row):
+    return {
+        "type": "Feature",
+        "id": row['id'],
+        "geometry": {
+            "type": "Point",
+            "coordinates": [
+                round(float(row['map_longitude']), 6),
+                round(float(row['map_latitude']), 6),
+            ],
+        },
+        "properties": {
+            "title": row['title'],
+            "location": row['artisan__community'],
+            "tree_count": row['tree_count'],
+            "url": reverse('story_detail', kwargs={'id': row['id']}),
+        },
+    }
+
+
+def build_features(story_ids=None):
+    """Retourne {story_id: feature} pour toutes les histoires (ou seulement `story_ids`)."""
+    return {row['id']: _to_feature(row) for row in _feature_rows(story_ids)}
+
+
+def _generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns(), None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def _version_key(generation, name):
+    return f'story_map:{generation}:version:{name}'
+
+
+def _versions(generation, names):
+    """
+    {nom: version} ; une version absente (jamais vue ou evincee) en recoit une neuve.
+
+    time_ns() ne redonne jamais une ancienne valeur : une cle evincee ne
+    peut pas faire revivre un point perime ecrit sous cette version.
+    A appeler AVANT de lire la base.
+    """
+    keys = {_version_key(generation, name): name for name in names}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    missing = {key: time.time_ns() for key, name in keys.items() if name not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update({keys[key]: version for key, version in missing.items()})
+    return versions
+
+
+def _bump(generation, *names):
+    for name in names:
+        try:
+            cache.incr(_version_key(generation, name))
+        except ValueError:
+            cache.set(_version_key(generation, name), time.time_ns(), None)
+
+
+def _feature_key(generation, story_id, version):
+    return f'story_map:{generation}:feature:{story_id}:{version}'
+
+
+def _blob_key(generation, version):
+    return f'story_map:{generation}:blob:{version}'
+
+
+def _story_ids(generation):
+    """Les ids de toutes les histoires, en cache jusqu'a la prochaine creation ou suppression."""
+    version = _versions(generation, ['ids'])['ids']
+    key = f'story_map:{generation}:ids:{version}'
+    story_ids = cache.get(key)
+    if story_ids is None:
+        story_ids = list(Story.objects.order_by('id').values_list('id', flat=True))
+        cache.set(key, story_ids, _timeout())
+    return story_ids
+
+
+def _get_features(generation):
+    """{story_id: feature} : les points en cache, et ceux qui manquent recalcules."""
+    story_ids = _story_ids(generation)
+    versions = _versions(generation, story_ids)
+    keys = {_feature_key(generation, story_id, versions[story_id]): story_id for story_id in story_ids}
+    features = {keys[key]: feature for key, feature in cache.get_many(keys).items()}
+    missing = [story_id for story_id in story_ids if story_id not in features]
+    if missing:
+        fresh = build_features(missing if len(missing) <= REBUILD_ALL_THRESHOLD else None)
+        computed = {story_id: fresh.get(story_id, NO_FEATURE) for story_id in missing}
+        cache.set_many(
+            {
+                _feature_key(generation, story_id, versions[story_id]): feature
+                for story_id, feature in computed.items()
+            },
+            _timeout(),
+        )
+        features.update(computed)
+    return {story_id: feature for story_id, feature in features.items() if feature is not NO_FEATURE}
+
+
+def get_map_blob():
+    """
+    Retourne (etag, contenu) : le GeoJSON serialise une fois pour toutes.
+    """
+    generation = _generation()
+    key = _blob_key(generation, _versions(generation, ['blob'])['blob'])
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    features = _get_features(generation)
+    collection = {
+        "type": "FeatureCollection",
+        "features": [features[story_id] for story_id in sorted(features)],
+    }
+    blob = json.dumps(collection, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    etag = '"%s"' % hashlib.md5(blob).hexdigest()
+    cache.set(key, (etag, blob), _timeout())
+    return etag, blob
+
+
+def refresh_story(story_id, added_or_deleted=False):
+    """
+    Change la version du point d'une histoire et celle du GeoJSON complet ;
+    recalcules a la prochaine lecture.
+
+    `added_or_deleted` : l'histoire vient d'etre creee ou supprimee, la
+    liste des ids change aussi.
+    """
+    generation = _generation()
+    _bump(generation, story_id, 'blob', *(['ids'] if added_or_deleted else []))
+
+
+def invalidate():
+    """Change de "generation" : toute la carte sera reconstruite a la prochaine lecture."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, time.time_ns(), None)
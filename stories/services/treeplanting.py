@@ -1,6 +1,29 @@
 # stories/services/treeplanting.py
+from django.conf import settings  # Pour lire nos reglages
+from django.db import transaction  # Pour tout faire d'un coup (ou rien)
+from django.dispatch import Signal  # Pour prevenir le reste du code des changements
 from django.utils import timezone  # Pour connaitre la date et l'heure actuelles
 from stories.models import TreePlanting  # On importe le modele TreePlanting
+from stories.services import impact_stats  # Les statistiques suivent les changements
+
+Status = TreePlanting.Status
+
+# Les changements de statut permis : nouveau statut -> anciens statuts acceptes
+# (en attente -> plante -> verifie, et n'importe quel statut -> echoue)
+ALLOWED_SOURCES = {
+    Status.PLANTED: {Status.PENDING},
+    Status.VERIFIED: {Status.PLANTED},
+    Status.FAILED: {Status.PENDING, Status.PLANTED, Status.VERIFIED},
+}
+
+# Envoye apres une creation en masse (bulk_create ne declenche pas post_save).
+# `trees` est la liste des plantations creees.
+tree_plantings_bulk_created = Signal()
+
+
+class BulkTransitionError(Exception):
+    """La demande ne peut pas etre traitee (statut inconnu, trop d'arbres...)."""
+
 
 def mark_tree_planted(tree: TreePlanting):
     # Cette fonction marque un arbre comme ayant ete plante
@@ -12,7 +35,64 @@ def mark_tree_planted(tree: TreePlanting):
     tree.actually_planted_at = timezone.now()
     
     # On sauvegarde seulement les champs qui ont change pour aller plus vite
-    tree.save(update_fields=['status', 'actually_planted_at'])
+    tree.save(update_fields=['status', 'actually_planted_at', 'updated_at'])
     
     # On retourne l'arbre modifie
-    return tree
\ No newline at end of file
+    return tree
+
+
+def bulk_transition(target, ids=None, trees=None, actually_planted_at=None):
+    """
+    Change le statut de beaucoup d'arbres avec un seul UPDATE.
+
+    On donne soit une liste d'`ids`, soit un queryset `trees` (un filtre).
+    Les lignes sont verrouillees, puis un seul
+    `UPDATE ... WHERE id IN (...) AND status IN (...)` est lance dans la
+    meme transaction. Retourne un resultat par id :
+    {'id', 'outcome', 'status'} ou outcome vaut "updated", "unchanged"
+    (deja dans ce statut), "invalid_transition" ou "not_found".
+    """
+    if target not in ALLOWED_SOURCES:
+        raise BulkTransitionError(f"On ne peut pas passer des arbres au statut '{target}'.")
+    if (ids is None) == (trees is None):
+        raise BulkTransitionError("Donner soit des ids, soit un filtre.")
+    limit = getattr(settings, 'BULK_TRANSITION_MAX', 5000)
+    sources = ALLOWED_SOURCES[target]
+
+    with transaction.atomic():
+        if ids is not None:
+            ids = list(dict.fromkeys(ids))  # Sans doublons, dans l'ordre recu
+            if len(ids) > limit:
+                raise BulkTransitionError(f"Au plus {limit} arbres par demande.")
+            trees = TreePlanting.objects.filter(id__in=ids)
+        # Verrou : personne ne change ces arbres entre la lecture et l'UPDATE
+        current = dict(trees.select_for_update().order_by('id').values_list('id', 'status')[:limit + 1])
+        if len(current) > limit:
+            raise BulkTransitionError(f"Le filtre trouve plus de {limit} arbres ; affinez-le.")
+        if ids is None:
+            ids = list(current)
+
+        movable = [tree_id for tree_id, status in current.items() if status in sources]
+        if movable:
+            # update() ne remplit pas auto_now : on date le changement nous-memes
+            changes = {'status': target, 'updated_at': timezone.now()}
+            if target == Status.PLANTED:
+                changes['actually_planted_at'] = actually_planted_at or timezone.now()
+            # Les UPDATE ne declenchent pas post_save : les statistiques sont
+            # mises a jour ici, et `updated_at` suffit a la synchro des telephones
+            impact_stats.status_changed(movable, target)  # Dans la meme transaction
+            TreePlanting.objects.filter(id__in=movable, status__in=sources).update(**changes)
+
+    results = []
+    for tree_id in ids:
+        status = current.get(tree_id)
+        if status is None:
+            outcome = 'not_found'
+        elif status in sources:
+            outcome, status = 'updated', target
+        elif status == target:
+            outcome = 'unchanged'
+        else:
+            outcome = 'invalid_transition'
+        results.append({'id': tree_id, 'outcome': outcome, 'status': status})
+    return results
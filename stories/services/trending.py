@@ -0,0 +1,170 @@
+# stories/services/trending.py
+# Le classement "tendance" des histoires (StoryTrendingScore).
+#
+# Chaque vue, plantation ou commentaire ajoute son poids au score de
+# l'histoire, et ce poids perd la moitie de sa valeur toutes les
+# TRENDING_HALF_LIFE_HOURS heures. Au lieu de faire baisser tous les scores a
+# chaque passage, on garde log2(score) ramene a une date fixe (EPOCH) : un
+# evenement recent vaut 2^((t - EPOCH) / demi-vie), donc plus que les anciens,
+# et l'ordre des histoires qui n'ont rien recu ne change pas. `compute()` ne
+# relit ainsi que les histoires actives depuis le dernier passage.
+
+import math
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, Max
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from stories.models import Comment, Story, StoryTrendingScore, TreePlanting
+
+# La date fixe a laquelle les scores sont ramenes
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+# Le verrou qui empeche deux calculs en meme temps (ils compteraient deux fois).
+# Avec PostgreSQL, un verrou consultatif de la base, pris dans la transaction
+# avant de lire `since` : il vaut pour tous les workers et tous les serveurs,
+# et il est rendu tout seul a la fin de la transaction (meme si le processus
+# meurt). Ailleurs (SQLite en developpement), un verrou dans le cache, qui ne
+# vaut que pour les processus qui partagent ce cache.
+LOCK_ID = 0x7472656e64  # "trend"
+LOCK_KEY = 'trending:compute'
+LOCK_TIMEOUT = 10 * 60
+
+
+def half_life():
+    return timedelta(hours=getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 24))
+
+
+def weights():
+    return {'views': 1, 'trees': 5, 'comments': 3, **getattr(settings, 'TRENDING_WEIGHTS', {})}
+
+
+def log_weight(weight, moment):
+    """log2 du poids d'un evenement arrive a `moment`."""
+    return math.log2(weight) + (moment - EPOCH) / half_life()
+
+
+def log_add(a, b):
+    """log2(2^a + 2^b) sans jamais calculer 2^a (il deborderait)."""
+    if a is None:
+        return b
+    high, low = max(a, b), min(a, b)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def current_score(score, now=None):
+    """Le score "d'aujourd'hui" (les vieux evenements ont perdu leur valeur)."""
+    return 2 ** (score - ((now or timezone.now()) - EPOCH) / half_life())
+
+
+def _hourly(queryset, moment_field, since, until):
+    """[(story_id, heure, nombre)] des evenements entre `since` et `until`."""
+    window = {f'{moment_field}__lte': until}
+    if since is not None:
+        window[f'{moment_field}__gt'] = since
+    return (
+        queryset.filter(**window)
+        .annotate(hour=TruncHour(moment_field))
+        .values_list('story_id', 'hour')
+        .annotate(n=Count('id'))
+        .order_by()
+    )
+
+
+def compute(now=None):
+    """
+    Ajoute aux scores l'activite arrivee depuis le dernier passage.
+
+    Les evenements des TRENDING_SETTLE_SECONDS dernieres secondes attendent le
+    prochain passage (une transaction pas encore validee pourrait en ajouter).
+    Retourne le nombre d'histoires mises a jour, ou None si un autre calcul
+    tourne deja.
+    """
+    if connection.vendor == 'postgresql':
+        return _compute(now or timezone.now())
+    if not cache.add(LOCK_KEY, 1, LOCK_TIMEOUT):
+        return None
+    try:
+        return _compute(now or timezone.now())
+    finally:
+        cache.delete(LOCK_KEY)
+
+
+def _db_lock():
+    """Prend le verrou de la base pour la transaction en cours ; False s'il est deja pris."""
+    if connection.vendor != 'postgresql':
+        return True  # Le verrou du cache est deja pris (voir compute())
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT pg_try_advisory_xact_lock(%s)', [LOCK_ID])
+        return cursor.fetchone()[0]
+
+
+@transaction.atomic
+def _compute(now):
+    if not _db_lock():
+        return None
+    until = now - timedelta(seconds=getattr(settings, 'TRENDING_SETTLE_SECONDS', 5))
+    since = StoryTrendingScore.objects.aggregate(last=Max('computed_at'))['last']
+    w = weights()
+    gains = defaultdict(lambda: None)  # story_id -> log2 de ce qui s'ajoute
+
+    # Les plantations et les commentaires, regroupes par heure (un poids de 0
+    # coupe ce signal : il n'ajoute rien, et log2(0) n'existe pas)
+    if w['trees'] > 0:
+        for story_id, hour, n in _hourly(TreePlanting.objects.all(), 'planted_at', since, until):
+            gains[story_id] = log_add(gains[story_id], log_weight(w['trees'] * n, hour))
+    if w['comments'] > 0:
+        for story_id, hour, n in _hourly(Comment.objects.all(), 'created_at', since, until):
+            gains[story_id] = log_add(gains[story_id], log_weight(w['comments'] * n, hour))
+
+    # Les vues ne sont qu'un compteur : les nouvelles datent de ce passage.
+    # Le compteur de vues met a jour `updated_at` : seules ces histoires sont lues.
+    touched = Story.objects.all() if since is None else Story.objects.filter(updated_at__gt=since)
+    views = dict(touched.values_list('id', 'views'))
+    candidates = set(gains) | set(views)
+    if not candidates:
+        return 0
+    for story_id, views_now in Story.objects.filter(id__in=set(gains) - set(views)).values_list('id', 'views'):
+        views[story_id] = views_now
+    current = {
+        row.story_id: row
+        for row in StoryTrendingScore.objects.select_for_update().filter(story_id__in=candidates)
+    }
+
+    rows = []
+    for story_id in candidates:
+        if story_id not in views:
+            continue  # Histoire supprimee entre-temps
+        row = current.get(story_id)
+        new_views = views[story_id] - (row.views_seen if row else 0)
+        gain = gains[story_id]
+        if new_views > 0 and w['views'] > 0:
+            gain = log_add(gain, log_weight(w['views'] * new_views, until))
+        if gain is None:
+            continue
+        rows.append(StoryTrendingScore(
+            story_id=story_id,
+            score=log_add(row.score if row else None, gain),
+            views_seen=views[story_id],
+            computed_at=until,
+        ))
+    StoryTrendingScore.objects.bulk_create(
+        rows,
+        update_conflicts=True,
+        unique_fields=['story'],
+        update_fields=['score', 'views_seen', 'computed_at'],
+    )
+    return len(rows)
+
+
+def top(stories, limit):
+    """Les `limit` histoires de `stories` les plus tendance (score dans `story.trending`)."""
+    return (
+        stories.filter(trending__isnull=False)
+        .select_related('trending')
+        .order_by('-trending__score', '-id')[:limit]
+    )
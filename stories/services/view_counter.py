@@ -0,0 +1,275 @@
+# stories/services/view_counter.py
+# Compteur de vues "write-behind" pour les histoires.
+#
+# Avant, chaque visite faisait `story.views += 1; story.save()` : une lecture,
+# puis une ecriture qui verrouille la ligne. Sous forte charge, les visites
+# attendaient les unes apres les autres et certaines vues etaient perdues.
+#
+# Maintenant, une visite ne fait qu'ajouter +1 dans un tampon (en memoire ou
+# dans le cache Django). Toutes les VIEW_COUNTER_FLUSH_INTERVAL secondes, les
+# vues sont regroupees par histoire et ecrites avec un seul
+# `UPDATE ... SET views = views + n` pour beaucoup d'histoires a la fois.
+#
+# Fenetre de perte : avec le tampon "memory" (ou "cache" sans Redis), les vues
+# pas encore ecrites vivent dans le processus. Un arret propre les ecrit
+# (atexit), mais un worker tue (SIGKILL, manque de memoire, plantage) perd
+# jusqu'a VIEW_COUNTER_FLUSH_INTERVAL secondes de vues. Et `flush_views`, lance
+# depuis un autre processus, ne peut pas les voir : il refuse de tourner.
+# Seul le tampon "cache" sur Redis est partage.
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.redis import RedisCache
+from django.db import connections, transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.db.models.functions import Now
+
+from stories.models import Story
+
+logger = logging.getLogger(__name__)
+
+# Nombre maximum d'histoires mises a jour par requete UPDATE
+FLUSH_BATCH_SIZE = 500
+
+
+class MemoryViewBuffer:
+    """Tampon propre au processus : un Counter protege par un verrou."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts = Counter()
+
+    def add(self, story_id, n=1):
+        with self._lock:
+            self._counts[story_id] += n
+
+    def pending(self, story_id):
+        with self._lock:
+            return self._counts.get(story_id, 0)
+
+    def drain(self):
+        # On echange le Counter d'un coup : les nouvelles vues vont dans le neuf
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return dict(counts)
+
+    def restore(self, counts):
+        with self._lock:
+            self._counts.update(counts)
+
+
+class CacheViewBuffer:
+    """
+    Tampon partage entre les processus, stocke dans le cache Django.
+
+    Chaque histoire a sa propre cle incrementee avec `cache.incr`, qui est
+    atomique sur Redis et Memcached. Les histoires qui ont recu des vues sont
+    notees dans un ensemble (SADD dans Redis) : `drain` ne relit que celles-la
+    au lieu de toutes les histoires de la base.
+
+    Sans Redis (LocMemCache), le cache est propre au processus : l'ensemble
+    est alors un simple `set` en memoire.
+    """
+
+    key_prefix = 'story_views:pending:'
+    dirty_key = 'story_views:dirty'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._dirty = set()
+
+    def _key(self, story_id):
+        return f'{self.key_prefix}{story_id}'
+
+    def _redis(self):
+        """(client redis, cle de l'ensemble) si le cache est Redis, sinon None."""
+        backend = caches['default']
+        if not isinstance(backend, RedisCache):
+            return None
+        key = backend.make_and_validate_key(self.dirty_key)
+        return backend._cache.get_client(key, write=True), key
+
+    def _mark_dirty(self, story_id):
+        redis = self._redis()
+        if redis:
+            client, key = redis
+            client.sadd(key, story_id)
+        else:
+            with self._lock:
+                self._dirty.add(story_id)
+
+    def _pop_dirty(self):
+        """Retire et retourne les histoires notees jusqu'ici."""
+        redis = self._redis()
+        if redis:
+            client, key = redis
+            # Seulement ce qui est deja la : sous forte charge, les histoires
+            # notees pendant le drain attendent le prochain passage
+            size = client.scard(key)
+            return [int(story_id) for story_id in client.spop(key, size)] if size else []
+        with self._lock:
+            dirty, self._dirty = self._dirty, set()
+        return list(dirty)
+
+    def add(self, story_id, n=1):
+        key = self._key(story_id)
+        try:
+            cache.incr(key, n)
+        except ValueError:
+            # La cle n'existe pas encore : `add` ne l'ecrase pas si un autre
+            # processus vient de la creer, on retombe alors sur `incr`
+            if not cache.add(key, n, timeout=None):
+                cache.incr(key, n)
+        # Apres l'incr : si `drain` a retire l'histoire entre les deux, elle
+        # est notee a nouveau et la vue sera lue au prochain passage
+        self._mark_dirty(story_id)
+
+    def pending(self, story_id):
+        return cache.get(self._key(story_id), 0)
+
+    def drain(self):
+        counts = {}
+        story_ids = self._pop_dirty()
+        for start in range(0, len(story_ids), FLUSH_BATCH_SIZE):
+            keys = {self._key(sid): sid for sid in story_ids[start:start + FLUSH_BATCH_SIZE]}
+            for key, value in cache.get_many(keys).items():
+                if not value:
+                    continue
+                try:
+                    # On retire seulement ce qu'on a lu : les vues arrivees
+                    # entre le get et le decr restent dans le tampon
+                    cache.decr(key, value)
+                except ValueError:
+                    continue  # Cle expiree entre-temps
+                counts[keys[key]] = value
+        return counts
+
+    def restore(self, counts):
+        for story_id, n in counts.items():
+            self.add(story_id, n)
+
+
+BUFFERS = {
+    'memory': MemoryViewBuffer,
+    'cache': CacheViewBuffer,
+}
+
+_buffer = None
+_buffer_lock = threading.Lock()
+_flusher = None
+
+
+def get_buffer():
+    """Retourne le tampon choisi par le parametre VIEW_COUNTER_BACKEND."""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                backend = getattr(settings, 'VIEW_COUNTER_BACKEND', 'memory')
+                _buffer = BUFFERS[backend]()
+    return _buffer
+
+
+def is_shared():
+    """True si le tampon est visible par tous les processus (tampon "cache" sur Redis)."""
+    return (
+        getattr(settings, 'VIEW_COUNTER_BACKEND', 'memory') == 'cache'
+        and isinstance(caches['default'], RedisCache)
+    )
+
+
+def get_flush_interval():
+    return getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 10)
+
+
+def record_view(story_id):
+    """Compte une vue sans toucher a la ligne de l'histoire en base."""
+    get_buffer().add(story_id)
+    _ensure_flusher()
+
+
+def pending_views(story_id):
+    """Vues deja comptees mais pas encore ecrites en base."""
+    return get_buffer().pending(story_id)
+
+
+def apply_counts(counts):
+    """Ajoute les vues a plusieurs histoires avec un UPDATE par lot."""
+    items = list(counts.items())
+    with transaction.atomic():
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            increment = Case(
+                *[When(id=story_id, then=Value(n)) for story_id, n in batch],
+                default=Value(0),
+                output_field=PositiveIntegerField(),
+            )
+            Story.objects.filter(id__in=[story_id for story_id, _ in batch]).update(
+                views=F('views') + increment,
+                updated_at=Now(),  # Nouvelle "version" : les ETag de l'API changent
+            )
+
+
+def flush():
+    """
+    Ecrit toutes les vues en attente et retourne le nombre de vues ecrites.
+
+    Si l'ecriture echoue, les vues sont remises dans le tampon pour la
+    prochaine fois : `Story.views` reste exact, juste un peu en retard.
+    """
+    buffer = get_buffer()
+    counts = buffer.drain()
+    if not counts:
+        return 0
+    try:
+        apply_counts(counts)
+    except Exception:
+        buffer.restore(counts)
+        raise
+    return sum(counts.values())
+
+
+def _flush_forever(interval):
+    while True:
+        time.sleep(interval)
+        try:
+            flush()
+        except Exception:
+            logger.exception("Impossible d'ecrire les vues en attente")
+        finally:
+            # Ce thread a sa propre connexion : on la ferme entre deux passages
+            connections.close_all()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception("Vues perdues a l'arret du processus")
+
+
+def _ensure_flusher():
+    """Demarre (une seule fois par processus) le thread qui vide le tampon."""
+    global _flusher
+    if _flusher is not None:
+        return
+    interval = get_flush_interval()
+    with _buffer_lock:
+        if _flusher is not None:
+            return
+        if interval > 0:
+            _flusher = threading.Thread(
+                target=_flush_forever, args=(interval,),
+                name='story-view-flusher', daemon=True,
+            )
+            _flusher.start()
+        else:
+            # Intervalle <= 0 : pas de thread, on vide avec `manage.py flush_views`
+            _flusher = False
+        atexit.register(_flush_at_exit)
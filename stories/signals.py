@@ -0,0 +1,223 @@
+# Fichier : stories/signals.py
+# Les "signaux" : du code qui se lance tout seul quand un modele change.
+# On s'en sert pour garder a jour les donnees calculees a l'avance (carte...).
+# Ce fichier est charge par StoriesConfig.ready() dans stories/apps.py.
+
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import metrics, search
+from .models import Artisan, Comment, Event, Story, TreePlanting, TreePlantingDailyStat
+from .services import impact_stats, map_clusters, page_cache, story_map
+from .services.treeplanting import tree_plantings_bulk_created
+
+
+# -------------------------------------------------------------------
+# Carte des histoires (GeoJSON)
+# -------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=TreePlanting)
+def refresh_map_for_tree(sender, instance, **kwargs):
+    # On attend la fin de la transaction pour ne jamais mettre en cache un etat annule
+    transaction.on_commit(lambda: story_map.refresh_story(instance.story_id))
+    transaction.on_commit(map_clusters.invalidate)
+
+
+@receiver(tree_plantings_bulk_created)
+def refresh_map_for_new_trees(sender, trees, **kwargs):
+    # Deja envoye apres le commit (voir services/treeplanting.py)
+    for story_id in {tree.story_id for tree in trees}:
+        story_map.refresh_story(story_id)
+    map_clusters.invalidate()
+
+
+@receiver([post_save, post_delete], sender=Story)
+def refresh_map_for_story(sender, instance, **kwargs):
+    # post_delete n'a pas de `created` : une suppression change aussi la liste des ids
+    added_or_deleted = kwargs.get('created', True)
+    story_id = instance.id  # Apres delete(), instance.id vaut None au moment du commit
+    transaction.on_commit(lambda: story_map.refresh_story(story_id, added_or_deleted))
+
+
+@receiver(post_save, sender=Artisan)
+def refresh_map_for_artisan(sender, instance, **kwargs):
+    # La communaute de l'artisan est affichee sur chaque point de ses histoires
+    transaction.on_commit(story_map.invalidate)
+
+
+# -------------------------------------------------------------------
+# Recherche plein texte (voir stories/search.py)
+# -------------------------------------------------------------------
+@receiver(post_save, sender=Story)
+def index_story(sender, instance, **kwargs):
+    transaction.on_commit(lambda: search.index_stories([instance.id]))
+
+
+@receiver(post_delete, sender=Story)
+def unindex_story(sender, instance, **kwargs):
+    # Le document part en cascade ; la table FTS5 (SQLite) doit etre videe a la main.
+    # L'id est lu tout de suite : apres delete(), Django remet instance.id a None
+    story_id = instance.id
+    transaction.on_commit(lambda: search.remove_stories([story_id]))
+
+
+@receiver(post_save, sender=Artisan)
+def index_stories_for_artisan(sender, instance, **kwargs):
+    # La communaute de l'artisan sert de mots-cles a ses histoires
+    story_ids = list(Story.objects.filter(artisan=instance).values_list('id', flat=True))
+    if story_ids:
+        transaction.on_commit(lambda: search.index_stories(story_ids))
+
+
+# -------------------------------------------------------------------
+# Cache des pages HTML (voir stories/services/page_cache.py)
+# -------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Story)
+def drop_pages_for_story(sender, instance, **kwargs):
+    story_id = instance.id  # Apres delete(), instance.id vaut None au moment du commit
+    transaction.on_commit(lambda: page_cache.invalidate_stories([story_id]))
+    transaction.on_commit(page_cache.invalidate_lists)
+
+
+@receiver([post_save, post_delete], sender=Artisan)
+def drop_pages_for_artisan(sender, instance, **kwargs):
+    # Le nom de l'artisan est affiche sur la liste et sur chacune de ses histoires
+    story_ids = list(Story.objects.filter(artisan_id=instance.pk).values_list('id', flat=True))
+    transaction.on_commit(lambda: page_cache.invalidate_stories(story_ids))
+    transaction.on_commit(page_cache.invalidate_lists)
+
+
+@receiver([post_save, post_delete], sender=TreePlanting)
+def drop_pages_for_tree(sender, instance, **kwargs):
+    # La liste affiche le nombre total d'arbres plantes
+    transaction.on_commit(lambda: page_cache.invalidate_stories([instance.story_id]))
+    transaction.on_commit(page_cache.invalidate_lists)
+
+
+@receiver(tree_plantings_bulk_created)
+def drop_pages_for_new_trees(sender, trees, **kwargs):
+    page_cache.invalidate_stories({tree.story_id for tree in trees})
+    page_cache.invalidate_lists()  # Le total d'arbres de la liste change aussi
+    page_cache.invalidate_lists()
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def drop_pages_for_comment(sender, instance, **kwargs):
+    transaction.on_commit(lambda: page_cache.invalidate_stories([instance.story_id]))
+
+
+# -------------------------------------------------------------------
+# Compteurs Prometheus (voir stories/metrics.py)
+# -------------------------------------------------------------------
+@receiver(post_save, sender=TreePlanting)
+def count_created_tree(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        transaction.on_commit(lambda: metrics.count_trees([instance]))
+
+
+@receiver(tree_plantings_bulk_created)
+def count_created_trees(sender, trees, **kwargs):
+    metrics.count_trees(trees)  # Deja apres le commit
+
+
+# -------------------------------------------------------------------
+# Statistiques d'impact (voir stories/services/impact_stats.py)
+# Pas de on_commit ici : les cases changent dans la meme transaction que
+# la plantation (TreePlanting.save ouvre une transaction).
+# -------------------------------------------------------------------
+@receiver(post_save, sender=TreePlanting)
+def count_saved_tree(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return  # loaddata : on lancera `manage.py rebuild_stats`
+    origin = getattr(instance, '_stats_origin', None)
+    if created or origin is not None:
+        impact_stats.tree_saved(instance, created, origin)
+
+
+@receiver(post_delete, sender=TreePlanting)
+def count_deleted_tree(sender, instance, **kwargs):
+    origin = getattr(instance, '_stats_origin', None) or (instance.story_id, instance.status)
+    impact_stats.tree_deleted(instance, origin)
+
+
+@receiver(post_save, sender=Story)
+def move_stats_for_story(sender, instance, created, raw=False, **kwargs):
+    # L'artisan fait partie de la case : si l'histoire change d'artisan, ses arbres le suivent
+    origin = getattr(instance, '_stats_artisan', None)
+    instance._stats_artisan = instance.artisan_id
+    if raw or created or origin is None or origin == instance.artisan_id:
+        return
+    impact_stats.story_moved(instance.pk, origin)
+
+
+@receiver(post_save, sender=Artisan)
+def move_stats_for_artisan(sender, instance, created, **kwargs):
+    # La communaute fait partie de la case : si elle change, on recompte cet artisan
+    if not created and (
+        TreePlantingDailyStat.objects.filter(artisan=instance)
+        .exclude(community=instance.community).exists()
+    ):
+        impact_stats.rebuild(artisan_id=instance.pk)
+
+
+# -------------------------------------------------------------------
+# Versions (`updated_at`) pour les ETag de l'API
+# -------------------------------------------------------------------
+@receiver([post_save, post_delete], sender=Comment)
+def touch_story_for_comment(sender, instance, **kwargs):
+    # Le nombre de commentaires fait partie du JSON de l'histoire
+    Story.objects.filter(pk=instance.story_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Artisan)
+def touch_stories_for_artisan(sender, instance, **kwargs):
+    # Les infos de l'artisan sont incluses dans chacune de ses histoires
+    Story.objects.filter(artisan=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def touch_stories_for_user(sender, instance, update_fields=None, **kwargs):
+    # Le nom de l'artisan aussi ; une simple connexion (last_login) ne change rien
+    if update_fields is not None and set(update_fields) <= {'last_login'}:
+        return
+    Story.objects.filter(artisan__user=instance).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Story)
+def touch_sibling_stories(sender, instance, created, raw=False, **kwargs):
+    # Publier, depublier ou changer d'artisan change le nombre d'histoires
+    # publiees (`story_count`) montre dans toutes les histoires de l'artisan
+    if raw:
+        return
+    origin = getattr(instance, '_published_origin', None)
+    current = (instance.artisan_id, instance.published_at is not None)
+    instance._published_origin = current
+    if created and not current[1]:
+        return  # Un brouillon de plus : le compte ne bouge pas
+    if not created and origin == current:
+        return
+    artisans = {current[0]} | ({origin[0]} if origin else set())
+    Story.objects.filter(artisan_id__in=artisans).exclude(pk=instance.pk).update(updated_at=timezone.now())
+
+
+@receiver(post_delete, sender=Story)
+def touch_stories_for_deleted_story(sender, instance, **kwargs):
+    if instance.published_at is not None:
+        Story.objects.filter(artisan_id=instance.artisan_id).update(updated_at=timezone.now())
+
+
+@receiver(m2m_changed, sender=Event.attendees.through)
+def touch_event_for_attendees(sender, instance, action, reverse, pk_set, **kwargs):
+    # Une inscription change les places restantes
+    now = timezone.now()
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            Event.objects.filter(pk=instance.pk).update(updated_at=now)
+    elif action in ('post_add', 'post_remove'):
+        # Modifie depuis l'utilisateur : user.registered_events.add(...)
+        Event.objects.filter(pk__in=pk_set).update(updated_at=now)
+    elif action == 'pre_clear':
+        # Apres le clear, on ne saurait plus quels evenements etaient concernes
+        Event.objects.filter(attendees=instance).update(updated_at=now)
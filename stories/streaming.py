@@ -0,0 +1,198 @@
+# Fichier : stories/streaming.py
+# Envoi de fichiers (l'audio des histoires) avec les requetes HTTP `Range`.
+#
+# Le navigateur demande l'audio par morceaux ("bytes=1000000-") : on repond
+# 206 avec seulement ces octets, lus par blocs. Sauter au milieu d'une histoire
+# ne retelecharge donc pas tout le fichier, et une demande ouverte ("jusqu'a
+# la fin") est limitee a AUDIO_STREAM_MAX_RANGE octets : le lecteur redemande
+# la suite, et une longue ecoute n'occupe jamais un worker gunicorn longtemps.
+#
+# Si un proxy (nginx, Apache) est configure, Django ne fait que verifier la
+# demande et lui confie l'envoi avec X-Accel-Redirect ou X-Sendfile.
+#
+# Sous ASGI, le fichier est lu par blocs dans un thread (aiter_file) : Django
+# lirait sinon tout le fichier en memoire avant d'envoyer le premier octet.
+
+import hashlib
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_etags, quote_etag
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size, max_length=None):
+    """
+    Lit un en-tete `Range: bytes=...` et retourne (debut, fin) inclus.
+
+    Une demande ouverte ("bytes=N-") ou de fin de fichier ("bytes=-N") est
+    limitee a `max_length` octets.
+    Retourne None si l'en-tete est absent ou ignore (plusieurs intervalles,
+    autre unite) : on envoie alors tout le fichier. Leve ValueError si
+    l'intervalle est hors du fichier (reponse 416).
+    """
+    if not header:
+        return None
+    match = RANGE_RE.match(header.replace(' ', ''))
+    if not match:
+        return None  # Plusieurs intervalles ou syntaxe inconnue : on l'ignore
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # "bytes=-500" : les 500 derniers octets
+        length = int(last)
+        if length == 0 or size == 0:
+            raise ValueError("Intervalle vide")
+        start = max(size - length, 0)
+        end = size - 1
+        if max_length:
+            end = min(end, start + max_length - 1)  # Content-Range dit ce qui manque encore
+        return start, end
+    start = int(first)
+    if last:
+        end = int(last)
+    elif max_length:
+        end = start + max_length - 1  # Le lecteur audio demandera la suite
+    else:
+        end = size - 1
+    if start >= size or end < start:
+        raise ValueError("Intervalle hors du fichier")
+    return start, min(end, size - 1)
+
+
+class RangeFile:
+    """Un fichier ouvert qu'on ne peut lire qu'entre deux positions."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.remaining = length
+        file.seek(start)
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_asgi(request):
+    """True si la requete est servie par ASGI (les flux doivent alors etre async)."""
+    return isinstance(getattr(request, '_request', request), ASGIRequest)
+
+
+async def aiter_file(file, block_size=BLOCK_SIZE):
+    """Les blocs de `file`, lus dans un thread (pour les reponses ASGI)."""
+    read = sync_to_async(file.read, thread_sensitive=False)
+    try:
+        while True:
+            block = await read(block_size)
+            if not block:
+                break
+            yield block
+    finally:
+        await sync_to_async(file.close, thread_sensitive=False)()
+
+
+def file_etag(name, size, modified):
+    """Un ETag fort : il change si le fichier est remplace."""
+    stamp = modified.timestamp() if modified else ''
+    return quote_etag(hashlib.md5(f'{name}:{size}:{stamp}'.encode()).hexdigest())
+
+
+def _modified_time(storage, name):
+    try:
+        return storage.get_modified_time(name)
+    except (NotImplementedError, OSError):
+        return None
+
+
+def _sendfile_response(storage, name):
+    """La reponse vide qui demande au proxy d'envoyer le fichier lui-meme."""
+    backend = getattr(settings, 'AUDIO_SENDFILE', '')
+    if backend == 'x-accel-redirect':
+        response = HttpResponse()
+        prefix = getattr(settings, 'AUDIO_ACCEL_REDIRECT_PREFIX', '/protected-media/')
+        response['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + quote(name)
+        return response
+    if backend == 'x-sendfile':
+        response = HttpResponse()
+        response['X-Sendfile'] = storage.path(name)
+        return response
+    return None
+
+
+def _with_headers(response, headers):
+    for key, value in headers.items():
+        response[key] = value
+    return response
+
+
+def serve_file(request, storage, name, content_type):
+    """
+    Envoie le fichier `name` de `storage` : 200, 206, 304 ou 416.
+    """
+    size = storage.size(name)
+    modified = _modified_time(storage, name)
+    etag = file_etag(name, size, modified)
+
+    headers = {
+        'ETag': etag,
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': 'public, max-age=%d' % getattr(settings, 'AUDIO_CACHE_MAX_AGE', 86400),
+    }
+    if modified:
+        headers['Last-Modified'] = http_date(modified.timestamp())
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        return _with_headers(HttpResponseNotModified(), headers)
+
+    # Le proxy sait faire les Range tout seul : on s'arrete la
+    response = _sendfile_response(storage, name)
+    if response is not None:
+        response['Content-Type'] = content_type
+        return _with_headers(response, headers)
+
+    byte_range = None
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range or if_range.strip() == etag:
+        # If-Range avec un autre ETag : le fichier a change, on renvoie tout
+        try:
+            byte_range = parse_range(
+                request.META.get('HTTP_RANGE'), size,
+                getattr(settings, 'AUDIO_STREAM_MAX_RANGE', 1024 * 1024),
+            )
+        except ValueError:
+            response = HttpResponse(status=416)
+            response['Content-Range'] = f'bytes */{size}'
+            return _with_headers(response, headers)
+
+    if byte_range is None:
+        # Tout le fichier : FileResponse peut utiliser sendfile() du serveur WSGI
+        body = storage.open(name, 'rb')
+        response = FileResponse(body, content_type=content_type)
+        response['Content-Length'] = size
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        body = RangeFile(storage.open(name, 'rb'), start, length)
+        response = FileResponse(body, status=206, content_type=content_type)
+        response.block_size = BLOCK_SIZE
+        response['Content-Length'] = length
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if is_asgi(request):
+        response.streaming_content = aiter_file(body)
+    return _with_headers(response, headers)
@@ -0,0 +1,1483 @@
+# Fichier : stories/tests.py
+# Tests de l'application "stories".
+# Lancer avec : python manage.py test stories
+
+import base64
+import hashlib
+import io
+import json
+import shutil
+import tempfile
+import unittest.mock
+import uuid
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import F
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from datetime import timedelta
+
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import geohash, search, streaming, throttling, views_api
+from .google_sheets import FakeSheetSink
+from . import middleware
+from .management.commands import importtime
+from .models import (
+    AudioUpload, Artisan, Comment, Event, SheetOutbox, Story, StoryTrendingScore, TreePlanting, TreePlantingDailyStat,
+)
+from .services import (
+    audio, impact_stats, page_cache, sheets_outbox, story_map, treeplanting, trending, view_counter,
+)
+
+
+class StoryAPIQueryCountTests(TestCase):
+    """Le nombre de requetes de l'API des histoires ne depend pas de la taille de la page."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('conteur', password='secret')
+        self.artisan = Artisan.objects.create(user=self.user, community='Tombouctou')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_stories(self, count):
+        stories = []
+        for i in range(count):
+            story = Story.objects.create(
+                title=f'Histoire {i}', content='...', artisan=self.artisan,
+                published_at=timezone.now(),
+            )
+            Comment.objects.create(story=story, author_name='Awa', content='Merci')
+            stories.append(story)
+        return stories
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_list_query_count_is_constant(self):
+        self.make_stories(1)
+        small, _ = self.count_queries('/api/stories/')
+        self.make_stories(9)
+        large, response = self.count_queries('/api/stories/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(small, large)
+
+    def test_detail_query_count_is_constant(self):
+        first, second = self.make_stories(2)
+        Comment.objects.create(story=second, author_name='Moussa', content='Bravo')
+        one_comment, _ = self.count_queries(f'/api/stories/{first.id}/')
+        two_comments, _ = self.count_queries(f'/api/stories/{second.id}/')
+        self.assertEqual(one_comment, two_comments)
+
+    def test_counts_come_from_annotations(self):
+        story, = self.make_stories(1)
+        Story.objects.create(title='Brouillon', content='...', artisan=self.artisan)  # Pas publiee
+        _, response = self.count_queries(f'/api/stories/{story.id}/')
+        self.assertEqual(response.data['comments_count'], 1)
+        self.assertEqual(response.data['artisan']['story_count'], 1)
+        self.assertEqual(response.data['artisan']['user'], 'conteur')
+        self.assertTrue(response.data['is_published'])
+
+
+class StoryAPIConditionalGetTests(TestCase):
+    """Le 304 n'est renvoye que si le JSON de l'histoire n'a vraiment pas change."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('conteur', password='secret')
+        self.artisan = Artisan.objects.create(user=self.user, community='Tombouctou')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.story, self.sibling = [
+            Story.objects.create(
+                title=f'Histoire {i}', content='...', artisan=self.artisan,
+                published_at=timezone.now(),
+            )
+            for i in range(2)
+        ]
+        self.url = f'/api/stories/{self.story.id}/'
+
+    def revalidate(self, etag):
+        return self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_story_is_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.revalidate(etag).status_code, 304)
+
+    def test_deleting_a_sibling_changes_the_etag(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['artisan']['story_count'], 2)
+        self.sibling.delete()
+        response = self.revalidate(response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['artisan']['story_count'], 1)
+
+    def test_unpublishing_a_sibling_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        sibling = Story.objects.get(pk=self.sibling.pk)
+        sibling.published_at = None
+        sibling.save()
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['artisan']['story_count'], 1)
+
+    def test_renaming_the_artisan_changes_the_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.user.username = 'griot'
+        self.user.save()
+        response = self.revalidate(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['artisan']['user'], 'griot')
+
+
+class EventAPIQueryCountTests(TestCase):
+    """Places restantes et inscription sont calculees sans requete par evenement."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('visiteur', password='secret')
+        self.others = [User.objects.create_user(f'invite{i}') for i in range(3)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def make_events(self, count, capacity=3):
+        events = []
+        for i in range(count):
+            event = Event.objects.create(
+                title=f'Atelier {i}', description='...', location='Gao', capacity=capacity,
+                date_time=timezone.now() + timedelta(days=i + 1),
+            )
+            event.attendees.add(*self.others[:2])
+            events.append(event)
+        return events
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_list_query_count_is_constant(self):
+        self.make_events(1)
+        small, _ = self.count_queries('/api/events/')
+        self.make_events(9)
+        large, response = self.count_queries('/api/events/')
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(small, large)
+
+    def test_slots_and_registration(self):
+        open_event, full_event = self.make_events(2)
+        open_event.attendees.add(self.user)
+        full_event.attendees.add(self.others[2])
+
+        _, response = self.count_queries(f'/api/events/{open_event.id}/')
+        self.assertEqual(response.data['available_slots'], 0)
+        self.assertTrue(response.data['is_registered'])
+        self.assertFalse(response.data['can_register'])
+
+        _, response = self.count_queries(f'/api/events/{full_event.id}/')
+        self.assertTrue(response.data['is_full'])
+        self.assertFalse(response.data['is_registered'])
+        self.assertFalse(response.data['can_register'])
+
+    def test_open_event_can_register(self):
+        event, = self.make_events(1)
+        _, response = self.count_queries(f'/api/events/{event.id}/')
+        self.assertEqual(response.data['available_slots'], 1)
+        self.assertFalse(response.data['is_full'])
+        self.assertTrue(response.data['can_register'])
+
+
+class WorkerBootImportTests(SimpleTestCase):
+    """Le demarrage d'un worker web reste leger (voir `manage.py importtime`)."""
+
+    def test_boot_imports_stay_within_budget(self):
+        report = importtime.measure()
+        self.assertEqual(report['optional'], [], "Integration optionnelle importee au demarrage")
+        # Pas de limite de temps ici : elle depend de la machine (voir `manage.py importtime`)
+        self.assertLessEqual(report['modules'], settings.IMPORT_BUDGET_MODULES)
+
+
+class PendingTreesAPITests(TestCase):
+    """Les parametres invalides de /api/pending-trees/ donnent une 400, jamais une 500."""
+
+    def setUp(self):
+        user = User.objects.create_user('conteur', password='secret')
+        artisan = Artisan.objects.create(user=user, community='Tombouctou')
+        story = Story.objects.create(title='Histoire', content='...', artisan=artisan, published_at=timezone.now())
+        TreePlanting.objects.create(story=story, planted_by='Awa', status=TreePlanting.Status.PENDING)
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_limit_must_be_in_range(self):
+        for limit in ('0', '-3', '1001', 'abc'):
+            response = self.client.get('/api/pending-trees/', {'limit': limit})
+            self.assertEqual(response.status_code, 400, limit)
+            self.assertIn('limit', response.data)
+
+    def test_valid_limit(self):
+        response = self.client.get('/api/pending-trees/', {'limit': '1'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 1)
+        self.assertIsNone(response.data['next'])
+
+    def test_bbox_must_be_ordered(self):
+        response = self.client.get('/api/pending-trees/', {'bbox': '10,0,-10,5'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('bbox', response.data)
+
+    def test_bbox_must_be_finite_and_on_earth(self):
+        for bbox in ('nan,0,1,1', '0,0,1,inf', '-1e9,-1e9,1e9,1e9', '-181,0,1,1', '0,0,1,91'):
+            response = self.client.get('/api/pending-trees/', {'bbox': bbox})
+            self.assertEqual(response.status_code, 400, bbox)
+            self.assertIn('bbox', response.data)
+
+    def test_valid_bbox(self):
+        TreePlanting.objects.create(
+            story=Story.objects.get(), planted_by='Moussa', latitude=12.64, longitude=-8.0,
+            status=TreePlanting.Status.PENDING,
+        )
+        response = self.client.get('/api/pending-trees/', {'bbox': '-180,-90,180,90'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([tree['planted_by'] for tree in response.data['results']], ['Moussa'])
+
+
+class GeohashTests(SimpleTestCase):
+    """Le geohash en Python pur : codes, cases qui couvrent un rectangle, cercles."""
+
+    def test_encode_known_points(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geohash.encode(-90, -180, 3), '000')
+        self.assertEqual(geohash.encode(90, 180, 3), 'zzz')
+
+    def test_encode_rejects_non_finite(self):
+        for latitude, longitude in ((float('nan'), 0), (0, float('inf'))):
+            with self.assertRaises(ValueError):
+                geohash.encode(latitude, longitude)
+
+    def test_covering_prefixes_contain_points_of_the_bbox(self):
+        bbox = (-8.1, 12.5, -7.9, 12.7)
+        prefixes = geohash.covering_prefixes(*bbox)
+        self.assertLessEqual(len(prefixes), 16)
+        for latitude, longitude in ((12.5, -8.1), (12.6392, -8.0029), (12.7, -7.9)):
+            code = geohash.encode(latitude, longitude)
+            self.assertTrue(any(code.startswith(prefix) for prefix in prefixes), code)
+
+    def test_covering_prefixes_stay_bounded(self):
+        # Plus grand que la Terre : ramene a la Terre, 32 cases au plus
+        prefixes = geohash.covering_prefixes(-1e9, -1e9, 1e9, 1e9)
+        self.assertEqual(prefixes, sorted(geohash.BASE32))
+
+    def test_bad_bbox_is_rejected(self):
+        for bbox in ((float('nan'), 0, 1, 1), (0, 0, float('inf'), 1), (10, 0, -10, 1), (0, 5, 1, 0)):
+            with self.assertRaises(ValueError):
+                geohash.covering_prefixes(*bbox)
+
+    def test_prefix_upper_bound(self):
+        self.assertEqual(geohash.prefix_upper_bound('s1'), 's2')
+        self.assertEqual(geohash.prefix_upper_bound('sz'), 't')
+        self.assertIsNone(geohash.prefix_upper_bound('zz'))
+
+    def test_bounding_boxes_split_at_the_antimeridian(self):
+        boxes = geohash.bounding_boxes(0, 179.9, 50)
+        self.assertEqual(len(boxes), 2)
+        self.assertEqual(boxes[0][2], 180.0)
+        self.assertEqual(boxes[1][0], -180.0)
+        self.assertEqual(len(geohash.bounding_boxes(0, 0, 50)), 1)
+
+
+class GeoQuerySetTests(TestCase):
+    """within_bbox() et near() sur les plantations."""
+
+    def setUp(self):
+        user = User.objects.create_user('conteur', password='secret')
+        artisan = Artisan.objects.create(user=user, community='Tombouctou')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+        self.bamako = self.plant(12.6392, -8.0029)
+        self.timbuktu = self.plant(16.7666, -3.0026)
+        self.fiji_east = self.plant(-17.0, 179.95)
+        self.fiji_west = self.plant(-17.0, -179.95)
+        self.plant(None, None)  # Sans position : jamais trouvee
+
+    def plant(self, latitude, longitude):
+        return TreePlanting.objects.create(
+            story=self.story, planted_by='Awa', latitude=latitude, longitude=longitude,
+        )
+
+    def ids(self, queryset):
+        return set(queryset.values_list('id', flat=True))
+
+    def test_within_bbox(self):
+        self.assertEqual(self.ids(TreePlanting.objects.within_bbox(-9, 12, -7, 13)), {self.bamako.id})
+        self.assertEqual(
+            self.ids(TreePlanting.objects.within_bbox(-10, 10, 0, 20)), {self.bamako.id, self.timbuktu.id},
+        )
+
+    def test_within_bbox_larger_than_the_earth(self):
+        self.assertEqual(len(self.ids(TreePlanting.objects.within_bbox(-1e9, -1e9, 1e9, 1e9))), 4)
+
+    def test_within_bbox_rejects_non_finite(self):
+        with self.assertRaises(ValueError):
+            TreePlanting.objects.within_bbox(float('nan'), 0, 1, 1)
+
+    def test_near(self):
+        nearby = TreePlanting.objects.near(12.64, -8.0, 10)
+        self.assertEqual(self.ids(nearby), {self.bamako.id})
+        self.assertLess(nearby.get().distance_km, 1)
+        self.assertEqual(len(self.ids(TreePlanting.objects.near(12.64, -8.0, 800))), 2)
+
+    def test_near_crosses_the_antimeridian(self):
+        self.assertEqual(
+            self.ids(TreePlanting.objects.near(-17.0, 179.99, 20)), {self.fiji_east.id, self.fiji_west.id},
+        )
+
+
+class StoryMapClustersAPITests(TestCase):
+    """/api/stories/map/clusters/ : une 400 pour tout bbox invalide, jamais une 500 ni une boucle sans fin."""
+
+    url = '/api/stories/map/clusters/'
+
+    def setUp(self):
+        user = User.objects.create_user('conteur', password='secret')
+        artisan = Artisan.objects.create(user=user, community='Tombouctou')
+        story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+        for latitude, longitude in ((12.6392, -8.0029), (12.6401, -8.0011), (16.7666, -3.0026)):
+            TreePlanting.objects.create(story=story, planted_by='Awa', latitude=latitude, longitude=longitude)
+
+    def test_clusters(self):
+        for zoom in ('2', '15'):  # Grille du monde en cache / calcul direct
+            response = self.client.get(self.url, {'bbox': '-10,10,0,20', 'zoom': zoom})
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(sum(f['properties']['count'] for f in response.json()['features']), 3)
+
+    def test_whole_earth(self):
+        response = self.client.get(self.url, {'bbox': '-180,-90,180,90', 'zoom': '15'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalid_bbox(self):
+        for bbox in (
+            'nan,0,1,1', '0,0,inf,1', '-inf,0,1,1',   # Pas finis
+            '-1e9,-1e9,1e9,1e9', '-181,0,1,1', '0,-91,1,1', '0,0,1,90.5',  # Hors de la Terre
+            '10,0,-10,5', '0,5,1,0',                  # A l'envers
+            '1,2,3', 'a,b,c,d',                       # Illisibles
+        ):
+            response = self.client.get(self.url, {'bbox': bbox, 'zoom': '15'})
+            self.assertEqual(response.status_code, 400, bbox)
+            self.assertIn('bbox', response.json())
+
+    def test_missing_bbox_and_bad_zoom(self):
+        self.assertEqual(self.client.get(self.url).status_code, 400)
+        for zoom in ('-1', '21', 'x'):
+            response = self.client.get(self.url, {'bbox': '-10,10,0,20', 'zoom': zoom})
+            self.assertEqual(response.status_code, 400, zoom)
+            self.assertIn('zoom', response.json())
+
+
+@override_settings(
+    THROTTLE_ENABLED=True,
+    THROTTLE_BUCKETS={
+        'plant_tree': {
+            'ip': {'rate': '1/hour', 'burst': 2},
+            'story': {'rate': '1/hour', 'burst': 1},
+        },
+    },
+    REST_FRAMEWORK={**settings.REST_FRAMEWORK, 'NUM_PROXIES': 1},
+)
+class ThrottlingTests(TestCase):
+    """Les seaux de jetons : accepte, refuse, rend le jeton ; 429 + Retry-After."""
+
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user('conteur', password='secret')
+        artisan = Artisan.objects.create(user=user, community='Tombouctou')
+        self.stories = [
+            Story.objects.create(title=f'Histoire {i}', content='...', artisan=artisan) for i in range(3)
+        ]
+
+    def request(self, forwarded_for='10.0.0.1'):
+        return RequestFactory().post('/', HTTP_X_FORWARDED_FOR=forwarded_for)
+
+    def test_accept_then_reject(self):
+        first, second, third = self.stories
+        self.assertIsNone(throttling.check(self.request(), 'plant_tree', first.id))
+        self.assertIsNone(throttling.check(self.request(), 'plant_tree', second.id))
+        wait = throttling.check(self.request(), 'plant_tree', third.id)  # Seau de l'IP vide
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 3600)
+        self.assertEqual(throttling.stats()['plant_tree']['rejected_ip'], 1)
+        self.assertEqual(throttling.stats()['plant_tree']['allowed'], 2)
+
+    def test_rejected_request_refunds_other_buckets(self):
+        first, second, third = self.stories
+        self.assertIsNone(throttling.check(self.request(), 'plant_tree', first.id))
+        # Refusee par le seau de l'histoire : le jeton de l'IP est rendu
+        self.assertIsNotNone(throttling.check(self.request(), 'plant_tree', first.id))
+        self.assertIsNone(throttling.check(self.request(), 'plant_tree', second.id))
+        self.assertIsNotNone(throttling.check(self.request(), 'plant_tree', third.id))
+        self.assertEqual(throttling.stats()['plant_tree']['rejected_story'], 1)
+
+    def test_forged_forwarded_for_does_not_get_a_new_bucket(self):
+        # Le client invente le debut de l'en-tete ; le proxy ajoute la vraie adresse a la fin
+        for i, story in enumerate(self.stories[:2]):
+            self.assertIsNone(throttling.check(self.request(f'1.2.3.{i}, 10.0.0.1'), 'plant_tree', story.id))
+        self.assertEqual(throttling.client_ip(self.request('9.9.9.9, 10.0.0.1')), '10.0.0.1')
+        self.assertIsNotNone(throttling.check(self.request('9.9.9.9, 10.0.0.1'), 'plant_tree', self.stories[2].id))
+        # Une autre vraie adresse a son propre seau
+        self.assertIsNone(throttling.check(self.request('10.0.0.2'), 'plant_tree', self.stories[2].id))
+
+    def test_plant_tree_answers_429_with_retry_after(self):
+        url = f'/stories/{self.stories[0].id}/plant/'
+        self.assertEqual(self.client.post(url, REMOTE_ADDR='10.0.0.1').status_code, 302)
+        response = self.client.post(url, REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response['Retry-After']), 0)
+        self.assertEqual(TreePlanting.objects.count(), 1)
+
+    @override_settings(THROTTLE_ENABLED=False)
+    def test_disabled(self):
+        for _ in range(5):
+            self.assertIsNone(throttling.check(self.request(), 'plant_tree', self.stories[0].id))
+
+
+class ImpactStatsTests(TestCase):
+    """Les cases de TreePlantingDailyStat suivent chaque changement, et rebuild() donne le meme resultat."""
+
+    def setUp(self):
+        self.kita = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.kayes = Artisan.objects.create(user=User.objects.create_user('moussa'), community='Kayes')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=self.kita)
+
+    def plant(self, n=1, story=None):
+        return [
+            TreePlanting.objects.create(story=story or self.story, planted_by='Awa') for _ in range(n)
+        ]
+
+    def cells(self):
+        return sorted(
+            TreePlantingDailyStat.objects.filter(count__gt=0)
+            .values_list('community', 'artisan_id', 'status', 'count')
+        )
+
+    def assert_matches_rebuild(self):
+        live = self.cells()
+        impact_stats.rebuild()
+        self.assertEqual(live, self.cells())
+
+    def test_create(self):
+        self.plant(3)
+        self.assertEqual(self.cells(), [('Kita', self.kita.id, 'pending', 3)])
+        self.assert_matches_rebuild()
+
+    def test_transition(self):
+        first, second, third = self.plant(3)
+        first.mark_as_planted()
+        treeplanting.bulk_transition(TreePlanting.Status.PLANTED, ids=[second.id])
+        treeplanting.bulk_transition(TreePlanting.Status.VERIFIED, ids=[first.id, second.id])
+        self.assertEqual(self.cells(), [
+            ('Kita', self.kita.id, 'pending', 1),
+            ('Kita', self.kita.id, 'verified', 2),
+        ])
+        self.assert_matches_rebuild()
+
+    def test_delete(self):
+        first, _ = self.plant(2)
+        first.delete()
+        self.assertEqual(self.cells(), [('Kita', self.kita.id, 'pending', 1)])
+        self.assert_matches_rebuild()
+
+    def test_story_moves_to_another_artisan(self):
+        self.plant(3)
+        self.plant(1, Story.objects.create(title='Autre', content='...', artisan=self.kita))
+        story = Story.objects.get(pk=self.story.pk)
+        story.artisan = self.kayes
+        story.save()
+        self.assertEqual(self.cells(), [
+            ('Kayes', self.kayes.id, 'pending', 3),
+            ('Kita', self.kita.id, 'pending', 1),
+        ])
+        self.assert_matches_rebuild()
+        response = APIClient()
+        response.force_authenticate(self.kita.user)
+        rows = response.get('/api/stats/', {'group_by': 'community'}).data['results']
+        self.assertEqual(rows, [{'community': 'Kayes', 'trees': 3}, {'community': 'Kita', 'trees': 1}])
+
+    def test_artisan_changes_community(self):
+        self.plant(2)
+        self.kita.community = 'Bamako'
+        self.kita.save()
+        self.assertEqual(self.cells(), [('Bamako', self.kita.id, 'pending', 2)])
+        self.assert_matches_rebuild()
+
+
+class AudioUploadTests(TestCase):
+    """Envoi par morceaux : offsets, empreintes, reprise, et envois bloques "en cours"."""
+
+    payload = bytes(range(256)) * 40  # 10 240 octets
+
+    def setUp(self):
+        self.upload_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.upload_dir, ignore_errors=True)
+        overrides = override_settings(AUDIO_UPLOADS_ENABLED=True, AUDIO_UPLOAD_DIR=self.upload_dir, THROTTLE_ENABLED=False)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('conteur', password='secret')
+        artisan = Artisan.objects.create(user=self.user, community='Tombouctou')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, **extra):
+        response = self.client.post(
+            f'/api/stories/{self.story.id}/audio-uploads/',
+            {'filename': 'conte.mp3', 'size': len(self.payload), **extra}, format='json',
+        )
+        self.assertEqual(response.status_code, 201, response.content)
+        return response['Location']
+
+    def send(self, url, offset, data, checksum=None):
+        headers = {'HTTP_UPLOAD_OFFSET': str(offset)}
+        if checksum is not None:
+            headers['HTTP_UPLOAD_CHECKSUM'] = f'sha256 {base64.b64encode(checksum).decode()}'
+        return self.client.generic('PATCH', url, data, content_type='application/offset+octet-stream', **headers)
+
+    def test_pieces_in_order(self):
+        url = self.start(sha256=hashlib.sha256(self.payload).hexdigest())
+        response = self.send(url, 0, self.payload[:4096])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Upload-Offset'], '4096')
+        self.assertEqual(response.data['status'], AudioUpload.Status.UPLOADING)
+        response = self.send(url, 4096, self.payload[4096:])
+        self.assertEqual(response.data['status'], AudioUpload.Status.UPLOADED)
+        upload = AudioUpload.objects.get()
+        with open(audio.part_path(upload), 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+
+    def test_wrong_offset_gives_the_right_one(self):
+        url = self.start()
+        self.send(url, 0, self.payload[:1000])
+        response = self.send(url, 500, self.payload[500:1500])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.data['offset'], 1000)
+        self.assertEqual(response['Upload-Offset'], '1000')
+
+    def test_piece_past_the_announced_size(self):
+        url = self.start()
+        response = self.send(url, 0, self.payload + b'x')
+        self.assertEqual(response.status_code, 400)
+
+    def test_piece_checksum_mismatch_keeps_nothing(self):
+        url = self.start()
+        self.send(url, 0, self.payload[:1000])
+        response = self.send(url, 1000, self.payload[1000:2000], checksum=hashlib.sha256(b'autre').digest())
+        self.assertEqual(response.status_code, 400)
+        upload = AudioUpload.objects.get()
+        self.assertEqual(upload.offset, 1000)
+        self.assertEqual(audio.part_path(upload).stat().st_size, 1000)
+        response = self.send(url, 1000, self.payload[1000:2000], checksum=hashlib.sha256(self.payload[1000:2000]).digest())
+        self.assertEqual(response.data['offset'], 2000)
+
+    def test_whole_file_checksum_mismatch_fails(self):
+        url = self.start(sha256=hashlib.sha256(b'autre chose').hexdigest())
+        response = self.send(url, 0, self.payload)
+        self.assertEqual(response.data['status'], AudioUpload.Status.FAILED)
+        self.assertFalse(audio.part_path(AudioUpload.objects.get()).exists())
+
+    def test_resume_after_a_cut_connection(self):
+        url = self.start()
+        upload = AudioUpload.objects.get()
+        # La connexion coupe apres 3000 des 5000 octets annonces : ce qui est arrive est garde
+        audio.receive_chunk(upload, 0, io.BytesIO(self.payload[:3000]), 5000)
+        response = self.client.get(url)
+        self.assertEqual(response['Upload-Offset'], '3000')
+        self.send(url, 3000, self.payload[3000:])
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, AudioUpload.Status.UPLOADED)
+        with open(audio.part_path(upload), 'rb') as f:
+            self.assertEqual(f.read(), self.payload)
+
+    def test_only_the_storyteller(self):
+        other = User.objects.create_user('autre')
+        self.client.force_authenticate(other)
+        response = self.client.post(
+            f'/api/stories/{self.story.id}/audio-uploads/', {'filename': 'a.mp3', 'size': 10}, format='json',
+        )
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(AUDIO_UPLOADS_ENABLED=False)
+    def test_disabled_without_a_transcode_worker(self):
+        response = self.client.post(
+            f'/api/stories/{self.story.id}/audio-uploads/', {'filename': 'a.mp3', 'size': 10}, format='json',
+        )
+        self.assertEqual(response.status_code, 503)
+
+    def test_claim_next_takes_back_abandoned_processing(self):
+        upload = AudioUpload.objects.create(
+            story=self.story, uploaded_by=self.user, filename='a.mp3', size=1, status=AudioUpload.Status.PROCESSING,
+        )
+        self.assertIsNone(audio.claim_next())  # Un worker le transcode peut-etre encore
+        AudioUpload.objects.filter(pk=upload.pk).update(updated_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(audio.claim_next(), upload)
+        self.assertIsNone(audio.claim_next())  # Reserve a nouveau : updated_at est reparti de maintenant
+
+    def test_purge_stale(self):
+        url = self.start()
+        self.send(url, 0, self.payload[:100])
+        upload = AudioUpload.objects.get()
+        AudioUpload.objects.update(updated_at=timezone.now() - timedelta(days=3))
+        self.assertEqual(audio.purge_stale(), 1)
+        self.assertFalse(AudioUpload.objects.exists())
+        self.assertFalse(audio.part_path(upload).exists())
+
+
+@override_settings(TRENDING_SETTLE_SECONDS=0)
+class TrendingTests(TestCase):
+    """compute() ne compte chaque evenement qu'une fois ; top() range par score."""
+
+    def setUp(self):
+        artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.quiet, self.busy = [
+            Story.objects.create(title=title, content='...', artisan=artisan, published_at=timezone.now())
+            for title in ('Calme', 'Populaire')
+        ]
+
+    def score(self, story):
+        return StoryTrendingScore.objects.get(story=story).score
+
+    def activity(self, story, trees=0, comments=0, views=0):
+        for _ in range(trees):
+            TreePlanting.objects.create(story=story, planted_by='Awa')
+        for _ in range(comments):
+            Comment.objects.create(story=story, author_name='Awa', content='Merci')
+        if views:
+            Story.objects.filter(pk=story.pk).update(views=F('views') + views, updated_at=timezone.now())
+
+    def test_incremental_passes_do_not_count_twice(self):
+        self.activity(self.busy, trees=2, comments=1, views=10)
+        self.assertEqual(trending.compute(), 1)
+        first = self.score(self.busy)
+        self.assertEqual(trending.compute(), 0)  # Rien de neuf
+        self.assertEqual(self.score(self.busy), first)
+
+        self.activity(self.busy, trees=1, views=5)
+        trending.compute()
+        incremental = self.score(self.busy)
+        self.assertGreater(incremental, first)
+
+        # Le meme resultat qu'un seul passage sur toute l'activite
+        StoryTrendingScore.objects.all().delete()
+        trending.compute()
+        self.assertAlmostEqual(self.score(self.busy), incremental, places=6)
+
+    @override_settings(TRENDING_SETTLE_SECONDS=5)
+    def test_events_too_recent_wait_for_the_next_pass(self):
+        self.activity(self.busy, trees=1)
+        self.assertEqual(trending.compute(), 0)  # Moins de TRENDING_SETTLE_SECONDS
+        self.assertEqual(trending.compute(timezone.now() + timedelta(seconds=10)), 1)
+
+    @override_settings(TRENDING_WEIGHTS={'trees': 0})
+    def test_zero_weight_turns_a_signal_off(self):
+        self.activity(self.busy, trees=3)
+        self.activity(self.quiet, comments=1)
+        self.assertEqual(trending.compute(), 1)
+        self.assertFalse(StoryTrendingScore.objects.filter(story=self.busy).exists())
+
+    def test_top_orders_by_score(self):
+        self.activity(self.quiet, comments=1)
+        self.activity(self.busy, trees=3, views=20)
+        trending.compute()
+        third = Story.objects.create(title='Sans activite', content='...', artisan=self.busy.artisan)
+        ranked = list(trending.top(Story.objects.all(), 10))
+        self.assertEqual(ranked, [self.busy, self.quiet])
+        self.assertNotIn(third, ranked)
+        self.assertEqual(list(trending.top(Story.objects.all(), 1)), [self.busy])
+
+
+@override_settings(INTEGRATIONS={'google_sheets': {'ENABLED': True, 'BACKEND': 'stories.google_sheets.FakeSheetSink'}})
+class SheetOutboxTests(TestCase):
+    """Un lot est reserve, envoye hors transaction puis marque ; un echec le reprogramme."""
+
+    def setUp(self):
+        artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+
+    def enqueue(self, n):
+        return [
+            sheets_outbox.enqueue(TreePlanting.objects.create(story=self.story, planted_by='Awa'))
+            for _ in range(n)
+        ]
+
+    def test_nothing_is_queued_when_disabled(self):
+        with override_settings(INTEGRATIONS={}):
+            self.assertIsNone(self.enqueue(1)[0])
+        self.assertFalse(SheetOutbox.objects.exists())
+
+    def test_send_batch_sends_then_marks_sent(self):
+        self.enqueue(3)
+        sink = FakeSheetSink()
+        self.assertEqual(sheets_outbox.send_batch(sink, batch_size=2), 2)
+        self.assertEqual(sheets_outbox.send_batch(sink, batch_size=2), 1)
+        self.assertEqual(sheets_outbox.send_batch(sink, batch_size=2), 0)
+        self.assertEqual([row[1] for row in sink.rows], ['Histoire'] * 3)
+        self.assertFalse(SheetOutbox.objects.filter(sent_at__isnull=True).exists())
+
+    def test_rows_are_leased_while_the_sink_is_called(self):
+        self.enqueue(2)
+        seen = []
+
+        class PeekingSink:
+            def append_rows(self, rows):
+                # Un autre worker, pendant l'envoi, ne trouve rien a prendre
+                seen.append(sheets_outbox.claim_batch(10))
+
+        self.assertEqual(sheets_outbox.send_batch(PeekingSink()), 2)
+        self.assertEqual(seen, [[]])
+
+    def test_lease_expires_if_the_worker_dies(self):
+        self.enqueue(1)
+        self.assertEqual(len(sheets_outbox.claim_batch(10)), 1)
+        self.assertEqual(sheets_outbox.claim_batch(10), [])
+        later = timezone.now() + sheets_outbox.lease_duration() + timedelta(seconds=1)
+        self.assertEqual(len(sheets_outbox.claim_batch(10, now=later)), 1)
+
+    def test_failure_reschedules_the_batch(self):
+        item, = self.enqueue(1)
+
+        class BrokenSink:
+            def append_rows(self, rows):
+                raise RuntimeError('quota')
+
+        before = timezone.now()
+        with self.assertRaises(sheets_outbox.SheetSyncError):
+            sheets_outbox.send_batch(BrokenSink())
+        item.refresh_from_db()
+        self.assertIsNone(item.sent_at)
+        self.assertEqual(item.attempts, 1)
+        self.assertEqual(item.last_error, 'quota')
+        self.assertGreaterEqual(item.next_attempt_at, before + sheets_outbox.retry_delay(1))
+
+    def test_fake_sink_rows_are_per_instance(self):
+        FakeSheetSink().append_rows([['a']])
+        self.assertEqual(FakeSheetSink().rows, [])
+
+
+@override_settings(THROTTLE_ENABLED=False, SYNC_SETTLE_SECONDS=0)
+class FieldSyncAPITests(TestCase):
+    """Un lot renvoye ne cree rien deux fois ; le watermark fait defiler les changements."""
+
+    url = '/api/tree-plantings/sync/'
+
+    def setUp(self):
+        self.user = User.objects.create_user('awa')
+        artisan = Artisan.objects.create(user=self.user, community='Kita')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def record(self, **extra):
+        return {
+            'uuid': str(uuid.uuid4()), 'story': self.story.id,
+            'latitude': 12.65, 'longitude': -8.0, 'recorded_at': timezone.now().isoformat(),
+            **extra,
+        }
+
+    def push(self, records, watermark=None):
+        body = {'records': records}
+        if watermark:
+            body['watermark'] = watermark
+        return self.client.post(self.url, body, format='json')
+
+    def test_retry_of_the_same_batch_is_idempotent(self):
+        records = [self.record(), self.record()]
+        first = self.push(records).json()['acks']
+        second = self.push(records).json()['acks']
+        self.assertEqual([ack['result'] for ack in first], ['created', 'created'])
+        self.assertEqual([ack['result'] for ack in second], ['duplicate', 'duplicate'])
+        self.assertEqual([ack['id'] for ack in first], [ack['id'] for ack in second])
+        self.assertEqual(TreePlanting.objects.count(), 2)
+
+    def test_bad_records_are_rejected_one_by_one(self):
+        acks = self.push([
+            self.record(),
+            self.record(story=self.story.id + 100),
+            self.record(latitude=95),
+            {'uuid': 'pas-un-uuid'},
+        ]).json()['acks']
+        self.assertEqual([ack['result'] for ack in acks], ['created', 'rejected', 'rejected', 'rejected'])
+        self.assertIn('latitude', acks[2]['error'])
+        self.assertEqual(TreePlanting.objects.count(), 1)
+
+    def test_duplicate_inside_one_batch(self):
+        record = self.record()
+        acks = self.push([record, record]).json()['acks']
+        self.assertEqual([ack['result'] for ack in acks], ['created', 'duplicate'])
+        self.assertEqual(acks[0]['id'], acks[1]['id'])
+        self.assertEqual(TreePlanting.objects.count(), 1)
+
+    def test_watermark_pages_through_changes(self):
+        records = [self.record() for _ in range(3)]
+        self.push(records)
+        seen = []
+        watermark = None
+        with unittest.mock.patch.object(views_api, 'SYNC_PULL_LIMIT', 2):
+            for _ in range(3):
+                params = {'watermark': watermark} if watermark else {}
+                body = self.client.get(self.url, params).json()
+                seen += [change['uuid'] for change in body['changes']]
+                watermark = body['watermark']
+                if not body['more']:
+                    break
+        self.assertEqual(sorted(seen), sorted(record['uuid'] for record in records))
+
+        # Un changement de statut ressort apres le watermark, une seule fois
+        tree = TreePlanting.objects.get(client_uuid=records[0]['uuid'])
+        treeplanting.bulk_transition(TreePlanting.Status.VERIFIED, ids=[tree.id])
+        body = self.client.get(self.url, {'watermark': watermark}).json()
+        self.assertEqual([change['uuid'] for change in body['changes']], [records[0]['uuid']])
+        self.assertEqual(self.client.get(self.url, {'watermark': body['watermark']}).json()['changes'], [])
+
+    @override_settings(SYNC_SETTLE_SECONDS=60)
+    def test_recent_changes_wait_for_the_settle_window(self):
+        self.push([self.record()])
+        self.assertEqual(self.client.get(self.url).json()['changes'], [])
+
+
+class StoryMapCacheTests(TestCase):
+    """La carte suit chaque changement, et un lecteur en retard ne remet jamais un point perime."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.story = self.new_story('Histoire')
+
+    def new_story(self, title):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Story.objects.create(title=title, content='...', artisan=self.artisan)
+
+    def plant(self, story):
+        with self.captureOnCommitCallbacks(execute=True):
+            TreePlanting.objects.create(story=story, planted_by='Awa', latitude=12.65, longitude=-8.0)
+
+    def tree_counts(self):
+        features = json.loads(story_map.get_map_blob()[1])['features']
+        return {feature['id']: feature['properties']['tree_count'] for feature in features}
+
+    def test_changes_show_up_through_signals(self):
+        self.assertEqual(self.tree_counts(), {})
+        self.plant(self.story)
+        self.assertEqual(self.tree_counts(), {self.story.id: 1})
+        other = self.new_story('Autre')
+        self.plant(other)
+        self.assertEqual(self.tree_counts(), {self.story.id: 1, other.id: 1})
+        other_id = other.id
+        with unittest.mock.patch.object(story_map, 'refresh_story', wraps=story_map.refresh_story) as refresh:
+            with self.captureOnCommitCallbacks(execute=True):
+                other.delete()
+        refresh.assert_any_call(other_id, True)
+        self.assertEqual(self.tree_counts(), {self.story.id: 1})
+
+    def test_a_slow_reader_does_not_cache_a_stale_point(self):
+        self.plant(self.story)
+        story_map.invalidate()
+        build_features = story_map.build_features
+
+        def slow_build(story_ids=None):
+            stale = build_features(story_ids)
+            self.plant(self.story)  # Un autre worker ecrit pendant que ce lecteur calcule
+            return stale
+
+        with unittest.mock.patch.object(story_map, 'build_features', slow_build):
+            self.assertEqual(self.tree_counts(), {self.story.id: 1})
+        self.assertEqual(self.tree_counts(), {self.story.id: 2})
+
+    def test_blob_miss_rebuilds_only_the_changed_story(self):
+        self.plant(self.story)
+        self.new_story('Sans arbre')
+        self.tree_counts()
+        self.plant(self.story)
+        with self.assertNumQueries(1):  # Le point change, pas de relecture de la table Story
+            self.assertEqual(self.tree_counts()[self.story.id], 2)
+        with self.assertNumQueries(0):
+            story_map.get_map_blob()
+
+
+class ViewCounterTests(TestCase):
+    """Les vues passent par le tampon puis arrivent en base, jamais perdues ni comptees deux fois."""
+
+    def setUp(self):
+        artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.first, self.second = [
+            Story.objects.create(title=title, content='...', artisan=artisan) for title in ('Une', 'Deux')
+        ]
+        # Un tampon neuf et pas de thread d'ecriture : on vide a la main
+        for name, value in (('_buffer', view_counter.MemoryViewBuffer()), ('_flusher', False)):
+            patcher = unittest.mock.patch.object(view_counter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def views(self, story):
+        story.refresh_from_db()
+        return story.views
+
+    def test_record_view_is_buffered_until_flush(self):
+        for _ in range(3):
+            view_counter.record_view(self.first.id)
+        view_counter.record_view(self.second.id)
+        self.assertEqual(view_counter.pending_views(self.first.id), 3)
+        self.assertEqual(self.views(self.first), 0)
+
+        before = timezone.now() - timedelta(days=1)
+        Story.objects.filter(pk=self.first.pk).update(updated_at=before)
+        self.assertEqual(view_counter.flush(), 4)
+        self.assertEqual((self.views(self.first), self.views(self.second)), (3, 1))
+        self.assertGreater(self.first.updated_at, before)  # Nouvel ETag
+        self.assertEqual(view_counter.pending_views(self.first.id), 0)
+        self.assertEqual(view_counter.flush(), 0)
+
+    def test_apply_counts_uses_one_update_per_batch(self):
+        with unittest.mock.patch.object(view_counter, 'FLUSH_BATCH_SIZE', 1):
+            with CaptureQueriesContext(connection) as queries:
+                view_counter.apply_counts({self.first.id: 2, self.second.id: 5})
+        updates = [q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 2)
+        self.assertEqual((self.views(self.first), self.views(self.second)), (2, 5))
+
+    def test_failed_flush_keeps_the_views(self):
+        view_counter.record_view(self.first.id)
+        with unittest.mock.patch.object(view_counter, 'apply_counts', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                view_counter.flush()
+        self.assertEqual(view_counter.pending_views(self.first.id), 1)
+        self.assertEqual(view_counter.flush(), 1)
+        self.assertEqual(self.views(self.first), 1)
+
+    def test_cache_buffer_drains_what_it_read(self):
+        buffer = view_counter.CacheViewBuffer()
+        self.addCleanup(cache.clear)
+        buffer.add(self.first.id, 2)
+        buffer.add(self.first.id)
+        self.assertEqual(buffer.pending(self.first.id), 3)
+        self.assertEqual(buffer.drain(), {self.first.id: 3})
+        self.assertEqual(buffer.drain(), {})
+
+    def test_flush_views_refuses_a_per_process_buffer(self):
+        for backend in ('memory', 'cache'):  # Le cache de test est LocMem, pas Redis
+            with self.subTest(backend=backend), self.settings(VIEW_COUNTER_BACKEND=backend):
+                with self.assertRaises(CommandError):
+                    call_command('flush_views', stdout=io.StringIO())
+
+
+class MetricsViewTests(TestCase):
+    """/metrics s'ouvre avec le jeton, quelle que soit l'adresse (derriere un proxy)."""
+
+    def get(self, token=None):
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        return self.client.get('/metrics', REMOTE_ADDR='127.0.0.1', **headers)
+
+    @override_settings(METRICS_TOKEN='')
+    def test_closed_without_a_configured_token(self):
+        self.assertEqual(self.get().status_code, 403)
+        self.assertEqual(self.get('').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token(self):
+        self.assertEqual(self.get().status_code, 403)  # Meme depuis 127.0.0.1
+        self.assertEqual(self.get('autre').status_code, 403)
+        response = self.get('secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'sahel_http_request_duration_seconds', response.content)
+
+
+class StorySearchTests(TestCase):
+    """Le titre compte plus que le texte ; les mots de l'utilisateur ne sont jamais des operateurs."""
+
+    url = '/api/stories/search/'
+
+    def setUp(self):
+        user = User.objects.create_user('awa')
+        self.artisan = Artisan.objects.create(user=user, community='Kita')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        self.in_body = self.publish('Un jour au marche', "Le baobab du village et O'Neil AND (amis).")
+        self.in_title = self.publish('Le baobab', 'Une histoire courte.')
+
+    def publish(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Story.objects.create(
+                title=title, content=content, artisan=self.artisan, published_at=timezone.now(),
+            )
+
+    def ids(self, query):
+        response = self.client.get(self.url, {'q': query})
+        self.assertEqual(response.status_code, 200, query)
+        return [story['id'] for story in response.json()['results']]
+
+    def test_title_ranks_above_body(self):
+        self.assertEqual(self.ids('baobab'), [self.in_title.id, self.in_body.id])
+        self.assertEqual(self.ids('Kita'), [self.in_title.id, self.in_body.id])  # Communaute : l'id departage
+
+    def test_operators_and_punctuation_are_plain_words(self):
+        for query in ('"', '""', '(', ')', 'AND', 'NOT', 'OR baobab', 'baobab*', "o'neil", 'NEAR(a b)', ':', '-'):
+            with self.subTest(query=query):
+                self.ids(query)
+        self.assertEqual(self.ids("o'neil"), [self.in_body.id])
+        self.assertEqual(self.ids('AND'), [self.in_body.id])
+        self.assertEqual(self.ids('(amis)'), [self.in_body.id])
+        self.assertEqual(self.ids('baobab NOT'), [])  # Tous les mots doivent y etre
+
+    def test_empty_query_is_rejected(self):
+        self.assertEqual(self.client.get(self.url, {'q': '  '}).status_code, 400)
+
+    def test_unpublished_stories_are_not_found(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Story.objects.create(title='Baobab secret', content='...', artisan=self.artisan)
+        self.assertEqual(self.ids('secret'), [])
+
+    def test_edit_and_delete_update_the_index(self):
+        self.in_title.title = 'Le karite'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_title.save()
+        self.assertEqual(self.ids('karite'), [self.in_title.id])
+        self.assertEqual(self.ids('baobab'), [self.in_body.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.in_body.delete()
+        self.assertEqual(self.ids('baobab'), [])
+        if connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute(f'SELECT rowid FROM {search.FTS_TABLE}')
+                self.assertEqual([row[0] for row in cursor.fetchall()], [self.in_title.id])
+
+
+class ParseRangeTests(SimpleTestCase):
+    """parse_range : (debut, fin) inclus, jamais plus de max_length octets."""
+
+    def test_ranges(self):
+        cases = [
+            (None, None),
+            ('', None),
+            ('bytes=0-99', (0, 99)),
+            ('bytes=900-', (900, 999)),
+            ('bytes=100-', (100, 199)),         # Ouvert : limite a max_length
+            ('bytes=-50', (950, 999)),
+            ('bytes=-500', (500, 599)),         # Fin de fichier : limite aussi
+            ('bytes=-5000', (0, 99)),
+            ('bytes=990-5000', (990, 999)),
+            ('bytes=0-10,20-30', None),         # Plusieurs intervalles : ignore
+            ('items=0-10', None),
+            ('bytes=-', None),
+        ]
+        for header, expected in cases:
+            with self.subTest(header=header):
+                self.assertEqual(streaming.parse_range(header, 1000, max_length=100), expected)
+        self.assertEqual(streaming.parse_range('bytes=-500', 1000), (500, 999))
+
+    def test_unsatisfiable(self):
+        for header, size in (('bytes=1000-', 1000), ('bytes=5-2', 1000), ('bytes=-0', 1000), ('bytes=-10', 0)):
+            with self.subTest(header=header, size=size), self.assertRaises(ValueError):
+                streaming.parse_range(header, size, max_length=100)
+
+
+@override_settings(AUDIO_STREAM_MAX_RANGE=100, AUDIO_SENDFILE='')
+class StoryAudioStreamingTests(TestCase):
+    """/stories/<id>/audio/ : 200 sans Range, 206 avec, 416 hors du fichier."""
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        overrides = override_settings(MEDIA_ROOT=media)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.data = bytes(range(256)) * 4  # 1024 octets
+        story = Story.objects.create(title='Histoire', content='...', artisan=artisan)
+        story.audio_file.save('conte.ogg', ContentFile(self.data))
+        self.url = f'/stories/{story.id}/audio/'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        return response, b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_no_range_sends_the_whole_file(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+    def test_ranges_are_206_and_capped(self):
+        for header, start, end in (('bytes=10-19', 10, 19), ('bytes=500-', 500, 599), ('bytes=-300', 724, 823)):
+            with self.subTest(header=header):
+                response, body = self.get(HTTP_RANGE=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/1024')
+                self.assertEqual(body, self.data[start:end + 1])
+
+    def test_out_of_file_is_416(self):
+        response, _ = self.get(HTTP_RANGE='bytes=2000-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1024')
+
+    def test_if_range_with_an_old_etag_sends_everything(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"ancien"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+
+class BulkTransitionTests(TestCase):
+    """bulk_transition : un resultat par id, une limite, et les statistiques et updated_at a jour."""
+
+    url = '/api/tree-plantings/transitions/'
+
+    def setUp(self):
+        self.kita = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        self.story = Story.objects.create(title='Histoire', content='...', artisan=self.kita)
+        self.pending, self.planted, self.verified = [
+            TreePlanting.objects.create(story=self.story, planted_by='Awa', status=status)
+            for status in (TreePlanting.Status.PENDING, TreePlanting.Status.PLANTED, TreePlanting.Status.VERIFIED)
+        ]
+        self.yesterday = timezone.now() - timedelta(days=1)
+        TreePlanting.objects.update(updated_at=self.yesterday)
+
+    def outcomes(self, results):
+        return [(r['id'], r['outcome'], r['status']) for r in results]
+
+    def test_one_outcome_per_id_in_order(self):
+        missing = self.verified.id + 100
+        ids = [self.verified.id, self.pending.id, missing, self.planted.id, self.pending.id]
+        results = treeplanting.bulk_transition(TreePlanting.Status.PLANTED, ids=ids)
+        self.assertEqual(self.outcomes(results), [
+            (self.verified.id, 'invalid_transition', 'verified'),
+            (self.pending.id, 'updated', 'planted'),
+            (missing, 'not_found', None),
+            (self.planted.id, 'unchanged', 'planted'),
+        ])
+
+    def test_only_updated_trees_are_touched(self):
+        when = timezone.now() - timedelta(hours=3)
+        treeplanting.bulk_transition(
+            TreePlanting.Status.PLANTED, ids=[self.pending.id, self.planted.id], actually_planted_at=when,
+        )
+        self.pending.refresh_from_db()
+        self.planted.refresh_from_db()
+        self.assertEqual(self.pending.status, 'planted')
+        self.assertEqual(self.pending.actually_planted_at, when)
+        self.assertGreater(self.pending.updated_at, self.yesterday)  # La synchro le verra
+        self.assertEqual(self.planted.updated_at, self.yesterday)
+
+    def test_stats_follow(self):
+        treeplanting.bulk_transition(TreePlanting.Status.FAILED, trees=TreePlanting.objects.all())
+        live = sorted(TreePlantingDailyStat.objects.filter(count__gt=0).values_list('status', 'count'))
+        self.assertEqual(live, [('failed', 3)])
+        impact_stats.rebuild()
+        self.assertEqual(
+            sorted(TreePlantingDailyStat.objects.filter(count__gt=0).values_list('status', 'count')), live,
+        )
+
+    @override_settings(BULK_TRANSITION_MAX=2)
+    def test_limit(self):
+        for kwargs in ({'ids': [self.pending.id, self.planted.id, self.verified.id]},
+                       {'trees': TreePlanting.objects.all()}):
+            with self.subTest(kwargs=list(kwargs)), self.assertRaises(treeplanting.BulkTransitionError):
+                treeplanting.bulk_transition(TreePlanting.Status.FAILED, **kwargs)
+        self.assertFalse(TreePlanting.objects.filter(status='failed').exists())
+
+    def test_pending_is_not_a_target(self):
+        with self.assertRaises(treeplanting.BulkTransitionError):
+            treeplanting.bulk_transition(TreePlanting.Status.PENDING, ids=[self.planted.id])
+
+    def test_api(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user('coordinateur'))
+        body = {'status': 'verified', 'ids': [self.planted.id, self.pending.id]}
+        self.assertEqual(client.post(self.url, body, format='json').status_code, 403)
+
+        client.force_authenticate(User.objects.create_user('admin', is_staff=True))
+        response = client.post(self.url, body, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['updated'], 1)
+        self.assertEqual(
+            [r['outcome'] for r in response.data['results']], ['updated', 'invalid_transition'],
+        )
+        self.planted.refresh_from_db()
+        self.assertGreater(self.planted.updated_at, self.yesterday)
+
+        response = client.post(self.url, {'status': 'failed', 'filter': {'status': 'pending'}}, format='json')
+        self.assertEqual(self.outcomes(response.data['results']), [(self.pending.id, 'updated', 'failed')])
+
+        for bad in ({'status': 'failed'}, {'status': 'failed', 'ids': [1], 'filter': {'status': 'pending'}},
+                    {'status': 'failed', 'filter': {}}, {'status': 'pending', 'ids': [1]}):
+            with self.subTest(body=bad):
+                self.assertEqual(client.post(self.url, bad, format='json').status_code, 400)
+        with self.settings(BULK_TRANSITION_MAX=1):
+            response = client.post(self.url, {'status': 'failed', 'ids': [1, 2]}, format='json')
+            self.assertEqual(response.status_code, 400)
+
+
+class HealthCheckTests(TestCase):
+    """/api/health/ : tout le monde voit `ok`, seuls le staff et le collecteur voient les details."""
+
+    url = '/api/health/'
+
+    def test_anonymous_only_sees_ok(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['database'], {'ok': True})
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_staff_and_scraper_see_details(self):
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.json()['database']['vendor'], connection.vendor)
+
+        self.client.force_login(User.objects.create_user('admin', is_staff=True))
+        database = self.client.get(self.url).json()['database']
+        self.assertIn('reuse', database)
+        self.assertIn('pool', database)
+
+        self.client.force_login(User.objects.create_user('awa'))
+        self.assertEqual(self.client.get(self.url).json()['database'], {'ok': True})
+
+
+class StoryCursorPaginationTests(TestCase):
+    """Les pages par curseur ne perdent ni ne repetent aucune histoire, meme a published_at egal."""
+
+    def setUp(self):
+        user = User.objects.create_user('awa')
+        artisan = Artisan.objects.create(user=user, community='Kita')
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+        same = timezone.now() - timedelta(days=1)
+        moments = [same] * 13 + [same + timedelta(minutes=i) for i in range(1, 8)] + [same - timedelta(minutes=1)] * 4
+        self.stories = [
+            Story.objects.create(title=f'Histoire {i}', content='...', artisan=artisan, published_at=moment)
+            for i, moment in enumerate(moments)
+        ]
+        Story.objects.create(title='Brouillon', content='...', artisan=artisan)  # Jamais dans la liste
+        self.expected = [
+            story.id for story in sorted(self.stories, key=lambda story: (story.published_at, story.id), reverse=True)
+        ]
+
+    def walk(self, url, direction='next'):
+        pages = []
+        while url:
+            body = self.client.get(url).json()
+            pages.append([story['id'] for story in body['results']])
+            url = body[direction]
+        return pages
+
+    def test_forward_pages_cover_every_story_once_in_order(self):
+        pages = self.walk('/api/stories/')
+        self.assertEqual(len(pages), 3)
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_links_walk_back(self):
+        pages = self.walk('/api/stories/')
+        last_url = '/api/stories/'
+        for _ in range(len(pages) - 1):
+            last_url = self.client.get(last_url).json()['next']
+        back = self.walk(last_url, 'previous')
+        self.assertEqual(back, list(reversed(pages)))
+
+    def test_approximate_count(self):
+        body = self.client.get('/api/stories/', {'count': 'approximate'}).json()
+        self.assertEqual(body['count'], len(self.stories))  # Exact hors PostgreSQL
+        self.assertNotIn('count', self.client.get('/api/stories/').json())
+
+
+@override_settings(PAGE_CACHE_TIMEOUT=300)
+class PageCacheTests(TestCase):
+    """Une page deja rendue sort du cache ; les signaux l'oublient quand ses donnees changent."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        for name, value in (('_buffer', view_counter.MemoryViewBuffer()), ('_flusher', False)):
+            patcher = unittest.mock.patch.object(view_counter, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.artisan = Artisan.objects.create(user=User.objects.create_user('awa'), community='Kita')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.story = Story.objects.create(
+                title='Le baobab', content='...', artisan=self.artisan, published_at=timezone.now(),
+            )
+        self.detail = f'/stories/{self.story.id}/'
+
+    def is_cached(self, url):
+        """True si la page sort du cache (aucune requete SQL pour la rendre)."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries) == 0
+
+    def change(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def test_second_request_is_a_hit(self):
+        self.assertFalse(self.is_cached(self.detail))
+        self.assertTrue(self.is_cached(self.detail))
+        stats = page_cache.stats()['story_detail']
+        self.assertEqual((stats['hits'], stats['misses'], stats['hit_ratio']), (1, 1, 0.5))
+
+    def test_login_state_has_its_own_page(self):
+        self.is_cached(self.detail)
+        self.client.force_login(self.artisan.user)
+        self.client.get(self.detail)
+        self.client.get(self.detail)
+        stats = page_cache.stats()['story_detail']
+        self.assertEqual((stats['hits'], stats['misses']), (1, 2))
+
+    def test_story_changes_drop_detail_and_list(self):
+        for url in (self.detail, '/stories/'):
+            self.is_cached(url)
+        self.story.title = 'Le karite'
+        self.change(self.story.save)
+        self.assertFalse(self.is_cached('/stories/'))
+        self.assertIn('Le karite', self.client.get(self.detail).content.decode())
+
+    def test_trees_comments_and_artisan_drop_pages(self):
+        actions = [
+            lambda: TreePlanting.objects.create(story=self.story, planted_by='Awa'),
+            lambda: Comment.objects.create(story=self.story, author_name='Awa', content='Merci'),
+            lambda: self.artisan.save(),
+        ]
+        for action in actions:
+            self.is_cached(self.detail)
+            self.change(action)
+            self.assertFalse(self.is_cached(self.detail))
+
+    def test_bulk_created_trees_drop_the_list(self):
+        self.is_cached('/stories/')
+        trees = TreePlanting.objects.bulk_create([TreePlanting(story=self.story, planted_by='Awa')])
+        treeplanting.tree_plantings_bulk_created.send(sender=TreePlanting, trees=trees)
+        self.assertFalse(self.is_cached('/stories/'))
+
+    def test_deleted_story_page_is_dropped(self):
+        self.is_cached(self.detail)
+        self.change(self.story.delete)
+        self.assertEqual(self.client.get(self.detail).status_code, 404)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_timeout_zero_turns_it_off(self):
+        self.assertFalse(self.is_cached(self.detail))
+        self.assertFalse(self.is_cached(self.detail))
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True, REQUEST_TIMING_SLOW_MS=60000, REQUEST_TIMING_TOP_QUERIES=2)
+class RequestTimingTests(TestCase):
+    """En-tete Server-Timing sur chaque reponse, log "requete lente" au-dela du seuil."""
+
+    def setUp(self):
+        user = User.objects.create_user('awa')
+        artisan = Artisan.objects.create(user=user, community='Kita')
+        for i in range(3):
+            Story.objects.create(title=f'Histoire {i}', content='...', artisan=artisan, published_at=timezone.now())
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def test_server_timing_counts_the_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/stories/')
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn(f'desc="{len(queries)} queries"', timing)
+        for part in ('view;dur=', 'render;dur=', 'total;dur='):
+            self.assertIn(part, timing)
+
+    def test_fast_requests_are_not_logged(self):
+        with self.assertNoLogs('stories.middleware', 'WARNING'):
+            self.client.get('/api/stories/')
+
+    @override_settings(REQUEST_TIMING_SLOW_MS=0)
+    def test_slow_request_log(self):
+        with self.assertLogs('stories.middleware', 'WARNING') as logs:
+            self.client.get('/api/stories/')
+        record = logs.records[0].timing
+        self.assertEqual((record['method'], record['path'], record['status']), ('GET', '/api/stories/', 200))
+        self.assertGreater(record['queries'], 0)
+        self.assertLessEqual(len(record['top_queries']), 2)
+        self.assertEqual(set(record['top_queries'][0]), {'sql', 'count', 'ms'})
+
+    def test_normalize_sql_folds_parameter_lists(self):
+        self.assertEqual(
+            middleware.normalize_sql('SELECT 1 WHERE id IN (%s, %s, %s)'),
+            middleware.normalize_sql('SELECT 1 WHERE id IN (%s, %s)'),
+        )
+        self.assertEqual(
+            middleware.normalize_sql('INSERT INTO t VALUES (%s, %s), (%s, %s), (%s, %s)'),
+            middleware.normalize_sql('INSERT INTO t VALUES (%s, %s), (%s, %s)'),
+        )
+
+    def test_disabled_by_default(self):
+        with self.settings(REQUEST_TIMING_ENABLED=False):
+            client = APIClient()
+            client.force_authenticate(User.objects.get(username='awa'))
+            self.assertNotIn('Server-Timing', client.get('/api/stories/'))
+
+
+class AsyncViewsTests(TestCase):
+    """Les vues async (adrf) sous le client de test ASGI : memes reponses qu'en WSGI."""
+
+    def setUp(self):
+        self.user = User.objects.create_user('awa')
+        artisan = Artisan.objects.create(user=self.user, community='Kita')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.story = Story.objects.create(
+                title='Le baobab', content='...', artisan=artisan, published_at=timezone.now(),
+            )
+        for _ in range(3):
+            TreePlanting.objects.create(story=self.story, planted_by='Awa')
+        with self.settings(TRENDING_SETTLE_SECONDS=0):
+            trending.compute()
+
+    async def test_anonymous_endpoints(self):
+        response = await self.async_client.get('/api/ping/')
+        self.assertEqual(response.json(), {'message': 'pong'})
+        response = await self.async_client.get('/api/health/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['database'], {'ok': True})
+        self.assertEqual((await self.async_client.get('/api/me/')).status_code, 403)
+
+    async def test_authenticated_reads(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/me/')
+        self.assertEqual(response.json()['username'], 'awa')
+
+        response = await self.async_client.get('/api/stories/')
+        self.assertEqual([story['id'] for story in response.json()['results']], [self.story.id])
+
+        url = f'/api/stories/{self.story.id}/'
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json()['title'], 'Le baobab')
+        response = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual((await self.async_client.get('/api/stories/999999/')).status_code, 404)
+
+        response = await self.async_client.get('/api/stories/search/', {'q': 'baobab'})
+        self.assertEqual([story['id'] for story in response.json()['results']], [self.story.id])
+
+        response = await self.async_client.get('/api/stories/trending/')
+        results = response.json()['results']
+        self.assertEqual([story['id'] for story in results], [self.story.id])
+        self.assertGreater(results[0]['trending_score'], 0)
+        self.assertEqual((await self.async_client.get('/api/stories/trending/', {'limit': 0})).status_code, 400)
+
+    async def test_pending_trees_stream_under_asgi(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get('/api/pending-trees/', {'format': 'ndjson'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        body = b''.join([chunk async for chunk in response.streaming_content])
+        lines = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(lines), 3)
+        self.assertEqual({line['story_id'] for line in lines}, {self.story.id})
+
+        response = await self.async_client.get('/api/pending-trees/', {'limit': 2})
+        self.assertEqual(len(response.json()['results']), 2)
+        self.assertIsNotNone(response.json()['next'])
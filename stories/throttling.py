@@ -0,0 +1,200 @@
+# Fichier : stories/throttling.py
+# Limite le nombre d'ecritures par adresse IP, par session et par histoire.
+#
+# Chaque limite est un "seau de jetons" : il contient au plus `burst` jetons,
+# se remplit de `rate` jetons (par exemple "60/hour") et chaque requete en
+# prend un. Le seau est garde dans le cache Django sous forme d'une seule
+# date (l'algorithme GCRA) que l'on avance avec `cache.incr`, qui est
+# atomique dans Redis, memcached et le cache memoire : deux workers ne
+# peuvent pas prendre le meme jeton. Une requete refusee rend son jeton.
+#
+# Tout se decide avec le cache, avant de lire la base : refuser un robot ne
+# coute aucune requete SQL. Le meme code sert a la vue HTML `plant_tree` et a
+# l'API (TokenBucketThrottle). Pour que la limite vaille pour tous les
+# workers, il faut un cache partage (REDIS_URL, voir settings.py) : avec le
+# cache memoire (LocMemCache), chaque worker a ses propres seaux et un
+# client peut faire `burst` requetes de plus par worker. `manage.py check`
+# et le premier appel de chaque processus le signalent alors (warning).
+#
+# Reglages : THROTTLE_BUCKETS (les seaux de chaque "scope"), THROTTLE_ENABLED.
+# Compteurs (acceptees / refusees par seau) : /api/throttle/stats/.
+
+import hashlib
+import logging
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework.throttling import BaseThrottle
+
+KEY_PREFIX = 'throttle'
+STATS_PREFIX = 'throttle:stats'
+KINDS = ('ip', 'session', 'story')
+PERIODS = {'s': 1, 'sec': 1, 'second': 1, 'm': 60, 'min': 60, 'minute': 60,
+           'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+# Les seaux inactifs sont oublies apres ce delai (au moins)
+MIN_TIMEOUT = 3600
+
+logger = logging.getLogger(__name__)
+_warned = False
+
+
+def shared_cache():
+    """False si le cache est propre a chaque processus (les seaux ne seraient pas partages)."""
+    return not isinstance(caches['default'], LocMemCache)
+
+
+def _warn_if_not_shared():
+    global _warned
+    if not _warned:
+        _warned = True
+        if not shared_cache():
+            logger.warning(
+                "Limites d'ecriture avec un cache propre au processus (LocMemCache) : "
+                "chaque worker a ses propres seaux. Reglez REDIS_URL."
+            )
+
+
+def parse_rate(rate):
+    """'60/hour' -> millisecondes entre deux jetons (un entier : incr n'accepte que ca)."""
+    count, _, period = rate.partition('/')
+    return max(1, round(PERIODS[period.strip()] * 1000 / int(count)))
+
+
+def _buckets(scope):
+    return getattr(settings, 'THROTTLE_BUCKETS', {}).get(scope, {})
+
+
+def _hash(value):
+    # Les cles du cache restent courtes et sans caracteres interdits
+    return hashlib.md5(value.encode()).hexdigest()
+
+
+def client_ip(request):
+    """
+    L'adresse du client (X-Forwarded-For selon NUM_PROXIES, comme DRF).
+
+    Seule l'adresse ajoutee par le dernier proxy de confiance compte : ce que
+    le client ecrit lui-meme dans X-Forwarded-For ne change pas son seau.
+    """
+    return BaseThrottle().get_ident(request)
+
+
+def session_ident(request):
+    """
+    Le cookie de session, ou l'en-tete Authorization pour les clients de l'API.
+
+    Lu tel quel, sans charger la session ni l'utilisateur (pas de requete SQL).
+    """
+    value = request.COOKIES.get(settings.SESSION_COOKIE_NAME) or request.META.get('HTTP_AUTHORIZATION')
+    return _hash(value) if value else None
+
+
+def _count(scope, outcome):
+    key = f'{STATS_PREFIX}:{scope}:{outcome}'
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def _refund(key, interval):
+    try:
+        cache.decr(key, interval)
+    except ValueError:
+        pass  # Le seau a deja ete oublie
+
+
+def _take(key, interval, burst, now):
+    """
+    Prend un jeton du seau `key`. Retourne 0 si c'est accepte, sinon le
+    nombre de millisecondes a attendre.
+
+    Le cache garde la date (en ms) a laquelle le seau sera de nouveau plein ;
+    chaque jeton pris la recule de `interval`.
+    """
+    timeout = max(MIN_TIMEOUT, math.ceil(burst * interval / 1000))
+    try:
+        full_at = cache.incr(key, interval)
+    except ValueError:
+        if cache.add(key, now + interval, timeout):
+            return 0
+        full_at = cache.incr(key, interval)
+    if full_at < now + interval:
+        # Le seau etait plein : on repart de maintenant. Deux requetes en meme
+        # temps peuvent ici se rater d'un jeton, jamais en prendre un de trop
+        # a un autre client.
+        cache.set(key, now + interval, timeout)
+        return 0
+    if full_at - now > burst * interval:
+        _refund(key, interval)  # Refusee : la requete rend son jeton
+        return full_at - burst * interval - now
+    return 0
+
+
+def check(request, scope, story_id=None):
+    """
+    Prend un jeton dans chaque seau de `scope` pour cette requete.
+
+    Retourne None si la requete passe, sinon le nombre de secondes a attendre
+    (pour l'en-tete Retry-After). Si un seau refuse, les jetons deja pris dans
+    les autres sont rendus.
+    """
+    buckets = _buckets(scope)
+    if not buckets or not getattr(settings, 'THROTTLE_ENABLED', True):
+        return None
+    _warn_if_not_shared()
+    idents = {
+        'ip': client_ip(request),
+        'session': session_ident(request),
+        'story': str(story_id) if story_id is not None else None,
+    }
+    now = int(time.time() * 1000)
+    taken = []
+    for kind in KINDS:
+        if kind not in buckets or not idents[kind]:
+            continue
+        interval = parse_rate(buckets[kind]['rate'])
+        key = f'{KEY_PREFIX}:{scope}:{kind}:{idents[kind]}'
+        wait = _take(key, interval, buckets[kind]['burst'], now)
+        if wait:
+            for taken_key, taken_interval in taken:
+                _refund(taken_key, taken_interval)
+            _count(scope, f'rejected_{kind}')
+            return max(1, math.ceil(wait / 1000))
+        taken.append((key, interval))
+    _count(scope, 'allowed')
+    return None
+
+
+def stats():
+    """Requetes acceptees et refusees (par seau) pour chaque scope."""
+    scopes = list(getattr(settings, 'THROTTLE_BUCKETS', {}))
+    outcomes = ['allowed'] + [f'rejected_{kind}' for kind in KINDS]
+    values = cache.get_many([f'{STATS_PREFIX}:{scope}:{outcome}' for scope in scopes for outcome in outcomes])
+    return {
+        scope: {outcome: values.get(f'{STATS_PREFIX}:{scope}:{outcome}', 0) for outcome in outcomes}
+        for scope in scopes
+    }
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Les memes seaux pour l'API. Le scope vient de `throttle_scope` sur la vue
+    ("api_write" par defaut) ; l'histoire, de l'argument `id` de l'URL.
+    Les lectures (GET, HEAD, OPTIONS) ne sont pas limitees.
+    """
+    default_scope = 'api_write'
+
+    def allow_request(self, request, view):
+        if request.method in ('GET', 'HEAD', 'OPTIONS'):
+            return True
+        scope = getattr(view, 'throttle_scope', None) or self.default_scope
+        self.retry_after = check(request, scope, view.kwargs.get('id'))
+        return self.retry_after is None
+
+    def wait(self):
+        return self.retry_after
@@ -6,6 +6,8 @@ urlpatterns = [
     path('', views.story_list, name='story_list'),
     path('map/', views.story_map, name='story_map'),
     path('<int:id>/', views.story_detail, name='story_detail'),
+    path('<int:id>/audio/', views.story_audio, name='story_audio'),
+    path('<int:id>/plant/', views.plant_tree, name='plant_tree'),
     path('home/', views.home, name='home'),
 ]
 #AttributeError: module 'stories.views' has no attribute 'story_detail'
\ No newline at end of file
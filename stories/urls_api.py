@@ -3,7 +3,23 @@ from django.urls import path
 from . import views_api
 
 urlpatterns = [
+    path('ping/', views_api.ping, name='ping'),
+    path('health/', views_api.health_check, name='health_check'),
+    path('me/', views_api.current_user, name='current_user'),
     path('pending-trees/', views_api.pending_trees, name='pending_trees'),
+    path('tree-plantings/sync/', views_api.field_sync_view, name='field_sync'),
+    path('tree-plantings/transitions/', views_api.tree_transitions, name='tree_transitions'),
+    path('stats/', views_api.impact_statistics, name='impact_statistics'),
     path('stories/', views_api.StoryListAPI.as_view(), name='story-list-api'),
+    path('stories/search/', views_api.StorySearchAPI.as_view(), name='story-search-api'),
+    path('stories/trending/', views_api.trending_stories, name='trending_stories'),
+    path('stories/map/', views_api.story_map_data, name='story_map_data'),
+    path('stories/map/clusters/', views_api.story_map_clusters, name='story_map_clusters'),
     path('stories/<int:id>/', views_api.StoryDetailAPI.as_view(), name='story-detail-api'),
+    path('page-cache/stats/', views_api.page_cache_stats, name='page_cache_stats'),
+    path('throttle/stats/', views_api.throttle_stats, name='throttle_stats'),
+    path('stories/<int:id>/audio-uploads/', views_api.create_audio_upload, name='create_audio_upload'),
+    path('audio-uploads/<uuid:upload_id>/', views_api.audio_upload, name='audio_upload'),
+    path('events/', views_api.EventListAPI.as_view(), name='event-list-api'),
+    path('events/<int:id>/', views_api.EventDetailAPI.as_view(), name='event-detail-api'),
 ]
@@ -7,48 +7,87 @@ Handles:
 - Tree planting actions
 - Map visualization
 - View tracking
+- Prometheus metrics
 """
 
 from django.shortcuts import get_object_or_404, render, redirect
-from django.http import JsonResponse
-from django.contrib import messages
-from django.utils import timezone
-from django.views.decorators.http import require_http_methods
+from django.http import Http404, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.http import require_http_methods, require_safe
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import F
 
 from .models import Story, TreePlanting
-from .google_sheets import get_google_sheet
 from .services.treeplanting import mark_tree_planted
-import json
+from .services import page_cache, sheets_outbox, view_counter
+from .streaming import serve_file
+from . import metrics as prometheus_metrics, throttling
 
 
 # ==============================
 # Public Story Views
 # ==============================
 
+# The HTML of these pages is kept in the page cache (per language and
+# login state) and dropped by signals when the data behind it changes.
+
 def home(request):
     """Render the home page."""
-    return render(request, 'stories/home.html')
+    return page_cache.cached_page(
+        request, 'home',
+        lambda: render(request, 'stories/home.html'),
+    )
 
 
 def story_list(request):
-    """Display a list of all stories."""
-    stories = Story.objects.all().order_by('-created_at')
-    return render(request, 'stories/story_list.html', {'stories': stories})
+    """Display a list of all stories, newest first."""
+    def render_page():
+        stories = (
+            Story.objects.select_related('artisan__user')
+            .order_by(F('published_at').desc(nulls_last=True), '-id')
+        )
+        return render(request, 'stories/story_list.html', {
+            'stories': stories,
+            'total_trees': TreePlanting.objects.count(),
+        })
+
+    return page_cache.cached_page(request, 'story_list', render_page)
 
 
 def story_detail(request, id):
     """
-    Display a single story and increment its view count.
+    Display a single story and count the view.
+
+    The view is only added to an in-process (or cache) buffer; the batched
+    UPDATE happens later, so a GET never locks the story row. The HTML comes
+    from the page cache when it can, so it doesn't show a live view count.
     """
-    story = get_object_or_404(Story, id=id)
-    
-    # Increment view count
-    story.views += 1
-    story.save(update_fields=['views'])  # Efficient save
+    def render_page():
+        story = get_object_or_404(Story.objects.select_related('artisan__user'), id=id)
+        return render(request, 'stories/story_detail.html', {'story': story})
 
-    return render(request, 'stories/story_detail.html', {'story': story})
+    response = page_cache.cached_page(request, 'story_detail', render_page, part=id)
+    if response.status_code == 200:
+        # Buffered increment, flushed every VIEW_COUNTER_FLUSH_INTERVAL seconds;
+        # cached pages count too
+        view_counter.record_view(id)
+    return response
+
+
+@require_safe
+def story_audio(request, id):
+    """
+    Stream the recording of a story.
+
+    Answers `Range` requests with 206 and small pieces, so seeking doesn't
+    download the whole file and a long listen never holds a worker for long.
+    With AUDIO_SENDFILE set, the front proxy sends the bytes instead.
+    """
+    story = get_object_or_404(Story.objects.only('id', 'audio_file'), id=id)
+    if not story.audio_file:
+        raise Http404("This story has no recording yet.")
+    return serve_file(request, story.audio_file.storage, story.audio_file.name, 'audio/ogg')
 
 
 # ==============================
@@ -60,32 +99,29 @@ def plant_tree(request, id):
     """
     Handle a tree planting action for a given story.
     Accepts POST only.
+
+    Limited per IP, per session and per story (THROTTLE_BUCKETS["plant_tree"]);
+    a rejected request gets a 429 before any database query.
     """
+    retry_after = throttling.check(request, 'plant_tree', story_id=id)
+    if retry_after is not None:
+        response = HttpResponse("Too many trees planted too quickly. Please try again later.", status=429)
+        response['Retry-After'] = retry_after
+        return response
+
     story = get_object_or_404(Story, id=id)
     visitor_name = request.user.username if request.user.is_authenticated else "Guest"
 
-    # Create the tree planting record
-    tree = TreePlanting.objects.create(
-        story=story,
-        planted_by=visitor_name,
-        status=TreePlanting.Status.PENDING,
-    )
-
-    # Try to sync to Google Sheets
-    try:
-        sheet = get_google_sheet()
-        sheet.append_row([
-            tree.id,
-            story.title,
-            visitor_name,
-            tree.status,
-            timezone.now().isoformat(),
-        ])
-    except Exception as e:
-        messages.warning(
-            request,
-            f"Your tree was recorded, but we couldn't sync to our main log: {e}"
+    with transaction.atomic():
+        # Create the tree planting record
+        tree = TreePlanting.objects.create(
+            story=story,
+            planted_by=visitor_name,
+            status=TreePlanting.Status.PENDING,
         )
+        # Queue the Google Sheets row in the same transaction;
+        # `manage.py sync_sheets` sends it later, outside the request
+        sheets_outbox.enqueue(tree)
 
     return redirect('story_detail', id=story.id)
 
@@ -96,38 +132,30 @@ def plant_tree(request, id):
 
 def story_map(request):
     """
-    Display a map with all stories that have tree plantings and valid coordinates.
-    Returns GeoJSON for frontend mapping libraries (e.g., Leaflet).
+    Display a map with all stories that have tree plantings with coordinates.
+
+    The page itself is static: the Leaflet script loads the GeoJSON from
+    `story_map_data`, which serves a precomputed, cached blob with an ETag.
+    """
+    return render(request, 'stories/map.html')
+
+
+# ==============================
+# Monitoring
+# ==============================
+
+@require_safe
+def metrics(request):
+    """
+    Serve the Prometheus metrics (text format), summed over all workers.
+
+    Only with `Authorization: Bearer <METRICS_TOKEN>`: the numbers describe
+    the inside of the service.
     """
-    stories = Story.objects.filter(
-        tree_plantings__isnull=False,
-        latitude__isnull=False,
-        longitude__isnull=False
-    ).distinct()
-
-    stories_geojson = {
-        "type": "FeatureCollection",
-        "features": [
-            {
-                "type": "Feature",
-                "geometry": {
-                    "type": "Point",
-                    "coordinates": [story.longitude, story.latitude]
-                },
-                "properties": {
-                    "title": story.title,
-                    "location": story.location,
-                    "tree_count": story.tree_plantings.count(),
-                    "url": request.build_absolute_uri(story.get_absolute_url())
-                }
-            }
-            for story in stories
-        ]
-    }
-
-    return render(request, 'stories/story_map.html', {
-        'stories_geojson': json.dumps(stories_geojson, indent=2)
-    })
+    if not prometheus_metrics.authorized(request):
+        return HttpResponseForbidden("Metrics are only served to the monitoring host.")
+    content, content_type = prometheus_metrics.render()
+    return HttpResponse(content, content_type=content_type)
 
 
 # ==============================
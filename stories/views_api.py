@@ -1,70 +1,432 @@
 # 📦 Import tools to build APIs
+import base64  # To make opaque page cursors
+import binascii  # Errors raised by bad base64
+import json  # To read and write cursors
+from datetime import datetime, time  # To turn a day into a moment
+
 from rest_framework import generics  # For common API patterns (list, create, detail)
+from adrf import generics as async_generics  # The same patterns, as async views (ASGI)
+from adrf.decorators import api_view as async_api_view  # Simple API functions written with `async def`
+from adrf.mixins import get_data  # Serializer data without blocking the event loop
 from rest_framework.decorators import api_view  # To make simple API functions
+from rest_framework.decorators import authentication_classes, permission_classes  # Per-view access rules
+from rest_framework.decorators import renderer_classes  # Which output formats a view speaks
+from rest_framework.decorators import throttle_classes  # How often a view may be called
+from rest_framework.settings import api_settings  # The project's REST_FRAMEWORK settings
+from rest_framework.utils.urls import replace_query_param  # To build "next page" links
 from rest_framework.response import Response  # To send info back to the user
 from rest_framework.authentication import SessionAuthentication  # Checks if user is logged in
-from rest_framework.permissions import IsAuthenticated  # Only allow logged-in users
-from rest_framework.exceptions import ValidationError  # Shows clear error messages
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated  # Who may call an endpoint
+from rest_framework.exceptions import PermissionDenied, ValidationError  # Shows clear error messages
 
 # 📬 Other Django tools
-from django.http import JsonResponse  # For quick yes/no responses
+from asgiref.sync import sync_to_async  # To run blocking database code from async views
+from django.conf import settings  # To read our project settings
+from django.db.models import Q  # To combine filters with OR
+from django.shortcuts import get_object_or_404  # 404 when the thing doesn't exist
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse  # For quick yes/no responses
+from django.urls import reverse  # To build links from URL names
+from django.utils.dateparse import parse_date, parse_datetime  # To read dates from the query string
+from django.utils.cache import get_conditional_response  # Answers "has it changed?" with 304
 from django.utils import timezone  # To get current time ⏰
 from django.contrib.auth.models import User  # Built-in user system
 
 # 🧱 Our blueprints (models) for data
-from .models import Story, Event, TreePlanting
+from .models import AudioUpload, Story, Event, TreePlanting
 
 # 🔧 Tools that turn models into JSON and back
-from .serializers import StorySerializer, EventSerializer
+from .serializers import StorySerializer, EventSerializer, TreeFilterSerializer, TreeTransitionSerializer
+from .serializers import FieldPlantingSerializer, FieldSyncSerializer
+from .renderers import NDJSONRenderer, ndjson_line
+from .pagination import EventCursorPagination, StoryCursorPagination
+from .conditional import ConditionalGetMixin
+from .streaming import is_asgi
+from .services import audio, db_connections, field_sync, impact_stats, map_clusters, page_cache, story_map, treeplanting, trending
+from .throttling import TokenBucketThrottle
+from . import metrics, search, throttling
 
 
 # ------------------------------------------------------------------------------
 # 🌱 Tree Planting API
 # ------------------------------------------------------------------------------
 
-@api_view(['GET'])
-def pending_trees(request):
+PENDING_TREES_PAGE_SIZE = 100       # Trees per page by default
+PENDING_TREES_MAX_PAGE_SIZE = 1000  # Biggest `?limit=` allowed
+PENDING_TREES_CHUNK_SIZE = 2000     # Rows fetched per round trip when streaming
+
+
+@async_api_view(['GET'])
+@renderer_classes(api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer])
+async def pending_trees(request):
     """
     📋 Show all trees that are promised but not yet planted.
     Like a to-do list of trees waiting to go into the ground 🌳.
+
+    Filters: `?bbox=west,south,east,north`, `?since=` / `?until=` (date or
+    datetime, on the promise date). `?limit=` trees per page (1 to
+    PENDING_TREES_MAX_PAGE_SIZE). Pages follow the `next` link (keyset
+    cursor on promise date + id, so deep pages stay fast). `?format=ndjson`
+    streams every matching tree, one JSON object per line.
+    Async: the rows come from the async ORM, so a big export doesn't hold a worker.
+    """
+    pending = (
+        TreePlanting.objects
+        .filter(status=TreePlanting.Status.PENDING)
+        .order_by('planted_at', 'id')
+        # One joined query: the story title comes with each row (no N+1)
+        .values('id', 'story_id', 'story__title', 'planted_by', 'planted_at')
+    )
+    pending = _filter_pending(request, pending)
+
+    # Every story URL shares the same prefix: build it once
+    stories_url = request.build_absolute_uri(reverse('story_list'))
+
+    def to_json(tree):
+        return {
+            "id": tree['id'],
+            "story_id": tree['story_id'],
+            "story_title": tree['story__title'],
+            "planted_by": tree['planted_by'],
+            "promised_at": tree['planted_at'],
+            "story_url": f"{stories_url}{tree['story_id']}/",
+        }
+
+    if request.accepted_renderer.format == 'ndjson':
+        # Server-side cursor + streaming: memory stays flat whatever the backlog size.
+        # The server reads the stream its own way (async under ASGI, sync under WSGI)
+        if is_asgi(request):
+            rows = pending.aiterator(chunk_size=PENDING_TREES_CHUNK_SIZE)
+            lines = (ndjson_line(to_json(tree)) async for tree in rows)
+        else:
+            rows = pending.iterator(chunk_size=PENDING_TREES_CHUNK_SIZE)
+            lines = (ndjson_line(to_json(tree)) for tree in rows)
+        return StreamingHttpResponse(lines, content_type=NDJSONRenderer.media_type)
+
+    try:
+        limit = int(request.query_params.get('limit', PENDING_TREES_PAGE_SIZE))
+    except ValueError:
+        raise ValidationError({"limit": "Must be an integer."})
+    if not 1 <= limit <= PENDING_TREES_MAX_PAGE_SIZE:
+        raise ValidationError({"limit": f"Choose between 1 and {PENDING_TREES_MAX_PAGE_SIZE}."})
+    page = [tree async for tree in pending[:limit + 1]]  # One extra row tells us if there is a next page
+    has_next = len(page) > limit
+    page = page[:limit]
+
+    next_url = None
+    if has_next:
+        last = page[-1]
+        next_url = replace_query_param(
+            request.build_absolute_uri(), 'cursor', _encode_cursor(last['planted_at'], last['id'])
+        )
+
+    return Response({
+        "next": next_url,
+        "results": [to_json(tree) for tree in page],
+    })
+
+
+def _encode_cursor(moment, tree_id):
+    """Opaque cursor: the (planted_at or updated_at, id) of the last tree already sent."""
+    raw = json.dumps([moment.isoformat(), tree_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def _decode_cursor(cursor, name="cursor"):
+    try:
+        moment, tree_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        moment = parse_datetime(moment)
+        if moment is None:
+            raise ValueError
+        return moment, int(tree_id)
+    except (TypeError, ValueError, binascii.Error):
+        raise ValidationError({name: f"Invalid {name}."})
+
+
+def _parse_moment(value, name, end_of_day=False):
+    """Accept `2025-08-30` or a full ISO datetime."""
+    try:
+        day = parse_date(value)
+        moment = datetime.combine(day, time.max if end_of_day else time.min) if day else parse_datetime(value)
+    except ValueError:
+        moment = None
+    if moment is None:
+        raise ValidationError({name: "Expected a date (YYYY-MM-DD) or an ISO datetime."})
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def _parse_bbox(value):
+    """
+    Read `west,south,east,north` (degrees). Every value must be a finite
+    number, longitudes within [-180, 180], latitudes within [-90, 90], and
+    west <= east, south <= north; otherwise a 400.
     """
-    pending = TreePlanting.objects.filter(status='pending')
+    try:
+        west, south, east, north = [float(v) for v in value.split(',')]
+    except ValueError:
+        raise ValidationError({"bbox": "Expected ?bbox=west,south,east,north."})
+    if not all(-180 <= v <= 180 for v in (west, east)) or not all(-90 <= v <= 90 for v in (south, north)):
+        # Also catches NaN and infinity (every comparison with them is False)
+        raise ValidationError({"bbox": "Longitudes must be within [-180, 180] and latitudes within [-90, 90]."})
+    if west > east or south > north:
+        raise ValidationError({"bbox": "West must be <= east and south <= north."})
+    return west, south, east, north
 
-    data = []
-    for tree in pending:
-        data.append({
-            "id": tree.id,
-            "story_title": tree.story.title,
-            "planted_by": tree.planted_by,
-            "promised_at": tree.planted_at,
-            "story_url": f"https://yourapp.com/stories/{tree.story.id}/"
-        })
 
-    return Response(data)
+def _filter_pending(request, pending):
+    """Apply the bbox / since / until / cursor query parameters."""
+    params = request.query_params
+    if 'bbox' in params:
+        pending = pending.within_bbox(*_parse_bbox(params['bbox']))
+    if 'since' in params:
+        pending = pending.filter(planted_at__gte=_parse_moment(params['since'], 'since'))
+    if 'until' in params:
+        pending = pending.filter(planted_at__lte=_parse_moment(params['until'], 'until', end_of_day=True))
+    if 'cursor' in params:
+        planted_at, tree_id = _decode_cursor(params['cursor'])
+        pending = pending.filter(
+            Q(planted_at__gt=planted_at) | Q(planted_at=planted_at, id__gt=tree_id)
+        )
+    return pending
 
 
 # ------------------------------------------------------------------------------
-# 🔧 Health & Utility Endpoints
+# 🗺️ Story Map API
+# ------------------------------------------------------------------------------
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def story_map_data(request):
+    """
+    🗺️ GeoJSON of every story with placed trees, for the Leaflet map.
+    The body is prebuilt and cached; send `If-None-Match` to get a 304
+    when nothing changed since your last download.
+    """
+    etag, blob = story_map.get_map_blob()
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = HttpResponse(blob, content_type='application/geo+json')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'  # Always revalidate, but reuse the body on 304
+    return response
+
+
+@api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+def story_map_clusters(request):
+    """
+    🫧 Grouped markers for the part of the map on screen.
+    Query: `?bbox=west,south,east,north&zoom=6` (same order as Leaflet's
+    `getBounds().toBBoxString()`). Each cluster has a position and a tree count.
+    """
+    if 'bbox' not in request.query_params:
+        raise ValidationError({"bbox": "Expected ?bbox=west,south,east,north&zoom=<int>."})
+    bbox = _parse_bbox(request.query_params['bbox'])
+    try:
+        zoom = int(request.query_params.get('zoom', 0))
+    except ValueError:
+        raise ValidationError({"zoom": "Must be an integer."})
+    if not (0 <= zoom <= map_clusters.MAX_ZOOM):
+        raise ValidationError({"zoom": f"Zoom must be between 0 and {map_clusters.MAX_ZOOM}."})
+
+    clusters = map_clusters.get_clusters(bbox, zoom)
+    return Response({
+        "type": "FeatureCollection",
+        "zoom": zoom,
+        "features": [
+            {
+                "type": "Feature",
+                "geometry": {"type": "Point", "coordinates": [c["longitude"], c["latitude"]]},
+                "properties": {"count": c["count"], "story_id": c["story_id"]},
+            }
+            for c in clusters
+        ],
+    })
+
+
+# ------------------------------------------------------------------------------
+# 🌱 Tree Planting API Views
+# ------------------------------------------------------------------------------
+
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def tree_transitions(request):
+    """
+    🌱 Change the status of many trees at once (for field coordinators).
+    Like ticking a whole column of boxes instead of one box per visit ✅.
+    Body: `status` + `ids` (or a `filter`), and `actually_planted_at` if you know it.
+    Every tree gets its own outcome: updated, unchanged, invalid_transition, not_found.
+    """
+    serializer = TreeTransitionSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+    try:
+        results = treeplanting.bulk_transition(
+            data['status'],
+            ids=data.get('ids'),
+            trees=TreeFilterSerializer.to_queryset(data['filter']) if 'filter' in data else None,
+            actually_planted_at=data.get('actually_planted_at'),
+        )
+    except treeplanting.BulkTransitionError as exc:
+        raise ValidationError({"detail": str(exc)})
+    return Response({
+        "status": data['status'],
+        "updated": sum(1 for r in results if r['outcome'] == 'updated'),
+        "results": results,
+    })
+
+
+SYNC_PULL_LIMIT = 500  # Status changes sent per sync round trip
+
+
+def _sync_changes(request, watermark):
+    """The status changes a device hasn't seen yet, plus its new watermark."""
+    changes, watermark, more = field_sync.pull(
+        request.user.username,
+        _decode_cursor(watermark, 'watermark') if watermark else None,
+        SYNC_PULL_LIMIT,
+    )
+    return {
+        "changes": [
+            {
+                "uuid": str(tree['client_uuid']),
+                "id": tree['id'],
+                "status": tree['status'],
+                "actually_planted_at": tree['actually_planted_at'],
+                "updated_at": tree['updated_at'],
+            }
+            for tree in changes
+        ],
+        "watermark": _encode_cursor(*watermark),
+        "more": more,  # True: call GET again with the new watermark
+    }
+
+
+@api_view(['GET', 'POST'])
+@throttle_classes([TokenBucketThrottle])
+def field_sync_view(request):
+    """
+    📲 Sync a field device that planted trees without network.
+    Like emptying your backpack of notes when you get back to the village 🎒.
+
+    - POST `{"records": [{uuid, story, latitude, longitude, recorded_at}, ...], "watermark": ...}`:
+      saves new plantings (sending the same uuid again does nothing) and answers
+      one `acks` entry per record, plus the changes since `watermark`.
+    - GET `?watermark=`: only the status changes since the last sync.
+    """
+    if request.method == 'GET':
+        return Response(_sync_changes(request, request.query_params.get('watermark')))
+
+    batch = FieldSyncSerializer(data=request.data)
+    batch.is_valid(raise_exception=True)
+
+    acks = {}
+    valid = []
+    for index, raw in enumerate(batch.validated_data['records']):
+        record = FieldPlantingSerializer(data=raw)
+        if record.is_valid():
+            valid.append(record.validated_data)
+        else:
+            # One bad record doesn't block the others
+            acks[index] = {"uuid": raw.get('uuid'), "id": None, "result": "rejected", "error": record.errors}
+    saved = iter(field_sync.push(valid, request.user.username) if valid else [])
+    results = [acks[i] if i in acks else next(saved) for i in range(len(batch.validated_data['records']))]
+
+    return Response({
+        "acks": results,
+        **_sync_changes(request, batch.validated_data.get('watermark')),
+    })
+
+
+# ------------------------------------------------------------------------------
+# 📊 Impact Statistics
 # ------------------------------------------------------------------------------
 
 @api_view(['GET'])
-def ping(request):
+def impact_statistics(request):
+    """
+    📊 How many trees, grouped the way a dashboard needs.
+    Like reading the scoreboard instead of counting every player 🏆.
+
+    `?group_by=date,community,artisan,status` (any of them, comma separated),
+    filters `?since=` / `?until=` (dates), `?community=`, `?artisan=`, `?status=`.
+    Reads the small rollup table only, so it stays fast however many trees exist.
+    """
+    params = request.query_params
+    group_by = [name for name in params.get('group_by', '').split(',') if name]
+    unknown = set(group_by) - set(impact_stats.GROUPABLE)
+    if unknown:
+        raise ValidationError({"group_by": f"Choose among {', '.join(impact_stats.GROUPABLE)}."})
+    if 'status' in params and params['status'] not in TreePlanting.Status.values:
+        raise ValidationError({"status": f"Choose among {', '.join(TreePlanting.Status.values)}."})
+    try:
+        artisan = int(params['artisan']) if 'artisan' in params else None
+    except ValueError:
+        raise ValidationError({"artisan": "Must be an integer."})
+
+    rows = impact_stats.summary(
+        group_by,
+        since=_parse_moment(params['since'], 'since').date() if 'since' in params else None,
+        until=_parse_moment(params['until'], 'until').date() if 'until' in params else None,
+        community=params.get('community'),
+        artisan=artisan,
+        status=params.get('status'),
+    )
+    return Response({"group_by": group_by, "results": rows})
+
+
+# ------------------------------------------------------------------------------
+# 🔧 Health & Utility Endpoints
+# ------------------------------------------------------------------------------
+
+@async_api_view(['GET'])
+@authentication_classes([])
+@permission_classes([AllowAny])
+async def ping(request):
     """Test if server is awake. Like saying ‘ping’ and hearing ‘pong’ 🏓."""
     return JsonResponse({"message": "pong"})
 
 
-@api_view(['GET'])
-def health_check(request):
-    """Check if API is healthy. Like asking a robot, ‘How are you?’ 🤖."""
+@async_api_view(['GET'])
+@permission_classes([AllowAny])
+async def health_check(request):
+    """Check if API is healthy. Like asking a robot, ‘How are you?’ 🤖.
+    Answers 503 when the database does not reply. Staff (or the metrics
+    scraper, with its bearer token) also see how the database connections
+    are reused, pool stats included; everybody else only sees `ok`."""
+    database = await sync_to_async(db_connections.status)()
+    if not (request.user.is_staff or metrics.authorized(request)):
+        database = {"ok": database["ok"]}  # The inside of the service stays private
     return JsonResponse({
-        "status": "ok",
+        "status": "ok" if database["ok"] else "degraded",
         "timestamp": timezone.now().isoformat(),
-        "service": "Sahel Stories API"
-    })
+        "service": "Sahel Stories API",
+        "database": database,
+    }, status=200 if database["ok"] else 503)
+
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def page_cache_stats(request):
+    """📈 How often the story pages came from the cache. Like counting how many
+    times the photocopy was enough instead of rewriting the page 📄."""
+    return Response(page_cache.stats())
 
 
 @api_view(['GET'])
-def current_user(request):
+@permission_classes([IsAdminUser])
+def throttle_stats(request):
+    """🚦 How many writes passed and how many were turned away, per bucket.
+    Like the doorman's tally of who came in and who had to wait 🧮."""
+    return Response(throttling.stats())
+
+
+@async_api_view(['GET'])
+async def current_user(request):
     """
     Show who is logged in right now 👤.
     If nobody is logged in, say “Not authenticated.”
@@ -85,19 +447,74 @@ def current_user(request):
 # ------------------------------------------------------------------------------
 # 📚 Story API Views
 # ------------------------------------------------------------------------------
+# The read views are async (adrf): under ASGI, a slow client or a slow query
+# waits on the event loop instead of holding a whole worker.
 
-class StoryListAPI(generics.ListAPIView):
-    """📖 Show all published stories. Like a bookshelf of finished books 📚."""
-    queryset = Story.objects.filter(published_at__isnull=False)
+class StoryListAPI(ConditionalGetMixin, async_generics.ListAPIView):
+    """📖 Show all published stories. Like a bookshelf of finished books 📚.
+    Answers `If-None-Match` / `If-Modified-Since` with 304 when no story changed."""
+    # for_api(): artisan + user + counts fetched up front, so the page size
+    # doesn't change the number of queries
+    queryset = Story.objects.filter(published_at__isnull=False).for_api()
     serializer_class = StorySerializer
+    # Cursor pages on (published_at, id): no COUNT(*), no OFFSET scan
+    pagination_class = StoryCursorPagination
 
+    def get_version_queryset(self):
+        return Story.objects.filter(published_at__isnull=False)
 
-class StoryDetailAPI(generics.RetrieveAPIView):
-    """🔍 Show details of one story. Like pulling one book off the shelf."""
-    queryset = Story.objects.filter(published_at__isnull=False)
+
+class StoryDetailAPI(ConditionalGetMixin, async_generics.RetrieveAPIView):
+    """🔍 Show details of one story. Like pulling one book off the shelf.
+    Answers `If-None-Match` / `If-Modified-Since` with 304 when it didn't change."""
+    queryset = Story.objects.filter(published_at__isnull=False).for_api()
     serializer_class = StorySerializer
     lookup_field = "id"  # find by story ID
 
+    def get_version_queryset(self):
+        return Story.objects.filter(published_at__isnull=False)
+
+
+class StorySearchAPI(async_generics.ListAPIView):
+    """🔎 Find published stories by words, best matches first. Like asking the
+    librarian instead of reading every spine 📚. Uses `?q=` (title, community, text)."""
+    serializer_class = StorySerializer
+    # Ranked results: plain numbered pages (the default), not cursor pages
+
+    def get_queryset(self):
+        query = self.request.query_params.get('q', '').strip()
+        if not query:
+            raise ValidationError({'q': "Give some words to search for."})
+        stories = Story.objects.filter(published_at__isnull=False).for_api()
+        return search.search(stories, query)
+
+
+@async_api_view(['GET'])
+async def trending_stories(request):
+    """
+    🔥 The stories people care about right now.
+    Like the books everyone is passing around this week 📚.
+
+    Reads the scores `manage.py compute_trending` keeps up to date (recent
+    views, trees and comments, older ones counting less), so no counting
+    happens here. `?limit=` (default TRENDING_DEFAULT_LIMIT, at most TRENDING_MAX_LIMIT).
+    """
+    maximum = getattr(settings, 'TRENDING_MAX_LIMIT', 50)
+    try:
+        limit = int(request.query_params.get('limit', getattr(settings, 'TRENDING_DEFAULT_LIMIT', 10)))
+    except ValueError:
+        raise ValidationError({"limit": "Must be an integer."})
+    if not 1 <= limit <= maximum:
+        raise ValidationError({"limit": f"Choose between 1 and {maximum}."})
+
+    ranked = trending.top(Story.objects.filter(published_at__isnull=False).for_api(), limit)
+    stories = [story async for story in ranked]
+    results = await get_data(StorySerializer(stories, many=True, context={"request": request}))
+    now = timezone.now()
+    for item, story in zip(results, stories):
+        item["trending_score"] = round(trending.current_score(story.trending.score, now), 3)
+    return Response({"results": results})
+
 
 class StoryCreateAPI(generics.CreateAPIView):
     """✍️ Let a logged-in artisan write a new story (like giving them a notebook)."""
@@ -105,6 +522,7 @@ class StoryCreateAPI(generics.CreateAPIView):
     serializer_class = StorySerializer
     authentication_classes = [SessionAuthentication]
     permission_classes = [IsAuthenticated]
+    throttle_classes = [TokenBucketThrottle]  # Same buckets as the HTML forms
 
     def perform_create(self, serializer):
         try:
@@ -116,21 +534,145 @@ class StoryCreateAPI(generics.CreateAPIView):
             )
 
 
+# ------------------------------------------------------------------------------
+# 🎙️ Audio Upload API Views (resumable, in small pieces)
+# ------------------------------------------------------------------------------
+
+def _upload_state(upload):
+    """What the client needs to know to continue an upload."""
+    return {
+        "id": str(upload.id),
+        "story": upload.story_id,
+        "filename": upload.filename,
+        "size": upload.size,
+        "offset": upload.offset,
+        "status": upload.status,
+        "error": upload.error,
+        "url": reverse('audio_upload', kwargs={'upload_id': upload.id}),
+    }
+
+
+def _upload_headers(upload):
+    # Same headers as the tus protocol, so generic resumable clients understand them
+    return {
+        "Upload-Offset": str(upload.offset),
+        "Upload-Length": str(upload.size),
+        "Cache-Control": "no-store",
+    }
+
+
+@api_view(['POST'])
+@throttle_classes([TokenBucketThrottle])
+def create_audio_upload(request, id):
+    """
+    🎙️ Start sending the recording of a story, piece by piece.
+    Like opening a new notebook page before copying a long song 📓.
+    Body: `filename`, `size` (bytes) and, if possible, `sha256` of the whole file.
+    503 where no transcode worker runs (AUDIO_UPLOADS_ENABLED, development only for now).
+    """
+    if not audio.enabled():
+        return Response({"detail": "Audio uploads are not available on this server."}, status=503)
+    story = get_object_or_404(Story, id=id)
+    if not (request.user.is_staff or story.artisan.user_id == request.user.id):
+        raise PermissionDenied("Only the storyteller can add audio to this story.")
+
+    filename = str(request.data.get('filename', '')).strip()
+    sha256 = str(request.data.get('sha256', '')).strip().lower()
+    try:
+        size = int(request.data.get('size'))
+    except (TypeError, ValueError):
+        raise ValidationError({"size": "Give the file size in bytes."})
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        raise ValidationError({"sha256": "Give the SHA-256 of the file as 64 hex characters."})
+    try:
+        audio.validate_new_upload(filename, size)
+    except audio.AudioUploadError as exc:
+        raise ValidationError({"detail": str(exc)})
+
+    upload = AudioUpload.objects.create(
+        story=story, uploaded_by=request.user, filename=filename[:255], size=size, sha256=sha256,
+    )
+    headers = _upload_headers(upload)
+    headers["Location"] = reverse('audio_upload', kwargs={'upload_id': upload.id})
+    return Response(_upload_state(upload), status=201, headers=headers)
+
+
+@api_view(['GET', 'PATCH', 'DELETE'])
+def audio_upload(request, upload_id):
+    """
+    📦 Follow or continue an audio upload.
+    - GET (or HEAD): how many bytes arrived (`Upload-Offset`), so a cut connection can resume.
+    - PATCH: the next piece as the raw body, with `Upload-Offset` = where it starts
+      and optionally `Upload-Checksum: sha256 <base64>`.
+    - DELETE: give up and throw the pieces away 🗑️.
+    """
+    upload = get_object_or_404(AudioUpload, id=upload_id, uploaded_by=request.user)
+
+    if request.method == 'DELETE':
+        audio.discard(upload)
+        upload.delete()
+        return Response(status=204)
+
+    if request.method == 'PATCH':
+        try:
+            client_offset = int(request.headers['Upload-Offset'])
+            length = int(request.META.get('CONTENT_LENGTH') or 0)
+        except (KeyError, ValueError):
+            raise ValidationError({"detail": "Send the Upload-Offset and Content-Length headers."})
+        if length <= 0:
+            raise ValidationError({"detail": "The piece is empty."})
+        if length > audio.max_chunk_size():
+            return Response(
+                {"detail": f"Pieces are limited to {audio.max_chunk_size()} bytes."}, status=413,
+            )
+        try:
+            checksum = audio.parse_checksum(request.headers.get('Upload-Checksum'))
+            # request.stream is read block by block: the piece is never fully in memory
+            upload = audio.receive_chunk(upload, client_offset, request.stream, length, checksum)
+        except audio.OffsetMismatch as exc:
+            return Response({"detail": str(exc), "offset": exc.offset}, status=409,
+                            headers=_upload_headers(upload))
+        except audio.UploadBusy as exc:
+            return Response({"detail": str(exc)}, status=409, headers=_upload_headers(upload))
+        except audio.AudioUploadError as exc:
+            raise ValidationError({"detail": str(exc)})
+
+    return Response(_upload_state(upload), headers=_upload_headers(upload))
+
+
 # ------------------------------------------------------------------------------
 # 📅 Event API Views
 # ------------------------------------------------------------------------------
 
-class EventListAPI(generics.ListAPIView):
+class EventListAPI(ConditionalGetMixin, generics.ListAPIView):
     """🗓️ Show all upcoming events. Like a calendar of fun stuff 🎉."""
-    queryset = Event.objects.filter(date_time__gte=timezone.now()).order_by("date_time")
     serializer_class = EventSerializer
+    pagination_class = EventCursorPagination  # Cursor pages on (date_time, id)
+    vary_on_user = True  # "is_registered" depends on who asks
+
+    def get_queryset(self):
+        # "Upcoming" is computed per request; attendee count and the
+        # caller's registration come as annotations (no query per event)
+        return (
+            Event.objects.filter(date_time__gte=timezone.now())
+            .with_attendance(self.request.user)
+        )
 
+    def get_version_queryset(self):
+        return Event.objects.filter(date_time__gte=timezone.now())
 
-class EventDetailAPI(generics.RetrieveAPIView):
+
+class EventDetailAPI(ConditionalGetMixin, generics.RetrieveAPIView):
     """📨 Show details for one event. Like reading the invite to a party 🎈."""
-    queryset = Event.objects.all()
     serializer_class = EventSerializer
     lookup_field = "id"
+    vary_on_user = True
+
+    def get_queryset(self):
+        return Event.objects.with_attendance(self.request.user)
+
+    def get_version_queryset(self):
+        return Event.objects.all()
 
 
 # ------------------------------------------------------------------------------